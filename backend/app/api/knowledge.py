@@ -1,18 +1,43 @@
 """
 知识库API路由 - 处理文档上传、管理相关的请求
 """
+import asyncio
 import os
-from typing import List
-from fastapi import APIRouter, HTTPException, UploadFile, File
+import zipfile
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Query, Response
 
+from backend.app.core.config import settings
 from backend.app.core.logger import log_lyl
 from backend.app.models.schemas import (
+    BatchSearchRequest_lyl,
     Document_lyl,
     DocumentList_lyl,
+    RebuildRequest_lyl,
+    SearchFilter_lyl,
     SuccessResponse_lyl,
 )
-from backend.app.services.document_service import document_service
-from backend.app.services.vector_store_service import vector_store_service
+from backend.app.services.bulk_ingest_service import (
+    ArchiveTooLargeError_lyl,
+    bulk_ingest_service,
+    check_archive_limits_lyl,
+)
+from backend.app.services.document_service import UploadTooLargeError_lyl, document_service
+from backend.app.services.embedding_service import embedding_service
+from backend.app.services.ingestion_service import (
+    JOB_COMPLETED_LYL,
+    JOB_FAILED_LYL,
+    JOB_QUEUED_LYL,
+    OUTCOME_UPDATED_LYL,
+    DocumentBusyError_lyl,
+    ingestion_service,
+)
+from backend.app.services.vector_store_service import (
+    SEARCH_MODE_VECTOR_LYL,
+    SEARCH_MODES_LYL,
+    vector_store_service,
+)
 
 router = APIRouter(prefix="/knowledge", tags=["知识库"])
 
@@ -26,12 +51,24 @@ def validate_file_extension_lyl(filename: str) -> bool:
     return ext in ALLOWED_EXTENSIONS
 
 
-@router.post("/upload")
-async def upload_document_lyl(file: UploadFile = File(...)):
+@router.post("/upload", status_code=202)
+async def upload_document_lyl(
+    response: Response,
+    file: UploadFile = File(...),
+    replace_document_id: Optional[int] = Form(None, description="要更新的文档ID，不传时作为新文档入库"),
+    wait: bool = Query(True, description="是否等待入库完成后再返回"),
+):
     """
     上传文档到知识库_lyl
 
     支持的文件类型: txt, pdf, docx, doc, md
+    文件保存后登记入库任务，解析、嵌入与索引由后台工作协程进行。
+    wait=true（默认）时等待任务结束，成功返回200及文档ID与分块数，与同步上传时的响应一致；
+    wait=false 时立即返回202及任务ID，进度通过 GET /knowledge/jobs/{job_id} 查询，
+    大文件应使用该方式以免请求超时。
+    内容与已有文档完全相同时不创建任务，直接返回已有文档ID（duplicate=true）；
+    指定 replace_document_id 时作为该文档的修订版增量更新（文件类型须相同），
+    未指定时即使与已有文档同名也作为新文档入库。
     """
     log_lyl.info(f"收到文件上传请求: {file.filename}")
     try:
@@ -43,42 +80,82 @@ async def upload_document_lyl(file: UploadFile = File(...)):
                 detail=f"不支持的文件类型。支持的类型: {', '.join(ALLOWED_EXTENSIONS)}"
             )
 
-        # 读取文件内容
-        content = await file.read()
-        file_size = len(content)
-        log_lyl.debug(f"文件大小: {file_size} bytes")
-
-        # 保存文件
-        file_path = await document_service.save_uploaded_file_lyl(file.filename, content)
-        log_lyl.debug(f"文件已保存: {file_path}")
-
-        # 获取文件类型
-        file_ext = os.path.splitext(file.filename)[1].lower()
-
-        # 加载并分割文档
-        chunks = await document_service.load_and_split_document_lyl(file_path)
-        log_lyl.info(f"文档分割完成，共 {len(chunks)} 个块")
-
-        # 添加到向量存储
-        await vector_store_service.add_documents_lyl(chunks)
-        log_lyl.info("文档已添加到向量存储")
-
-        # 保存文档记录到数据库
-        doc_id = await document_service.add_document_record_lyl(
-            filename=file.filename,
-            file_type=file_ext,
-            file_path=file_path,
-            file_size=file_size,
-            chunk_count=len(chunks)
+        # 已知大小时提前拒绝超限文件
+        limit = settings.MAX_UPLOAD_SIZE_MB * 1024 * 1024
+        if file.size is not None and file.size > limit:
+            raise HTTPException(
+                status_code=413,
+                detail=f"文件超过大小限制 {settings.MAX_UPLOAD_SIZE_MB} MB"
+            )
+
+        # 显式指定的修订目标须存在且文件类型相同
+        if replace_document_id is not None:
+            target = await document_service.get_document_by_id_lyl(replace_document_id)
+            if target is None:
+                raise HTTPException(status_code=404, detail="要更新的文档不存在")
+            if target["file_type"] != os.path.splitext(file.filename)[1].lower():
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"修订版的文件类型须与原文档相同（{target['file_type']}）"
+                )
+
+        # 按块流式保存文件，同时计算大小与哈希
+        try:
+            file_path, file_size, content_hash = await document_service.save_upload_stream_lyl(
+                file.filename, file
+            )
+        except UploadTooLargeError_lyl as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        log_lyl.debug(f"文件已保存: {file_path}, 大小: {file_size} bytes")
+
+        # 内容完全相同的文档已存在时不重复入库
+        duplicate = await document_service.find_document_by_hash_lyl(content_hash)
+        if duplicate is not None:
+            await document_service.delete_file_lyl(file_path)
+            log_lyl.info(f"文档内容与已有文档 {duplicate['id']} 相同，跳过: {file.filename}")
+            response.status_code = 200
+            return {
+                "success": True,
+                "message": "文档已存在，未重复入库",
+                "duplicate": True,
+                "document_id": duplicate["id"],
+                "filename": file.filename
+            }
+
+        # 登记入库任务，由后台工作协程处理
+        job_id = await ingestion_service.enqueue_lyl(
+            file.filename, file_path, file_size, content_hash,
+            target_document_id=replace_document_id
         )
+        log_lyl.info(f"入库任务已创建: {file.filename}, 任务ID: {job_id}")
+        if not wait:
+            return {
+                "success": True,
+                "message": "文档已上传，正在后台处理",
+                "duplicate": False,
+                "job_id": job_id,
+                "filename": file.filename,
+                "status": JOB_QUEUED_LYL
+            }
 
-        log_lyl.success(f"文档上传成功: {file.filename}, ID: {doc_id}")
+        job = await ingestion_service.wait_job_lyl(job_id)
+        if job["status"] == JOB_FAILED_LYL:
+            raise HTTPException(status_code=500, detail=f"上传失败: {job['error']}")
+        if job["status"] != JOB_COMPLETED_LYL:
+            raise HTTPException(
+                status_code=503,
+                detail=f"服务正在关闭，入库任务 {job_id} 将在重启后继续"
+            )
+        response.status_code = 200
         return {
             "success": True,
-            "message": "文档上传成功",
-            "document_id": doc_id,
+            "message": "文档已更新" if job["outcome"] == OUTCOME_UPDATED_LYL else "文档上传成功",
+            "duplicate": False,
+            "job_id": job_id,
+            "document_id": job["document_id"],
             "filename": file.filename,
-            "chunk_count": len(chunks)
+            "outcome": job["outcome"],
+            "chunk_count": job["chunk_count"]
         }
 
     except HTTPException:
@@ -88,6 +165,85 @@ async def upload_document_lyl(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
 
 
+@router.post("/upload/archive", status_code=202)
+async def upload_archive_lyl(
+    file: UploadFile = File(...),
+    revise_existing: bool = Form(False, description="与已有文档同名的文件是否作为其修订版"),
+):
+    """
+    上传zip压缩包批量入库_lyl
+
+    压缩包保存后立即返回批次ID，其中的文档在后台逐个解压、并行解析、合并批次嵌入，
+    全部完成后一次写入索引；进度与各文件结果通过 GET /knowledge/upload/archive/{batch_id} 查询。
+    不支持的文件类型与隐藏文件跳过，与已有文档内容相同的文件不重复入库；
+    revise_existing为true时与已有文档同名的文件作为其修订版增量更新，否则作为新文档入库。
+    解压后总大小超过 MAX_ARCHIVE_UNCOMPRESSED_MB 或条目数超过 MAX_ARCHIVE_MEMBERS 时返回413。
+    """
+    log_lyl.info(f"收到压缩包上传请求: {file.filename}")
+    if os.path.splitext(file.filename)[1].lower() != ".zip":
+        raise HTTPException(status_code=400, detail="仅支持zip压缩包")
+
+    limit = settings.MAX_ARCHIVE_SIZE_MB * 1024 * 1024
+    if file.size is not None and file.size > limit:
+        raise HTTPException(
+            status_code=413,
+            detail=f"压缩包超过大小限制 {settings.MAX_ARCHIVE_SIZE_MB} MB"
+        )
+
+    try:
+        archive_path, _, _ = await document_service.save_upload_stream_lyl(
+            file.filename, file, limit_mb=settings.MAX_ARCHIVE_SIZE_MB
+        )
+    except UploadTooLargeError_lyl as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        log_lyl.error(f"压缩包上传失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
+
+    if not await asyncio.to_thread(zipfile.is_zipfile, archive_path):
+        await document_service.delete_file_lyl(archive_path)
+        raise HTTPException(status_code=400, detail="文件不是有效的zip压缩包")
+
+    def check_limits_lyl() -> None:
+        with zipfile.ZipFile(archive_path) as archive:
+            check_archive_limits_lyl(archive)
+
+    try:
+        await asyncio.to_thread(check_limits_lyl)
+    except ArchiveTooLargeError_lyl as e:
+        await document_service.delete_file_lyl(archive_path)
+        raise HTTPException(status_code=413, detail=str(e))
+
+    batch = bulk_ingest_service.start_archive_lyl(archive_path, file.filename, revise_existing)
+    log_lyl.info(f"批量入库已开始: {file.filename}, 批次ID: {batch['id']}")
+    return batch
+
+
+@router.get("/upload/archive/{batch_id}")
+async def get_archive_batch_lyl(batch_id: int):
+    """查询批量入库的进度与各文件结果_lyl"""
+    batch = bulk_ingest_service.get_batch_lyl(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="批次不存在")
+    return batch
+
+
+@router.get("/jobs")
+async def list_jobs_lyl(status: Optional[str] = Query(None, description="按任务状态过滤")):
+    """列出最近的入库任务_lyl"""
+    jobs = await ingestion_service.list_jobs_lyl(status)
+    return {"total": len(jobs), "jobs": jobs}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job_lyl(job_id: int):
+    """查询入库任务的状态、阶段与进度百分比_lyl"""
+    job = await ingestion_service.get_job_lyl(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+
 @router.get("/documents")
 async def get_documents_lyl():
     """获取所有文档列表_lyl"""
@@ -107,22 +263,36 @@ async def get_document_lyl(document_id: int):
     return document
 
 
+@router.get("/documents/{document_id}/chunks")
+async def get_document_chunks_lyl(document_id: int):
+    """获取文档的分块列表_lyl"""
+    document = await document_service.get_document_by_id_lyl(document_id)
+    if not document:
+        raise HTTPException(status_code=404, detail="文档不存在")
+    chunks = await document_service.get_document_chunks_lyl(document_id)
+    return {
+        "document_id": document_id,
+        "total": len(chunks),
+        "chunks": chunks
+    }
+
+
 @router.delete("/documents/{document_id}")
 async def delete_document_lyl(document_id: int):
-    """删除文档_lyl"""
+    """删除文档_lyl - 文档有正在执行的入库任务时返回409"""
     try:
         # 获取文档信息
         document = await document_service.get_document_by_id_lyl(document_id)
         if not document:
             raise HTTPException(status_code=404, detail="文档不存在")
         
-        # 删除物理文件
-        await document_service.delete_file_lyl(document["file_path"])
-        
-        # 删除数据库记录
-        await document_service.delete_document_record_lyl(document_id)
-        
-        # 注意：FAISS不支持直接删除，如需完全删除需要重建索引
+        # 移除向量、删除数据库记录与物理文件，中途中断时由入库任务恢复流程补完；
+        # 文档仍在入库时拒绝删除，避免任务继续写入已删除文档的分块
+        try:
+            removed = await ingestion_service.delete_document_lyl(document)
+        except DocumentBusyError_lyl as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        log_lyl.info(f"已从向量存储移除 {removed} 个向量")
         
         return SuccessResponse_lyl(message="文档删除成功")
     
@@ -133,12 +303,34 @@ async def delete_document_lyl(document_id: int):
 
 
 @router.get("/search")
-async def search_knowledge_lyl(query: str, k: int = 5):
-    """搜索知识库_lyl"""
+async def search_knowledge_lyl(
+    query: str,
+    k: int = 5,
+    document_ids: Optional[List[int]] = Query(default=None, description="限定的文档ID，可重复传入"),
+    file_types: Optional[List[str]] = Query(default=None, description="限定的文件类型，可重复传入"),
+    created_after: Optional[datetime] = Query(default=None, description="上传时间下限（含），不带时区时按本机时区"),
+    created_before: Optional[datetime] = Query(default=None, description="上传时间上限（含），不带时区时按本机时区"),
+    mode: str = Query(default=SEARCH_MODE_VECTOR_LYL, description="检索模式: vector / hybrid"),
+):
+    """搜索知识库_lyl - 可按文档、文件类型与上传时间过滤
+
+    mode为hybrid时融合向量与全文检索结果，score为融合分数（越大越相关）。
+    """
+    if mode not in SEARCH_MODES_LYL:
+        raise HTTPException(status_code=400, detail=f"不支持的检索模式: {mode}")
+    search_filter = SearchFilter_lyl(
+        document_ids=document_ids,
+        file_types=file_types,
+        created_after=created_after,
+        created_before=created_before,
+    )
     try:
-        results = await vector_store_service.search_lyl(query, k=k)
+        results = await vector_store_service.search_lyl(
+            query, k=k, search_filter=search_filter, mode=mode
+        )
         return {
             "query": query,
+            "mode": mode,
             "results": results,
             "count": len(results)
         }
@@ -146,6 +338,69 @@ async def search_knowledge_lyl(query: str, k: int = 5):
         raise HTTPException(status_code=500, detail=f"搜索失败: {str(e)}")
 
 
+@router.post("/search/batch")
+async def search_knowledge_batch_lyl(request: BatchSearchRequest_lyl):
+    """批量搜索知识库_lyl - 全部查询共用一次嵌入调用与一次批量向量检索"""
+    if len(request.queries) > settings.SEARCH_BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"单次最多 {settings.SEARCH_BATCH_MAX_QUERIES} 个查询"
+        )
+    if request.mode not in SEARCH_MODES_LYL:
+        raise HTTPException(status_code=400, detail=f"不支持的检索模式: {request.mode}")
+    try:
+        batch_results = await vector_store_service.search_batch_lyl(
+            request.queries, k=request.k, search_filter=request.filters, mode=request.mode
+        )
+        return {
+            "count": len(request.queries),
+            "mode": request.mode,
+            "results": [
+                {
+                    "query": query,
+                    "results": results,
+                    "count": len(results)
+                }
+                for query, results in zip(request.queries, batch_results)
+            ]
+        }
+    except Exception as e:
+        log_lyl.error(f"批量搜索失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"搜索失败: {str(e)}")
+
+
+@router.post("/index/rebuild", status_code=202)
+async def rebuild_index_lyl(request: Optional[RebuildRequest_lyl] = None):
+    """在后台重建向量索引_lyl - 合并全部分段并按当前索引配置重建，完成后原子切换"""
+    request = request or RebuildRequest_lyl()
+    if not vector_store_service.is_ready:
+        raise HTTPException(status_code=503, detail="向量存储未就绪")
+    try:
+        status = vector_store_service.start_rebuild_lyl(reembed=request.reembed)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    log_lyl.info(f"开始重建向量索引: {status['mode']}")
+    return status
+
+
+@router.post("/index/rechunk", status_code=202)
+async def rechunk_documents_lyl():
+    """按当前分块配置重新切分全部文档_lyl
+
+    为每个文档登记一个重新分块任务：从提取文本缓存直接切分，不再解析原文件；
+    只嵌入内容变化的分块，内容未变的分块沿用原向量。进度通过 GET /knowledge/jobs 查询。
+    """
+    job_ids = await ingestion_service.enqueue_rechunk_lyl()
+    log_lyl.info(f"已登记 {len(job_ids)} 个重新分块任务")
+    return {"success": True, "total": len(job_ids), "job_ids": job_ids}
+
+
+@router.get("/index/status")
+async def get_index_status_lyl():
+    """获取向量索引的分段结构与重建进度_lyl"""
+    return vector_store_service.index_status_lyl()
+
+
 @router.get("/stats")
 async def get_knowledge_stats_lyl():
     """获取知识库统计信息_lyl"""
@@ -165,6 +420,13 @@ async def get_knowledge_stats_lyl():
         "total_chunks": total_chunks,
         "total_size_bytes": total_size,
         "vector_count": vector_store_service.get_document_count_lyl(),
-        "file_types": file_types
+        "file_types": file_types,
+        "embedding_cache": embedding_service.cache_stats_lyl(),
+        "embedding_pipeline": embedding_service.document_embedder_stats_lyl(),
+        "query_embedding_cache": embedding_service.query_cache_stats_lyl(),
+        "query_embedding_batcher": embedding_service.query_batcher_stats_lyl(),
+        "ingest_queue": ingestion_service.queue_stats_lyl(),
+        "document_parser": document_service.parser.stats_lyl(),
+        "text_cache": await document_service.text_cache_stats_lyl()
     }
 
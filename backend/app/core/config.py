@@ -32,18 +32,96 @@ class Settings_lyl(BaseSettings):
     DEEPSEEK_BASE_URL: str = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1")
     
     # Embedding 模型配置
+    EMBEDDING_PROVIDER: str = os.getenv("EMBEDDING_PROVIDER", "remote")  # remote / local / hash
     EMBEDDING_MODEL_API_KEY: str = os.getenv("EMBEDDING_MODEL_API_KEY", "")
     EMBEDDING_MODEL_BASE_URL: str = os.getenv("EMBEDDING_MODEL_BASE_URL", "https://api.siliconflow.cn/v1")
     EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "BAAI/bge-m3")
+    EMBEDDING_LOCAL_MODEL: str = os.getenv("EMBEDDING_LOCAL_MODEL", "BAAI/bge-m3")  # 本地推理的sentence-transformers模型
+    EMBEDDING_LOCAL_DEVICE: str = "cpu"
+    EMBEDDING_LOCAL_BATCH_SIZE: int = 16  # 本地推理每批文本数
+    EMBEDDING_LOCAL_THREADS: int = 2  # 本地推理并行的批次数
+    EMBEDDING_HASH_DIM: int = 1024  # 哈希嵌入的维度
+    # 分块嵌入并发配置：并发数与批次大小按延迟和429/5xx自适应调整（AIMD）
+    EMBEDDING_CONCURRENCY: int = 4  # 初始并发请求数
+    EMBEDDING_MAX_CONCURRENCY: int = 16
+    EMBEDDING_BATCH_SIZE: int = 32  # 初始每次请求的分块数
+    EMBEDDING_MIN_BATCH_SIZE: int = 4
+    EMBEDDING_MAX_BATCH_SIZE: int = 64  # 不超过嵌入接口单次请求的输入条数上限
+    EMBEDDING_TARGET_LATENCY_MS: float = 5000  # 单次请求延迟超过该值视为拥塞
+    EMBEDDING_MAX_RETRIES: int = 5  # 429/5xx/网络错误的重试次数
+    EMBEDDING_RETRY_BASE_MS: float = 500  # 指数退避的初始等待时间
+    EMBEDDING_RETRY_MAX_MS: float = 30000  # 单次退避的最长等待时间
+    EMBEDDING_CACHE_ENABLED: bool = True  # 分块嵌入磁盘缓存，重复分块不再调用嵌入接口
+    EMBEDDING_CACHE_PATH: str = "data/embedding_cache.db"
+    EMBEDDING_CACHE_MAX_MB: int = 1024  # 缓存总大小上限，超过后淘汰最久未使用的向量
+    QUERY_EMBEDDING_CACHE_SIZE: int = 1024  # 进程内缓存的查询向量数，0表示不缓存
+    QUERY_EMBEDDING_CACHE_TTL: float = 3600  # 查询向量缓存有效期（秒）
+    QUERY_EMBEDDING_BATCH_WINDOW_MS: float = 5  # 合并并发查询嵌入的等待窗口（毫秒），0表示不合并
+    QUERY_EMBEDDING_BATCH_MAX_SIZE: int = 32  # 单次合并调用的最大查询数，凑满即发送
     
     # 数据库配置
     DATABASE_URL: str = "data/knowledge_qa.db"
     
     # 向量存储配置
     VECTOR_STORE_PATH: str = "data/vector_store"
+    VECTOR_SEGMENT_MERGE_THRESHOLD: int = 8  # 分段数达到该值时触发后台合并
+    VECTOR_MERGE_SIZE_RATIO: float = 2.0  # 分层合并：比已选小分段总量大出该倍数的分段不参与本次合并
+    VECTOR_STORE_MMAP: bool = True  # 以内存映射方式打开索引文件
+    VECTOR_STORE_WARMUP: bool = True  # 加载后在后台预热分段文件
+    
+    # 向量索引类型配置: flat / hnsw / ivf_flat
+    VECTOR_INDEX_TYPE: str = "hnsw"
+    VECTOR_INDEX_PROMOTE_THRESHOLD: int = 50000  # 有效向量数达到该值后升级为近似索引
+    VECTOR_IVF_NLIST: int = 0  # 0表示按4*sqrt(n)自动计算
+    VECTOR_IVF_NPROBE: int = 16
+    VECTOR_HNSW_M: int = 32
+    VECTOR_HNSW_EF_CONSTRUCTION: int = 80
+    VECTOR_HNSW_EF_SEARCH: int = 64
+    
+    # 向量量化配置: none / sq8 / pq，仅作用于合并后的分段
+    VECTOR_QUANTIZATION: str = "none"
+    VECTOR_PQ_M: int = 0  # PQ子量化器个数，0表示取维度/4
+    VECTOR_RERANK_FACTOR: int = 4  # 量化分段检索时取k的多少倍候选做精确重排
+    # 向量降维配置: none / truncate（截断前若干维）/ pca，更改后以重新嵌入方式重建索引生效
+    VECTOR_REDUCTION: str = "none"
+    VECTOR_REDUCED_DIM: int = 256  # 降维后的维度
+    VECTOR_PCA_TRAIN_SIZE: int = 50000  # 训练PCA时最多抽样的向量数
+    # 后台合并/重建配置
+    VECTOR_REBUILD_BATCH_SIZE: int = 20000  # 构建索引时每批写入的向量数
+    VECTOR_REBUILD_IDLE_RATIO: float = 1.0  # 每批写入后休眠时间与写入耗时之比，越大越让出CPU
+    VECTOR_REBUILD_THREADS: int = 1  # 构建索引时faiss使用的线程数，0表示不限制
+    VECTOR_REBUILD_EMBED_BATCH: int = 256  # 重新嵌入时每次调用嵌入接口的分块数
+    SEARCH_BATCH_MAX_QUERIES: int = 128  # 批量检索接口单次请求的最大查询数
+    
+    # 混合检索配置: vector / hybrid（向量 + FTS5全文，倒数排名融合）
+    SEARCH_HYBRID_CANDIDATES: int = 20  # 混合检索时每路召回的候选数
+    SEARCH_RRF_K: int = 60  # 倒数排名融合的平滑常数
+    RAG_SEARCH_MODE: str = "hybrid"  # 知识库检索工具使用的检索模式
+    RAG_TOP_K: int = 3  # 知识库检索工具返回的分块数
     
     # 文档存储配置
     DOCUMENTS_PATH: str = "data/documents"
+    MAX_UPLOAD_SIZE_MB: int = 200  # 单个上传文件的大小上限
+    UPLOAD_CHUNK_SIZE_KB: int = 1024  # 上传文件流式写入磁盘时每块的大小
+    MAX_ARCHIVE_SIZE_MB: int = 2048  # 批量入库的zip压缩包大小上限，其中每个文件仍受 MAX_UPLOAD_SIZE_MB 限制
+    MAX_ARCHIVE_UNCOMPRESSED_MB: int = 8192  # zip压缩包中全部条目解压后的总大小上限
+    MAX_ARCHIVE_MEMBERS: int = 10000  # zip压缩包中的条目数上限
+
+    # 文档解析配置 - 在独立进程池中加载并分割文档
+    PARSE_WORKERS: int = 0  # 解析进程数，0表示CPU核数
+    PARSE_TIMEOUT_SECONDS: float = 300  # 单个解析任务（整个文件或PDF页区间）的超时
+    PARSE_PDF_PAGES_PER_TASK: int = 32  # PDF超过该页数时按页区间拆分并行解析
+    # 文本分割配置: recursive（langchain递归分割）/ sentence（单遍扫描的中英文句子感知分割）
+    TEXT_SPLITTER: str = "recursive"
+    TEXT_SPLITTER_UNIT: str = "chars"  # 分块长度单位: chars（字符数）/ tokens（近似token数）
+    TEXT_CHUNK_SIZE: int = 500
+    TEXT_CHUNK_OVERLAP: int = 50
+
+    # 入库任务队列配置 - 上传后由后台工作协程解析、嵌入并写入索引
+    INGEST_WORKERS: int = 2  # 同时处理的入库任务数
+    INGEST_MAX_ATTEMPTS: int = 3  # 任务因进程退出被中断后最多重新执行的次数
+    INGEST_PIPELINE_DEPTH: int = 2  # 解析→嵌入→写入索引各阶段之间最多缓冲的分块批数
+    BULK_EMBED_BATCH: int = 512  # 批量入库时各文件分块合并后每次调用嵌入接口的分块数
     
     # CORS配置
     CORS_ORIGINS: list = ["*"]  # 允许所有来源
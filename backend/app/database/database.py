@@ -1,9 +1,15 @@
 """
 数据库管理模块 - 使用aiosqlite实现异步SQLite操作
+
+全部操作共用一个连接，提交与回滚作用于连接上所有未提交的写入，
+因此带提交的写操作（execute_lyl 与 transaction_lyl）由写锁串行化，
+避免并发上传时一个请求的提交或回滚波及另一个请求写到一半的数据。
 """
+import asyncio
 import aiosqlite
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, AsyncIterator
 from datetime import datetime
 
 from backend.app.core.config import settings
@@ -17,6 +23,7 @@ class DatabaseManager_lyl:
         self.db_path = Path(settings.DATABASE_URL)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
         self._connection: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
     
     async def connect_lyl(self) -> aiosqlite.Connection:
         """连接数据库_lyl"""
@@ -66,19 +73,129 @@ class DatabaseManager_lyl:
                 file_path TEXT NOT NULL,
                 file_size INTEGER DEFAULT 0,
                 chunk_count INTEGER DEFAULT 0,
+                content_hash TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
+        await self._add_missing_columns_lyl(conn, "documents", {"content_hash": "TEXT"})
+        
+        # 创建分块表 - id即该分块在FAISS索引中的向量ID，自增且不复用
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                document_id INTEGER NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                content TEXT,
+                metadata TEXT,
+                content_hash TEXT,
+                FOREIGN KEY (document_id) REFERENCES documents(id) ON DELETE CASCADE
+            )
+        """)
+        await self._add_missing_columns_lyl(
+            conn, "chunks", {"content": "TEXT", "metadata": "TEXT", "content_hash": "TEXT"}
+        )
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_chunks_document_id ON chunks(document_id)"
+        )
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents(content_hash)"
+        )
+        
+        # 创建提取文本缓存表 - 每个文档解析出的逐页文本（zlib压缩），重新分块时不再解析原文件
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS document_texts (
+                document_id INTEGER PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                page_count INTEGER DEFAULT 0,
+                char_count INTEGER DEFAULT 0,
+                data BLOB NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (document_id) REFERENCES documents(id) ON DELETE CASCADE
+            )
+        """)
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_document_texts_content_hash ON document_texts(content_hash)"
+        )
+        
+        # 创建入库任务表 - 上传的文件先入队，由后台工作协程处理，进程重启后继续未完成的任务
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS ingest_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                filename TEXT NOT NULL,
+                file_type TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                file_size INTEGER DEFAULT 0,
+                content_hash TEXT,
+                status TEXT NOT NULL DEFAULT 'queued',
+                stage TEXT NOT NULL DEFAULT 'queued',
+                progress INTEGER DEFAULT 0,
+                document_id INTEGER,
+                outcome TEXT,
+                chunk_count INTEGER DEFAULT 0,
+                embedded_count INTEGER DEFAULT 0,
+                chunk_watermark INTEGER,
+                stale_chunk_ids TEXT,
+                target_document_id INTEGER,
+                kind TEXT NOT NULL DEFAULT 'upload',
+                attempts INTEGER DEFAULT 0,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        await self._add_missing_columns_lyl(conn, "ingest_jobs", {
+            "outcome": "TEXT",
+            "embedded_count": "INTEGER DEFAULT 0",
+            "chunk_watermark": "INTEGER",
+            "kind": "TEXT NOT NULL DEFAULT 'upload'",
+            "stale_chunk_ids": "TEXT",
+            "target_document_id": "INTEGER",
+        })
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_ingest_jobs_status ON ingest_jobs(status)"
+        )
+        
+        # 创建分块全文索引 - rowid即chunks.id，tokens为预先切分的检索词（见 lexical_tokenizer）
+        await conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                tokens,
+                tokenize = 'unicode61 remove_diacritics 0'
+            )
+        """)
         
         await conn.commit()
     
+    async def _add_missing_columns_lyl(
+        self, conn: aiosqlite.Connection, table: str, columns: Dict[str, str]
+    ) -> None:
+        """为旧版数据库中已存在的表补充新增列_lyl"""
+        cursor = await conn.execute(f"PRAGMA table_info({table})")
+        existing = {row["name"] for row in await cursor.fetchall()}
+        for name, column_type in columns.items():
+            if name not in existing:
+                await conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+    
     async def execute_lyl(self, query: str, params: tuple = ()) -> aiosqlite.Cursor:
         """执行SQL查询_lyl"""
         conn = await self.connect_lyl()
-        cursor = await conn.execute(query, params)
-        await conn.commit()
+        async with self._write_lock:
+            cursor = await conn.execute(query, params)
+            await conn.commit()
         return cursor
     
+    @asynccontextmanager
+    async def transaction_lyl(self) -> AsyncIterator[aiosqlite.Connection]:
+        """在单个事务中执行多条语句_lyl - 成功提交，异常回滚；事务之间互斥"""
+        conn = await self.connect_lyl()
+        async with self._write_lock:
+            try:
+                yield conn
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+    
     async def fetch_one_lyl(self, query: str, params: tuple = ()) -> Optional[Dict[str, Any]]:
         """查询单条记录_lyl"""
         conn = await self.connect_lyl()
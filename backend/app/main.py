@@ -7,11 +7,15 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
 
 from backend.app.core.config import settings
 from backend.app.core.logger import log_lyl
 from backend.app.database.database import db_manager
+from backend.app.services.bulk_ingest_service import bulk_ingest_service
+from backend.app.services.document_service import document_service
+from backend.app.services.embedding_service import embedding_service
+from backend.app.services.ingestion_service import ingestion_service
 from backend.app.services.vector_store_service import vector_store_service
 from backend.app.api import chat, knowledge
 
@@ -39,9 +43,12 @@ async def lifespan_lyl(app: FastAPI):
     await db_manager.init_tables_lyl()
     log_lyl.success("✅ 数据库初始化完成")
 
-    # 初始化向量存储
-    await vector_store_service.initialize_lyl()
-    log_lyl.success("✅ 向量存储初始化完成")
+    # 在后台加载向量存储，加载完成前 /ready 返回503
+    vector_store_service.start_lyl()
+    log_lyl.info("⏳ 向量存储正在后台加载")
+
+    # 启动入库任务工作协程，继续上次未完成的任务
+    ingestion_service.start_lyl()
 
     log_lyl.info(f"🌟 {settings.PROJECT_NAME} v{settings.VERSION} 启动成功!")
     log_lyl.info(f"📖 API文档: http://localhost:8000/docs")
@@ -50,6 +57,11 @@ async def lifespan_lyl(app: FastAPI):
 
     # 关闭时执行
     log_lyl.info("👋 正在关闭系统...")
+    await bulk_ingest_service.close_lyl()
+    await ingestion_service.close_lyl()
+    document_service.close_lyl()
+    await vector_store_service.close_lyl()
+    embedding_service.close_lyl()
     await db_manager.disconnect_lyl()
     log_lyl.success("✅ 系统已安全关闭")
 
@@ -125,6 +137,14 @@ async def health_check_lyl():
     return {"status": "healthy"}
 
 
+@app.get("/ready")
+async def readiness_check_lyl():
+    """就绪检查_lyl - 向量存储加载完成、可以检索后才返回200"""
+    if not vector_store_service.is_ready:
+        return JSONResponse(status_code=503, content={"status": "loading"})
+    return {"status": "ready", "vector_count": vector_store_service.get_document_count_lyl()}
+
+
 @app.get("/{path:path}")
 async def serve_spa_lyl(path: str):
     """SPA路由支持_lyl - 所有前端路由返回index.html"""
@@ -95,6 +95,43 @@ class DocumentList_lyl(BaseModel):
     documents: List[Document_lyl]
 
 
+class SearchFilter_lyl(BaseModel):
+    """检索过滤条件模型_lyl - 各条件之间为与关系，未设置的条件不生效"""
+    document_ids: Optional[List[int]] = Field(default=None, description="限定的文档ID")
+    file_types: Optional[List[str]] = Field(default=None, description="限定的文件类型，如 pdf、.md")
+    created_after: Optional[datetime] = Field(default=None, description="上传时间下限（含），不带时区时按本机时区")
+    created_before: Optional[datetime] = Field(default=None, description="上传时间上限（含），不带时区时按本机时区")
+    created_before_exclusive: Optional[datetime] = Field(
+        default=None, description="上传时间上限（不含），不带时区时按本机时区"
+    )
+
+    def is_empty(self) -> bool:
+        """是否未设置任何过滤条件_lyl"""
+        return (
+            self.document_ids is None
+            and self.file_types is None
+            and self.created_after is None
+            and self.created_before is None
+            and self.created_before_exclusive is None
+        )
+
+
+class BatchSearchRequest_lyl(BaseModel):
+    """批量检索请求模型_lyl"""
+    queries: List[str] = Field(..., min_length=1, description="查询文本列表")
+    k: int = Field(default=5, ge=1, le=100, description="每个查询返回的结果数")
+    filters: Optional[SearchFilter_lyl] = Field(default=None, description="对全部查询生效的过滤条件")
+    mode: str = Field(default="vector", description="检索模式: vector / hybrid")
+
+
+class RebuildRequest_lyl(BaseModel):
+    """索引重建请求模型_lyl"""
+    reembed: bool = Field(
+        default=False,
+        description="是否按分块文本重新嵌入（更换嵌入模型后使用），否则只用已存向量重建索引"
+    )
+
+
 # ==================== 通用响应模型 ====================
 
 class SuccessResponse_lyl(BaseModel):
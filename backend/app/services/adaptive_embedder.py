@@ -0,0 +1,186 @@
+"""
+自适应并发嵌入模块 - 把大批分块拆成小批次并行调用嵌入接口
+
+并发数与批次大小按AIMD方式调整：批次在目标延迟内成功时并发数加性增加、批次变大；
+遇到429/5xx/超时或延迟超过目标时二者乘性减小。同一时刻发出的多个批次同时失败时，
+只按一次拥塞处理（只对减小之后发出的批次再次减小），避免并发数被连续减半到底。
+可重试的错误按带随机抖动的指数退避重试，其它错误（如400）直接抛出。
+
+控制状态在全部上传之间共享：并发上传共用同一并发上限，
+一次上传学到的限流情况也作用于下一次上传。
+"""
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import openai
+
+from backend.app.core.logger import log_lyl
+
+# 批次大小的加性增量
+BATCH_STEP_LYL = 8
+
+
+def is_retryable_lyl(error: Exception) -> bool:
+    """限流、服务端错误与网络错误可以重试_lyl"""
+    if isinstance(error, (openai.APIConnectionError, asyncio.TimeoutError)):
+        return True
+    status_code = getattr(error, "status_code", None)
+    return status_code is not None and (status_code == 429 or status_code >= 500)
+
+
+class AdaptiveEmbedder_lyl:
+    """AIMD自适应并发的批量嵌入器_lyl"""
+
+    def __init__(
+        self,
+        embed: Callable[[List[str]], Awaitable[List[List[float]]]],
+        concurrency: int,
+        max_concurrency: int,
+        batch_size: int,
+        min_batch_size: int,
+        max_batch_size: int,
+        target_latency: float,
+        max_retries: int,
+        retry_base: float,
+        retry_cap: float,
+    ):
+        """初始化嵌入器_lyl - embed为单次批量嵌入调用，时间参数单位为秒"""
+        self._embed = embed
+        self.max_concurrency = max_concurrency
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.target_latency = target_latency
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_cap = retry_cap
+        self._concurrency = float(max(1, min(concurrency, max_concurrency)))
+        self._batch_size = float(max(min_batch_size, min(batch_size, max_batch_size)))
+        self._in_flight = 0
+        self._waiters: List[asyncio.Future] = []
+        self._last_decrease = 0.0
+        self.requests = 0
+        self.retries = 0
+        self.throttles = 0
+
+    @property
+    def concurrency(self) -> int:
+        """当前并发上限_lyl"""
+        return int(self._concurrency)
+
+    @property
+    def batch_size(self) -> int:
+        """当前批次大小_lyl"""
+        return int(self._batch_size)
+
+    def _on_success_lyl(self, latency: float, sent_at: float) -> None:
+        """批次成功：延迟达标时加性增加，否则按拥塞处理_lyl"""
+        if latency > self.target_latency:
+            self._on_congestion_lyl(sent_at)
+            return
+        # 每轮（约concurrency个批次）并发数加1
+        self._concurrency = min(self.max_concurrency, self._concurrency + 1 / self._concurrency)
+        self._batch_size = min(self.max_batch_size, self._batch_size + BATCH_STEP_LYL / self._concurrency)
+
+    def _on_congestion_lyl(self, sent_at: float) -> None:
+        """拥塞：并发数与批次大小减半_lyl - 上次减小之前发出的批次不再重复减小"""
+        if sent_at < self._last_decrease:
+            return
+        self._last_decrease = time.monotonic()
+        self._concurrency = max(1.0, self._concurrency / 2)
+        self._batch_size = max(float(self.min_batch_size), self._batch_size / 2)
+        self.throttles += 1
+        log_lyl.debug(f"嵌入接口拥塞，并发数降为 {self.concurrency}，批次大小降为 {self.batch_size}")
+
+    async def _acquire_lyl(self) -> None:
+        """等待空闲的并发名额_lyl"""
+        while self._in_flight >= self.concurrency:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self._in_flight += 1
+
+    def _release_lyl(self, *_: Any) -> None:
+        """归还并发名额并唤醒等待方_lyl - 作为批次任务的完成回调，任务被取消时同样归还"""
+        self._in_flight -= 1
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def _send_lyl(self, texts: List[str]) -> List[List[float]]:
+        """发送一个批次，可重试的错误按带抖动的指数退避重试_lyl"""
+        attempt = 0
+        while True:
+            sent_at = time.monotonic()
+            self.requests += 1
+            try:
+                vectors = await self._embed(texts)
+            except Exception as e:
+                if not is_retryable_lyl(e) or attempt >= self.max_retries:
+                    raise
+                self._on_congestion_lyl(sent_at)
+                self.retries += 1
+                delay = min(self.retry_cap, self.retry_base * 2 ** attempt)
+                attempt += 1
+                await asyncio.sleep(random.uniform(delay / 2, delay))
+                continue
+            self._on_success_lyl(time.monotonic() - sent_at, sent_at)
+            return vectors
+
+    async def embed_lyl(
+        self,
+        texts: List[str],
+        progress: Optional[Callable[[int], None]] = None,
+    ) -> List[List[float]]:
+        """并行嵌入全部文本，按输入顺序返回向量_lyl
+
+        progress在每个批次完成后以已完成的文本数调用；任一批次最终失败时取消其余批次并抛出异常。
+        """
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        completed = 0
+        tasks: List[asyncio.Task] = []
+
+        async def run_batch_lyl(start: int, batch: List[str]) -> None:
+            nonlocal completed
+            vectors = await self._send_lyl(batch)
+            results[start:start + len(batch)] = vectors
+            completed += len(batch)
+            if progress is not None:
+                progress(completed)
+
+        try:
+            position = 0
+            while position < len(texts):
+                await self._acquire_lyl()
+                if any(task.done() and task.exception() for task in tasks):
+                    self._release_lyl()
+                    break
+                # 批次大小在发出时按当前状态确定
+                batch = texts[position:position + self.batch_size]
+                task = asyncio.create_task(run_batch_lyl(position, batch))
+                task.add_done_callback(self._release_lyl)
+                tasks.append(task)
+                position += len(batch)
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return results
+
+    def stats_lyl(self) -> Dict[str, Any]:
+        """当前并发状态与重试统计_lyl"""
+        return {
+            "concurrency": self.concurrency,
+            "batch_size": self.batch_size,
+            "in_flight": self._in_flight,
+            "requests": self.requests,
+            "retries": self.retries,
+            "throttles": self.throttles,
+        }
@@ -0,0 +1,450 @@
+"""
+批量入库服务模块 - 把zip压缩包或本地目录中的全部文档一次入库
+
+逐个条目流式解压（或复制）到文档目录，边保存边在进程池中并行解析，
+各文件的分块汇总后按 BULK_EMBED_BATCH 个一批共享嵌入调用，
+全部完成后一次性创建文档记录、写入一个向量分段并提交一次manifest，最后写入全文索引与提取文本缓存。
+
+每个文件的结果单独记录：
+
+    created    新建文档
+    duplicate  内容与已有文档或本批中的其它文件相同，未入库
+    queued     与已有文档同名且批次要求修订已有文档（revise_existing），交给入库任务队列增量更新
+    skipped    不支持的文件类型或不安全的路径
+    failed     保存、解析或嵌入失败，不影响同批其它文件
+
+zip压缩包在解压前按条目声明的大小检查解压后总大小与条目数（见 check_archive_limits_lyl），
+超过 MAX_ARCHIVE_UNCOMPRESSED_MB 或 MAX_ARCHIVE_MEMBERS 时整个批次失败；
+zipfile按声明的大小读出条目内容，每个文件实际写入时仍受 MAX_UPLOAD_SIZE_MB 限制。
+
+批次状态保存在内存中，与索引重建状态一样只保留最近 BATCH_HISTORY_LIMIT_LYL 个；
+同一时刻只运行一个批次，后提交的批次排队等待。
+所有分块的向量在最后一次写入前都保存在内存中。
+"""
+import asyncio
+import itertools
+import os
+import zipfile
+from contextlib import ExitStack
+from datetime import datetime
+from pathlib import Path, PurePosixPath
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple
+
+from backend.app.core.config import settings
+from backend.app.core.logger import log_lyl
+from backend.app.services.document_parser import LOADERS_LYL
+from backend.app.services.document_service import document_service
+from backend.app.services.embedding_service import embedding_service
+from backend.app.services.ingestion_service import ingestion_service, run_stages_lyl
+from backend.app.services.text_cache import TextCacheWriter_lyl
+from backend.app.services.vector_store_service import vector_store_service
+
+BATCH_QUEUED_LYL = "queued"
+BATCH_RUNNING_LYL = "running"
+BATCH_SUCCEEDED_LYL = "succeeded"
+BATCH_FAILED_LYL = "failed"
+
+FILE_CREATED_LYL = "created"
+FILE_DUPLICATE_LYL = "duplicate"
+FILE_QUEUED_LYL = "queued"
+FILE_SKIPPED_LYL = "skipped"
+FILE_FAILED_LYL = "failed"
+FILE_STATUSES_LYL = (
+    FILE_CREATED_LYL, FILE_DUPLICATE_LYL, FILE_QUEUED_LYL, FILE_SKIPPED_LYL, FILE_FAILED_LYL
+)
+
+# 内存中保留的批次状态数
+BATCH_HISTORY_LIMIT_LYL = 20
+# 压缩包中的系统附带目录
+IGNORED_PARTS_LYL = {"__MACOSX"}
+# 未设置UTF-8标志的zip条目名按cp437解码，中文系统打包的实际多为GBK
+ZIP_UTF8_FLAG_LYL = 0x800
+
+# 条目：(相对路径, 打开条目内容的函数)
+Entry_lyl = Tuple[str, Callable[[], BinaryIO]]
+
+
+class ArchiveTooLargeError_lyl(Exception):
+    """zip压缩包解压后的总大小或条目数超过限制_lyl"""
+
+
+def is_ignored_lyl(parts: Tuple[str, ...]) -> bool:
+    """隐藏文件与系统附带目录不参与入库_lyl"""
+    return any(part.startswith(".") or part in IGNORED_PARTS_LYL for part in parts)
+
+
+def zip_entry_name_lyl(info: zipfile.ZipInfo) -> str:
+    """zip条目的文件名_lyl - 未标记UTF-8的条目尝试按GBK还原中文名"""
+    if info.flag_bits & ZIP_UTF8_FLAG_LYL:
+        return info.filename
+    try:
+        return info.filename.encode("cp437").decode("gbk")
+    except UnicodeError:
+        return info.filename
+
+
+def check_archive_limits_lyl(archive: zipfile.ZipFile) -> None:
+    """按条目声明的大小检查解压后总大小与条目数_lyl - 超过限制时抛出 ArchiveTooLargeError_lyl"""
+    members = archive.infolist()
+    if len(members) > settings.MAX_ARCHIVE_MEMBERS:
+        raise ArchiveTooLargeError_lyl(
+            f"压缩包条目数 {len(members)} 超过限制 {settings.MAX_ARCHIVE_MEMBERS}"
+        )
+    total = sum(info.file_size for info in members)
+    if total > settings.MAX_ARCHIVE_UNCOMPRESSED_MB * 1024 * 1024:
+        raise ArchiveTooLargeError_lyl(
+            f"压缩包解压后大小超过限制 {settings.MAX_ARCHIVE_UNCOMPRESSED_MB} MB"
+        )
+
+
+def archive_entries_lyl(archive: zipfile.ZipFile) -> List[Entry_lyl]:
+    """zip压缩包中的文件条目_lyl - 先检查解压后总大小与条目数"""
+    check_archive_limits_lyl(archive)
+    entries = []
+    for info in archive.infolist():
+        name = zip_entry_name_lyl(info)
+        if info.is_dir() or is_ignored_lyl(PurePosixPath(name).parts):
+            continue
+        entries.append((name, lambda info=info: archive.open(info)))
+    return entries
+
+
+def directory_entries_lyl(root: Path) -> List[Entry_lyl]:
+    """目录树中的文件条目，按相对路径排序_lyl - 不进入符号链接指向的目录"""
+    entries = []
+    for current, dirs, files in os.walk(root):
+        dirs[:] = sorted(name for name in dirs if not is_ignored_lyl((name,)))
+        for name in sorted(files):
+            path = Path(current) / name
+            if is_ignored_lyl((name,)) or not path.is_file():
+                continue
+            entries.append(
+                (path.relative_to(root).as_posix(), lambda path=path: open(path, "rb"))
+            )
+    return entries
+
+
+def check_entry_name_lyl(name: str) -> Optional[str]:
+    """检查条目路径，不能入库时返回原因_lyl"""
+    path = PurePosixPath(name.replace("\\", "/"))
+    if path.is_absolute() or ".." in path.parts:
+        return "不安全的路径"
+    if path.suffix.lower() not in LOADERS_LYL:
+        return f"不支持的文件类型: {path.suffix or '无扩展名'}"
+    return None
+
+
+class BulkIngestService_lyl:
+    """批量入库服务类_lyl"""
+
+    def __init__(self):
+        """初始化批量入库服务_lyl"""
+        self._batches: Dict[int, Dict[str, Any]] = {}
+        self._ids = itertools.count(1)
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._lock = asyncio.Lock()
+
+    def _new_batch_lyl(self, source: str, revise_existing: bool) -> Dict[str, Any]:
+        """登记新批次，超过保留数时丢弃最早结束的批次_lyl
+
+        revise_existing为True时与已有文档同名的文件作为其修订版，否则作为新文档入库。
+        """
+        batch_id = next(self._ids)
+        status = {
+            "id": batch_id,
+            "source": source,
+            "revise_existing": revise_existing,
+            "state": BATCH_QUEUED_LYL,
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "finished_at": None,
+            "total": 0,
+            "processed": 0,
+            "counts": dict.fromkeys(FILE_STATUSES_LYL, 0),
+            "files": [],
+            "error": None,
+        }
+        self._batches[batch_id] = status
+        finished = [
+            key for key, batch in self._batches.items() if batch["finished_at"] is not None
+        ]
+        for key in finished[:max(0, len(self._batches) - BATCH_HISTORY_LIMIT_LYL)]:
+            del self._batches[key]
+        return status
+
+    def get_batch_lyl(self, batch_id: int) -> Optional[Dict[str, Any]]:
+        """查询批次状态与各文件结果_lyl"""
+        status = self._batches.get(batch_id)
+        if status is None:
+            return None
+        return {**status, "counts": dict(status["counts"]), "files": [dict(f) for f in status["files"]]}
+
+    def start_archive_lyl(
+        self, archive_path: str, filename: str, revise_existing: bool = False
+    ) -> Dict[str, Any]:
+        """在后台入库上传的zip压缩包，返回批次状态_lyl - 完成后删除压缩包"""
+        status = self._new_batch_lyl(filename, revise_existing)
+        task = asyncio.create_task(self._run_archive_lyl(status, archive_path, remove=True))
+        self._tasks[status["id"]] = task
+        task.add_done_callback(lambda _: self._tasks.pop(status["id"], None))
+        return self.get_batch_lyl(status["id"])
+
+    async def ingest_archive_lyl(
+        self, archive_path: str, revise_existing: bool = False
+    ) -> Dict[str, Any]:
+        """入库本地zip压缩包并等待完成，返回批次状态_lyl - 不删除压缩包"""
+        status = self._new_batch_lyl(archive_path, revise_existing)
+        await self._run_archive_lyl(status, archive_path, remove=False)
+        return self.get_batch_lyl(status["id"])
+
+    async def ingest_directory_lyl(
+        self, root: str, revise_existing: bool = False
+    ) -> Dict[str, Any]:
+        """入库目录树中的全部文档并等待完成，返回批次状态_lyl"""
+        status = self._new_batch_lyl(root, revise_existing)
+        await self._run_batch_lyl(
+            status, lambda stack: directory_entries_lyl(Path(root))
+        )
+        return self.get_batch_lyl(status["id"])
+
+    async def _run_archive_lyl(
+        self, status: Dict[str, Any], archive_path: str, remove: bool
+    ) -> None:
+        """入库zip压缩包_lyl"""
+        try:
+            await self._run_batch_lyl(
+                status,
+                lambda stack: archive_entries_lyl(stack.enter_context(zipfile.ZipFile(archive_path)))
+            )
+        finally:
+            if remove:
+                await document_service.delete_file_lyl(archive_path)
+
+    async def _run_batch_lyl(
+        self, status: Dict[str, Any], open_entries: Callable[[ExitStack], List[Entry_lyl]]
+    ) -> None:
+        """串行执行批次并记录结果_lyl - open_entries在工作线程中列出条目，打开的资源登记到stack"""
+        async with self._lock:
+            status["state"] = BATCH_RUNNING_LYL
+            try:
+                with ExitStack() as stack:
+                    entries = await asyncio.to_thread(open_entries, stack)
+                    status["total"] = len(entries)
+                    await self._ingest_lyl(status, entries)
+                status["state"] = BATCH_SUCCEEDED_LYL
+            except Exception as e:
+                log_lyl.error(f"批量入库失败: {status['source']}: {e}")
+                status["state"] = BATCH_FAILED_LYL
+                status["error"] = str(e)
+            finally:
+                status["finished_at"] = datetime.now().isoformat(timespec="seconds")
+        counts = ", ".join(f"{key} {value}" for key, value in status["counts"].items() if value)
+        log_lyl.info(f"批量入库结束: {status['source']}，共 {status['total']} 个文件（{counts}）")
+
+    def _finish_file_lyl(
+        self, status: Dict[str, Any], item: Dict[str, Any], file_status: str, **fields: Any
+    ) -> None:
+        """记录单个文件的最终结果_lyl"""
+        item["result"].update(status=file_status, **fields)
+        status["counts"][file_status] += 1
+
+    async def _ingest_lyl(self, status: Dict[str, Any], entries: List[Entry_lyl]) -> None:
+        """保存 → 并行解析 → 共享批次嵌入，全部完成后一次写入索引_lyl"""
+        workers = document_service.parser.workers
+        slots = asyncio.Semaphore(workers)
+        parsed: asyncio.Queue = asyncio.Queue(workers)
+        batch_size = max(1, settings.BULK_EMBED_BATCH)
+        # 等待提交的文件，按条目顺序排列
+        pending: List[Dict[str, Any]] = []
+        # 本批内的内容哈希与文件名，避免同一批中的重复文件各自入库
+        seen_hashes: Dict[str, Dict[str, Any]] = {}
+        seen_names = set()
+        duplicates: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+        stored: List[str] = []
+
+        async def parse_file_lyl(item: Dict[str, Any]) -> None:
+            cache = TextCacheWriter_lyl()
+            try:
+                chunks = await document_service.load_and_split_document_lyl(item["path"], cache)
+                item["text_cache"] = await asyncio.to_thread(cache.finish_lyl)
+            except Exception as e:
+                self._finish_file_lyl(status, item, FILE_FAILED_LYL, error=f"解析失败: {e}")
+            else:
+                await parsed.put((item, chunks))
+            finally:
+                slots.release()
+                status["processed"] += 1
+
+        async def store_stage_lyl() -> None:
+            parse_tasks = set()
+            try:
+                for name, open_entry in entries:
+                    name = name.replace("\\", "/")
+                    item = {"result": {
+                        "name": name, "status": None, "document_id": None,
+                        "job_id": None, "chunk_count": None, "error": None,
+                    }}
+                    status["files"].append(item["result"])
+                    if name in seen_names:
+                        reason = "与本批中的其它文件同名"
+                    else:
+                        reason = check_entry_name_lyl(name)
+                    if reason is not None:
+                        self._finish_file_lyl(status, item, FILE_SKIPPED_LYL, error=reason)
+                        status["processed"] += 1
+                        continue
+                    seen_names.add(name)
+                    if await self._admit_lyl(status, item, open_entry, seen_hashes, duplicates, stored):
+                        await slots.acquire()
+                        pending.append(item)
+                        task = asyncio.create_task(parse_file_lyl(item))
+                        parse_tasks.add(task)
+                        task.add_done_callback(parse_tasks.discard)
+                    else:
+                        status["processed"] += 1
+                await asyncio.gather(*parse_tasks)
+            finally:
+                for task in parse_tasks:
+                    task.cancel()
+                await asyncio.gather(*parse_tasks, return_exceptions=True)
+            await parsed.put(None)
+
+        async def embed_lyl(buffer: List[Tuple[Dict[str, Any], Any]]) -> None:
+            items = [(item, chunk) for item, chunk in buffer if item["result"]["status"] is None]
+            if not items:
+                return
+            try:
+                embeddings = await embedding_service.embed_texts_lyl(
+                    [chunk.page_content for _, chunk in items]
+                )
+            except Exception as e:
+                for item in {id(item): item for item, _ in items}.values():
+                    self._finish_file_lyl(status, item, FILE_FAILED_LYL, error=f"嵌入失败: {e}")
+                return
+            for (item, _), embedding in zip(items, embeddings):
+                item["vectors"].append(embedding)
+
+        async def embed_stage_lyl() -> None:
+            buffer: List[Tuple[Dict[str, Any], Any]] = []
+            while (entry := await parsed.get()) is not None:
+                item, chunks = entry
+                item["chunks"], item["vectors"] = chunks, []
+                buffer.extend((item, chunk) for chunk in chunks)
+                while len(buffer) >= batch_size:
+                    await embed_lyl(buffer[:batch_size])
+                    buffer = buffer[batch_size:]
+            await embed_lyl(buffer)
+
+        try:
+            await run_stages_lyl(store_stage_lyl(), embed_stage_lyl())
+            ready = [item for item in pending if item["result"]["status"] is None]
+            await self._commit_lyl(status, ready)
+            for item, original in duplicates:
+                item["result"]["document_id"] = original["result"]["document_id"]
+        finally:
+            # 未入库的副本不留在文档目录中
+            committed = {
+                item["path"] for item in pending
+                if item["result"]["status"] == FILE_CREATED_LYL
+            }
+            for path in stored:
+                if path not in committed:
+                    await document_service.delete_file_lyl(path)
+
+    async def _admit_lyl(
+        self, status: Dict[str, Any], item: Dict[str, Any], open_entry: Callable[[], BinaryIO],
+        seen_hashes: Dict[str, Dict[str, Any]],
+        duplicates: List[Tuple[Dict[str, Any], Dict[str, Any]]], stored: List[str]
+    ) -> bool:
+        """保存条目并去重，需要解析时返回True_lyl
+
+        同内容的文件只入库一份；批次要求修订已有文档时，
+        与已有文档同名的文件交给入库任务队列按修订版增量更新。
+        """
+        name = item["result"]["name"]
+
+        def store_lyl() -> Tuple[str, int, str]:
+            with open_entry() as source:
+                return document_service.store_stream_lyl(name, source)
+
+        try:
+            file_path, file_size, content_hash = await asyncio.to_thread(store_lyl)
+        except Exception as e:
+            self._finish_file_lyl(status, item, FILE_FAILED_LYL, error=f"保存失败: {e}")
+            return False
+
+        original = seen_hashes.get(content_hash)
+        if original is not None:
+            stored.append(file_path)
+            self._finish_file_lyl(
+                status, item, FILE_DUPLICATE_LYL, error=f"与 {original['result']['name']} 内容相同"
+            )
+            duplicates.append((item, original))
+            return False
+        duplicate = await document_service.find_document_by_hash_lyl(content_hash)
+        if duplicate is not None:
+            stored.append(file_path)
+            self._finish_file_lyl(status, item, FILE_DUPLICATE_LYL, document_id=duplicate["id"])
+            return False
+
+        if status["revise_existing"]:
+            previous = await document_service.find_document_by_filename_lyl(name)
+            if previous is not None:
+                job_id = await ingestion_service.enqueue_lyl(
+                    name, file_path, file_size, content_hash, target_document_id=previous["id"]
+                )
+                self._finish_file_lyl(status, item, FILE_QUEUED_LYL, job_id=job_id)
+                return False
+
+        stored.append(file_path)
+        seen_hashes[content_hash] = item
+        item.update(path=file_path, size=file_size, hash=content_hash)
+        return True
+
+    async def _commit_lyl(self, status: Dict[str, Any], items: List[Dict[str, Any]]) -> None:
+        """创建文档记录并一次写入全部向量_lyl - 失败时撤销本批创建的全部文档"""
+        if not items:
+            return
+        doc_ids: List[int] = []
+        try:
+            for item in items:
+                doc_ids.append(await document_service.add_document_record_lyl(
+                    filename=item["result"]["name"],
+                    file_type=os.path.splitext(item["result"]["name"])[1].lower(),
+                    file_path=item["path"],
+                    file_size=item["size"],
+                    chunk_count=0,
+                    content_hash=item["hash"]
+                ))
+            batches = [(doc_id, item["chunks"]) for doc_id, item in zip(doc_ids, items)]
+            embeddings = [vector for item in items for vector in item["vectors"]]
+            batch_ids = await vector_store_service.append_embedded_batch_lyl(batches, embeddings)
+            for doc_id, item, chunk_ids in zip(doc_ids, items, batch_ids):
+                await document_service.index_chunks_text_lyl(chunk_ids, item["chunks"])
+                await document_service.save_text_cache_lyl(doc_id, item["hash"], item["text_cache"])
+                await document_service.set_chunk_count_lyl(doc_id, len(chunk_ids))
+        except BaseException as e:
+            # 被取消时同样撤销，不留下没有向量的文档记录
+            for doc_id in doc_ids:
+                await vector_store_service.delete_by_document_lyl(doc_id)
+                await document_service.delete_document_record_lyl(doc_id)
+            for item in items:
+                self._finish_file_lyl(status, item, FILE_FAILED_LYL, error=f"写入索引失败: {e}")
+            raise
+        for doc_id, item in zip(doc_ids, items):
+            self._finish_file_lyl(
+                status, item, FILE_CREATED_LYL, document_id=doc_id, chunk_count=len(item["chunks"])
+            )
+        log_lyl.success(
+            f"批量入库: {len(items)} 个文档、{len(embeddings)} 个分块已写入索引"
+        )
+
+    async def close_lyl(self) -> None:
+        """取消进行中的批次_lyl - 已保存但未提交的文件随之删除"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# 全局实例
+bulk_ingest_service = BulkIngestService_lyl()
@@ -0,0 +1,110 @@
+"""
+向量降维模块 - 写入与检索前把嵌入向量降到较低维度，减少内存与检索开销
+
+    none      不降维
+    truncate  保留前dim维后重新归一化（适用于BGE-M3等Matryoshka式训练的模型）
+    pca       用语料向量训练的PCA投影到dim维后重新归一化
+
+降维方式与参数记录在manifest中，PCA投影矩阵保存在向量存储目录下，
+同一份存储的写入与检索始终使用同一个降维器。分段中只保存降维后的向量，
+更改降维配置需要以重新嵌入方式重建索引（POST /knowledge/index/rebuild, reembed=true）。
+"""
+import io
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import faiss
+import numpy as np
+
+REDUCTION_NONE_LYL = "none"
+REDUCTION_TRUNCATE_LYL = "truncate"
+REDUCTION_PCA_LYL = "pca"
+REDUCTIONS_LYL = (REDUCTION_NONE_LYL, REDUCTION_TRUNCATE_LYL, REDUCTION_PCA_LYL)
+
+
+def normalize_rows_lyl(vectors: np.ndarray) -> np.ndarray:
+    """按行L2归一化_lyl - 零向量保持不变"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class DimensionReducer_lyl:
+    """向量降维器_lyl"""
+
+    def __init__(
+        self,
+        method: str = REDUCTION_NONE_LYL,
+        dim: int = 0,
+        matrix: Optional[np.ndarray] = None,
+        bias: Optional[np.ndarray] = None,
+    ):
+        """初始化降维器_lyl - PCA须提供投影矩阵 (dim, 输入维度) 与偏置 (dim,)"""
+        if method not in REDUCTIONS_LYL:
+            raise ValueError(f"不支持的降维方式: {method}，可选: {', '.join(REDUCTIONS_LYL)}")
+        if method == REDUCTION_PCA_LYL and matrix is None:
+            raise ValueError("PCA降维器缺少投影矩阵")
+        self.method = method
+        self.dim = dim if method != REDUCTION_NONE_LYL else 0
+        self.matrix = matrix
+        self.bias = bias
+
+    @property
+    def is_identity(self) -> bool:
+        """是否不降维_lyl"""
+        return self.method == REDUCTION_NONE_LYL
+
+    def apply_lyl(self, vectors: np.ndarray) -> np.ndarray:
+        """降维并重新归一化_lyl - 输入为 (n, 原始维度) 的float32矩阵"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.method == REDUCTION_NONE_LYL:
+            return vectors
+        if self.method == REDUCTION_TRUNCATE_LYL:
+            if vectors.shape[1] < self.dim:
+                raise ValueError(f"向量维度 {vectors.shape[1]} 小于截断维度 {self.dim}")
+            reduced = vectors[:, :self.dim]
+        else:
+            if vectors.shape[1] != self.matrix.shape[1]:
+                raise ValueError(
+                    f"向量维度 {vectors.shape[1]} 与PCA输入维度 {self.matrix.shape[1]} 不一致"
+                )
+            reduced = vectors @ self.matrix.T + self.bias
+        return np.ascontiguousarray(normalize_rows_lyl(reduced), dtype=np.float32)
+
+    def describe_lyl(self) -> Dict[str, Any]:
+        """降维方式与输出维度_lyl"""
+        return {"method": self.method, "dim": self.dim}
+
+    def matches_lyl(self, method: str, dim: int) -> bool:
+        """是否与给定配置一致_lyl"""
+        if method == REDUCTION_NONE_LYL:
+            return self.is_identity
+        return self.method == method and self.dim == dim
+
+    def to_bytes_lyl(self) -> bytes:
+        """序列化PCA参数为.npz字节_lyl"""
+        buffer = io.BytesIO()
+        np.savez(buffer, matrix=self.matrix, bias=self.bias)
+        return buffer.getvalue()
+
+    @classmethod
+    def load_lyl(cls, method: str, dim: int, path: Optional[Path]) -> "DimensionReducer_lyl":
+        """按manifest记录构建降维器_lyl - PCA从path读取参数"""
+        if method != REDUCTION_PCA_LYL:
+            return cls(method, dim)
+        with np.load(path) as data:
+            return cls(method, dim, data["matrix"], data["bias"])
+
+
+def train_pca_lyl(vectors: np.ndarray, dim: int, sample_size: int) -> DimensionReducer_lyl:
+    """在（抽样后的）语料向量上训练PCA降维器_lyl"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dim >= vectors.shape[1]:
+        raise ValueError(f"PCA输出维度 {dim} 须小于输入维度 {vectors.shape[1]}")
+    if len(vectors) > sample_size:
+        rows = np.random.default_rng(0).choice(len(vectors), sample_size, replace=False)
+        vectors = vectors[np.sort(rows)]
+    pca = faiss.PCAMatrix(vectors.shape[1], dim)
+    pca.train(np.ascontiguousarray(vectors))
+    matrix = faiss.vector_to_array(pca.A).reshape(dim, vectors.shape[1])
+    bias = faiss.vector_to_array(pca.b)
+    return DimensionReducer_lyl(REDUCTION_PCA_LYL, dim, matrix, bias)
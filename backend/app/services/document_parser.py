@@ -0,0 +1,328 @@
+"""
+文档解析模块 - 在独立进程池中加载并分割文档，解析期间不阻塞事件循环
+
+PyPDFLoader 与 unstructured 的解析是纯CPU计算且持有GIL，放在线程中同样会拖慢对话的流式输出，
+因此在 ProcessPoolExecutor 中执行，进程数默认等于CPU核数（PARSE_WORKERS）。
+页数超过 PARSE_PDF_PAGES_PER_TASK 的PDF按页区间拆成多个任务并行解析，再按页序拼接；
+分割器对每页独立切分，拆分与否得到的分块相同。
+分割器由 TEXT_SPLITTER 选择：recursive（langchain RecursiveCharacterTextSplitter）
+或 sentence（单遍扫描的中英文句子感知分割器，见 text_splitter），参数随任务传给子进程。
+
+iter_chunks_lyl 按页序逐个产出各任务的页面与分块，供入库流水线边解析边嵌入、写入索引；
+页面文本经规范化后写入提取文本缓存（见 text_cache），重新分块时由 iter_split_lyl 直接切分缓存的页面。
+
+每个解析任务（整个文件或一个页区间）受 PARSE_TIMEOUT_SECONDS 限制。已在子进程中运行的任务无法单独取消，
+超时后终止整个进程池并重建，同一时刻在该进程池中解析的其它任务会在新进程池中重试一次。
+进程池使用spawn方式启动，子进程只导入本模块，不继承父进程的事件循环、数据库连接与FAISS线程。
+
+本模块的顶层函数会在子进程中执行，不依赖配置与全局服务实例。
+"""
+import asyncio
+import itertools
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import aclosing
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple
+
+from langchain_community.document_loaders import (
+    TextLoader,
+    PyPDFLoader,
+    Docx2txtLoader,
+    UnstructuredMarkdownLoader,
+)
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter, TextSplitter
+
+from backend.app.services.text_cache import normalize_text_lyl
+from backend.app.services.text_splitter import (
+    UNIT_CHARS_LYL,
+    SentenceTextSplitter_lyl,
+    estimate_tokens_lyl,
+)
+
+# 文本分割器参数
+SPLITTER_RECURSIVE_LYL = "recursive"
+SPLITTER_SENTENCE_LYL = "sentence"
+SPLITTERS_LYL = (SPLITTER_RECURSIVE_LYL, SPLITTER_SENTENCE_LYL)
+CHUNK_SIZE_LYL = 500
+CHUNK_OVERLAP_LYL = 50
+SEPARATORS_LYL = ["\n\n", "\n", "。", "！", "？", ".", "!", "?", " ", ""]
+DEFAULT_SPLITTER_OPTIONS_LYL = {
+    "kind": SPLITTER_RECURSIVE_LYL,
+    "unit": UNIT_CHARS_LYL,
+    "chunk_size": CHUNK_SIZE_LYL,
+    "chunk_overlap": CHUNK_OVERLAP_LYL,
+}
+
+LOADERS_LYL = {
+    ".txt": TextLoader,
+    ".pdf": PyPDFLoader,
+    ".docx": Docx2txtLoader,
+    ".doc": Docx2txtLoader,
+    ".md": UnstructuredMarkdownLoader,
+}
+
+# 子进程内按分割参数复用的分割器
+_splitters_lyl: Dict[Tuple, TextSplitter] = {}
+
+
+class ParseTimeoutError_lyl(Exception):
+    """文档解析超时_lyl"""
+
+
+def create_text_splitter_lyl(options: Optional[Dict[str, Any]] = None) -> TextSplitter:
+    """按分割参数创建文本分割器_lyl - options含kind/unit/chunk_size/chunk_overlap"""
+    options = {**DEFAULT_SPLITTER_OPTIONS_LYL, **(options or {})}
+    if options["kind"] == SPLITTER_SENTENCE_LYL:
+        return SentenceTextSplitter_lyl(
+            chunk_size=options["chunk_size"],
+            chunk_overlap=options["chunk_overlap"],
+            unit=options["unit"],
+        )
+    if options["kind"] != SPLITTER_RECURSIVE_LYL:
+        raise ValueError(f"不支持的文本分割器: {options['kind']}，可选: {', '.join(SPLITTERS_LYL)}")
+    return RecursiveCharacterTextSplitter(
+        chunk_size=options["chunk_size"],
+        chunk_overlap=options["chunk_overlap"],
+        length_function=len if options["unit"] == UNIT_CHARS_LYL else estimate_tokens_lyl,
+        separators=SEPARATORS_LYL,
+    )
+
+
+def get_loader_lyl(file_path: str) -> Optional[Any]:
+    """根据文件类型获取对应的加载器_lyl"""
+    file_ext = Path(file_path).suffix.lower()
+    loader_class = LOADERS_LYL.get(file_ext)
+    if loader_class:
+        try:
+            return loader_class(file_path, encoding="utf-8") if file_ext == ".txt" else loader_class(file_path)
+        except Exception:
+            return loader_class(file_path)
+    return None
+
+
+def normalize_pages_lyl(pages: List[Document]) -> List[Document]:
+    """规范化页面文本_lyl - 缓存与分块都基于规范化后的文本"""
+    for page in pages:
+        page.page_content = normalize_text_lyl(page.page_content)
+    return pages
+
+
+def split_lyl(documents: List[Document], options: Optional[Dict[str, Any]] = None) -> List[Document]:
+    """分割文档_lyl"""
+    key = tuple(sorted((options or {}).items()))
+    if key not in _splitters_lyl:
+        _splitters_lyl[key] = create_text_splitter_lyl(options)
+    return _splitters_lyl[key].split_documents(documents)
+
+
+def load_and_split_lyl(
+    file_path: str, options: Optional[Dict[str, Any]] = None
+) -> Tuple[List[Document], List[Document]]:
+    """加载并分割整个文件，返回 (页面, 分块)_lyl - 在子进程中执行"""
+    loader = get_loader_lyl(file_path)
+    if not loader:
+        raise ValueError(f"不支持的文件类型: {Path(file_path).suffix}")
+    pages = normalize_pages_lyl(loader.load())
+    return pages, split_lyl(pages, options)
+
+
+def count_pdf_pages_lyl(file_path: str) -> int:
+    """PDF页数_lyl - 在子进程中执行"""
+    import pypdf
+
+    return len(pypdf.PdfReader(file_path).pages)
+
+
+def load_and_split_pdf_pages_lyl(
+    file_path: str, start: int, end: int, options: Optional[Dict[str, Any]] = None
+) -> Tuple[List[Document], List[Document]]:
+    """加载并分割PDF的 [start, end) 页，返回 (页面, 分块)_lyl - 在子进程中执行
+
+    页面文本与元数据（source、total_pages、page、page_label）与 PyPDFLoader 的逐页输出一致。
+    """
+    import pypdf
+
+    reader = pypdf.PdfReader(file_path)
+    total_pages = len(reader.pages)
+    documents = [
+        Document(
+            page_content=reader.pages[number].extract_text(extraction_mode="plain").strip(),
+            metadata={
+                "source": file_path,
+                "total_pages": total_pages,
+                "page": number,
+                "page_label": reader.page_labels[number],
+            },
+        )
+        for number in range(start, min(end, total_pages))
+    ]
+    pages = normalize_pages_lyl(documents)
+    return pages, split_lyl(pages, options)
+
+
+def split_pages_lyl(
+    pages: List[Document], options: Optional[Dict[str, Any]] = None
+) -> Tuple[List[Document], List[Document]]:
+    """分割缓存中已提取的页面，返回 (页面, 分块)_lyl - 在子进程中执行"""
+    return pages, split_lyl(pages, options)
+
+
+def page_ranges_lyl(total_pages: int, pages_per_task: int) -> List[Tuple[int, int]]:
+    """把页码切分为连续区间_lyl"""
+    return [
+        (start, min(start + pages_per_task, total_pages))
+        for start in range(0, total_pages, pages_per_task)
+    ]
+
+
+class DocumentParser_lyl:
+    """进程池文档解析器_lyl"""
+
+    def __init__(
+        self, workers: int, timeout: float, pdf_pages_per_task: int,
+        splitter_options: Optional[Dict[str, Any]] = None
+    ):
+        """初始化解析器_lyl - workers为0时取CPU核数，进程池在首次解析时创建
+
+        splitter_options随每个任务传给子进程，见 create_text_splitter_lyl。
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.pdf_pages_per_task = pdf_pages_per_task
+        self.splitter_options = {**DEFAULT_SPLITTER_OPTIONS_LYL, **(splitter_options or {})}
+        # 在主进程中先创建一次，分割参数有误时启动即报错
+        create_text_splitter_lyl(self.splitter_options)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.parsed = 0
+        self.timeouts = 0
+
+    def _get_pool_lyl(self) -> ProcessPoolExecutor:
+        """获取进程池_lyl"""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def _reset_pool_lyl(self, pool: ProcessPoolExecutor, wait: bool = False) -> None:
+        """终止进程池中的全部子进程，下次解析时重建_lyl"""
+        if self._pool is not pool:
+            return
+        self._pool = None
+        # ProcessPoolExecutor没有终止运行中任务的接口，只能直接结束子进程
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=wait, cancel_futures=True)
+
+    async def _run_lyl(self, file_path: str, func: Callable[..., Any], *args: Any) -> Any:
+        """在进程池中执行一个解析任务_lyl - 超时抛出 ParseTimeoutError_lyl"""
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            pool = self._get_pool_lyl()
+            try:
+                return await asyncio.wait_for(
+                    loop.run_in_executor(pool, func, *args), self.timeout
+                )
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                self._reset_pool_lyl(pool)
+                raise ParseTimeoutError_lyl(
+                    f"解析超时（{self.timeout:g} 秒）: {Path(file_path).name}"
+                ) from None
+            except BrokenProcessPool:
+                # 进程池因其它文件超时被终止，或子进程异常退出，在新进程池中重试一次
+                self._reset_pool_lyl(pool)
+                if attempt:
+                    raise
+
+    async def _plan_lyl(self, file_path: str) -> List[Tuple[Callable[..., Any], tuple]]:
+        """把文件拆分为按页序排列的解析任务_lyl - 大PDF按页区间拆分，其它文件整体解析"""
+        if Path(file_path).suffix.lower() == ".pdf":
+            total_pages = await self._run_lyl(file_path, count_pdf_pages_lyl, file_path)
+            if total_pages > self.pdf_pages_per_task:
+                return [
+                    (load_and_split_pdf_pages_lyl, (file_path, start, end, self.splitter_options))
+                    for start, end in page_ranges_lyl(total_pages, self.pdf_pages_per_task)
+                ]
+        return [(load_and_split_lyl, (file_path, self.splitter_options))]
+
+    async def _iter_tasks_lyl(
+        self, file_path: str, plan: List[Tuple[Callable[..., Any], tuple]], prefetch: int
+    ) -> AsyncIterator[Tuple[Any, int, int]]:
+        """按顺序逐个产出解析任务的结果_lyl - 产出 (任务结果, 已完成任务数, 总任务数)
+
+        最多提前执行 prefetch 个任务，消费方处理不过来时解析随之暂停，
+        内存中的分块数与文件总长度无关。
+        """
+        pending: Deque[asyncio.Task] = deque()
+        tasks = iter(plan)
+
+        def schedule_lyl() -> None:
+            for func, args in itertools.islice(tasks, max(1, prefetch) - len(pending)):
+                pending.append(asyncio.ensure_future(self._run_lyl(file_path, func, *args)))
+
+        try:
+            schedule_lyl()
+            done = 0
+            while pending:
+                result = await pending.popleft()
+                done += 1
+                schedule_lyl()
+                yield result, done, len(plan)
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def iter_chunks_lyl(
+        self, file_path: str, prefetch: int = 1
+    ) -> AsyncIterator[Tuple[List[Document], List[Document], int, int]]:
+        """按页序逐批解析文件_lyl - 产出 (本批页面, 本批分块, 已完成任务数, 总任务数)"""
+        plan = await self._plan_lyl(file_path)
+        async with aclosing(self._iter_tasks_lyl(file_path, plan, prefetch)) as results:
+            async for (pages, chunks), done, total in results:
+                yield pages, chunks, done, total
+        self.parsed += 1
+
+    async def iter_split_lyl(
+        self, file_path: str, pages: List[Document], prefetch: int = 1
+    ) -> AsyncIterator[Tuple[List[Document], int, int]]:
+        """按页序逐批切分已提取的页面_lyl - 产出 (本批分块, 已完成任务数, 总任务数)
+
+        与解析一样每 pdf_pages_per_task 页一个任务，分块与重新解析得到的相同。
+        """
+        plan = [
+            (split_pages_lyl, (pages[start:end], self.splitter_options))
+            for start, end in page_ranges_lyl(len(pages), self.pdf_pages_per_task)
+        ]
+        async with aclosing(self._iter_tasks_lyl(file_path, plan, prefetch)) as results:
+            async for (_, chunks), done, total in results:
+                yield chunks, done, total
+
+    async def load_and_split_lyl(self, file_path: str) -> Tuple[List[Document], List[Document]]:
+        """加载并分割整个文档，返回 (页面, 分块)_lyl - 超时抛出 ParseTimeoutError_lyl"""
+        pages: List[Document] = []
+        chunks: List[Document] = []
+        async with aclosing(self.iter_chunks_lyl(file_path, prefetch=self.workers)) as parts:
+            async for part_pages, part_chunks, _, _ in parts:
+                pages.extend(part_pages)
+                chunks.extend(part_chunks)
+        return pages, chunks
+
+    def stats_lyl(self) -> dict:
+        """解析统计_lyl"""
+        return {
+            "workers": self.workers,
+            "parsed": self.parsed,
+            "timeouts": self.timeouts,
+        }
+
+    def close_lyl(self) -> None:
+        """关闭进程池_lyl - 仍在解析的子进程直接终止，对应任务下次启动时重新执行"""
+        if self._pool is not None:
+            self._reset_pool_lyl(self._pool, wait=True)
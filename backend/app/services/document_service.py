@@ -1,23 +1,65 @@
 """
 文档处理服务模块 - 处理文档的加载、分割和存储
+
+分块入库后同时写入 chunks_fts 全文索引（rowid即分块ID），供混合检索的全文一路使用。
+解析出的逐页文本压缩保存在 document_texts 表中（见 text_cache），按文件内容哈希判断是否仍有效，
+重新分块时直接切分缓存的文本，不再解析原文件。
 """
+import asyncio
+import hashlib
+import itertools
+import json
 import os
 import shutil
+from contextlib import aclosing
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+from typing import AsyncIterator, BinaryIO, List, Optional, Dict, Any, Tuple
 from datetime import datetime
 
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import (
-    TextLoader,
-    PyPDFLoader,
-    Docx2txtLoader,
-    UnstructuredMarkdownLoader,
-)
 from langchain_core.documents import Document
+from fastapi import UploadFile
 
 from backend.app.core.config import settings
+from backend.app.core.logger import log_lyl
 from backend.app.database.database import db_manager
+from backend.app.models.schemas import SearchFilter_lyl
+from backend.app.services.document_parser import (
+    LOADERS_LYL,
+    DocumentParser_lyl,
+    create_text_splitter_lyl,
+    get_loader_lyl,
+)
+from backend.app.services.lexical_tokenizer import index_text_lyl, match_query_lyl
+from backend.app.services.search_filter import filter_conditions_lyl
+from backend.app.services.text_cache import (
+    TextCacheError_lyl,
+    TextCacheWriter_lyl,
+    decode_text_cache_lyl,
+)
+
+# 回填全文索引时每批处理的分块数
+FTS_BACKFILL_BATCH_LYL = 500
+
+
+class UploadTooLargeError_lyl(Exception):
+    """上传文件超过大小限制_lyl"""
+
+
+def content_hash_lyl(text: str) -> str:
+    """分块文本的SHA-256_lyl - 用于修订版文档与已有分块比对"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def write_chunk_lyl(file: BinaryIO, hasher: "hashlib._Hash", chunk: bytes) -> None:
+    """写入一块数据并更新哈希_lyl - 在工作线程中调用"""
+    file.write(chunk)
+    hasher.update(chunk)
+
+
+def discard_partial_lyl(file: BinaryIO, path: Path) -> None:
+    """关闭并删除写了一半的文件_lyl"""
+    file.close()
+    path.unlink(missing_ok=True)
 
 
 class DocumentService_lyl:
@@ -28,42 +70,38 @@ class DocumentService_lyl:
         self.documents_path = Path(settings.DOCUMENTS_PATH)
         self.documents_path.mkdir(parents=True, exist_ok=True)
         
-        # 文本分割器配置
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500,
-            chunk_overlap=50,
-            length_function=len,
-            separators=["\n\n", "\n", "。", "！", "？", ".", "!", "?", " ", ""]
+        # 文本分割器配置（解析在子进程中进行，见 document_parser）
+        splitter_options = {
+            "kind": settings.TEXT_SPLITTER,
+            "unit": settings.TEXT_SPLITTER_UNIT,
+            "chunk_size": settings.TEXT_CHUNK_SIZE,
+            "chunk_overlap": settings.TEXT_CHUNK_OVERLAP,
+        }
+        self.text_splitter = create_text_splitter_lyl(splitter_options)
+        self.parser = DocumentParser_lyl(
+            workers=settings.PARSE_WORKERS,
+            timeout=settings.PARSE_TIMEOUT_SECONDS,
+            pdf_pages_per_task=settings.PARSE_PDF_PAGES_PER_TASK,
+            splitter_options=splitter_options,
         )
     
     def get_loader_lyl(self, file_path: str) -> Optional[Any]:
         """根据文件类型获取对应的加载器_lyl"""
-        file_ext = Path(file_path).suffix.lower()
-        
-        loaders = {
-            ".txt": TextLoader,
-            ".pdf": PyPDFLoader,
-            ".docx": Docx2txtLoader,
-            ".doc": Docx2txtLoader,
-            ".md": UnstructuredMarkdownLoader,
-        }
-        
-        loader_class = loaders.get(file_ext)
-        if loader_class:
-            try:
-                return loader_class(file_path, encoding="utf-8") if file_ext == ".txt" else loader_class(file_path)
-            except Exception:
-                return loader_class(file_path)
-        return None
-    
-    async def load_and_split_document_lyl(self, file_path: str) -> List[Document]:
-        """加载并分割文档_lyl"""
-        loader = self.get_loader_lyl(file_path)
-        if not loader:
+        return get_loader_lyl(file_path)
+    
+    async def load_and_split_document_lyl(
+        self, file_path: str, cache: Optional[TextCacheWriter_lyl] = None
+    ) -> List[Document]:
+        """加载并分割文档_lyl - 在进程池中解析，超时抛出 ParseTimeoutError_lyl
+
+        传入cache时把解析出的页面写入提取文本缓存。
+        """
+        if Path(file_path).suffix.lower() not in LOADERS_LYL:
             raise ValueError(f"不支持的文件类型: {Path(file_path).suffix}")
         
-        documents = loader.load()
-        chunks = self.text_splitter.split_documents(documents)
+        pages, chunks = await self.parser.load_and_split_lyl(file_path)
+        if cache is not None:
+            await asyncio.to_thread(cache.add_pages_lyl, pages)
         
         # 为每个chunk添加元数据
         for i, chunk in enumerate(chunks):
@@ -72,17 +110,123 @@ class DocumentService_lyl:
         
         return chunks
     
-    async def save_uploaded_file_lyl(self, filename: str, content: bytes) -> str:
-        """保存上传的文件_lyl"""
-        # 生成唯一文件名
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        safe_filename = f"{timestamp}_{filename}"
-        file_path = self.documents_path / safe_filename
-        
-        with open(file_path, "wb") as f:
-            f.write(content)
+    async def iter_document_chunks_lyl(
+        self, file_path: str, prefetch: int = 1, cache: Optional[TextCacheWriter_lyl] = None
+    ) -> AsyncIterator[Tuple[List[Document], float]]:
+        """按页序逐批加载并分割文档_lyl - 产出 (本批分块, 已解析比例)
+
+        chunk_index在整个文档内连续编号，与 load_and_split_document_lyl 的结果一致；
+        传入cache时把解析出的页面写入提取文本缓存。
+        """
+        if Path(file_path).suffix.lower() not in LOADERS_LYL:
+            raise ValueError(f"不支持的文件类型: {Path(file_path).suffix}")
         
-        return str(file_path)
+        chunk_index = 0
+        async with aclosing(self.parser.iter_chunks_lyl(file_path, prefetch)) as parts:
+            async for pages, chunks, done, total in parts:
+                if cache is not None:
+                    await asyncio.to_thread(cache.add_pages_lyl, pages)
+                chunk_index = self._number_chunks_lyl(file_path, chunks, chunk_index)
+                yield chunks, done / total
+    
+    async def iter_cached_chunks_lyl(
+        self, file_path: str, pages: List[Document], prefetch: int = 1
+    ) -> AsyncIterator[Tuple[List[Document], float]]:
+        """按页序逐批切分缓存的页面_lyl - 产出 (本批分块, 已切分比例)，与重新解析原文件的结果一致"""
+        chunk_index = 0
+        async with aclosing(self.parser.iter_split_lyl(file_path, pages, prefetch)) as parts:
+            async for chunks, done, total in parts:
+                chunk_index = self._number_chunks_lyl(file_path, chunks, chunk_index)
+                yield chunks, done / total
+    
+    @staticmethod
+    def _number_chunks_lyl(file_path: str, chunks: List[Document], start: int) -> int:
+        """为分块补充顺序号与来源文件名，返回下一个顺序号_lyl"""
+        for chunk in chunks:
+            chunk.metadata["chunk_index"] = start
+            chunk.metadata["source_file"] = Path(file_path).name
+            start += 1
+        return start
+    
+    def close_lyl(self) -> None:
+        """关闭解析进程池_lyl"""
+        self.parser.close_lyl()
+    
+    def _create_part_file_lyl(self, filename: str) -> Tuple[Path, BinaryIO]:
+        """选定不与已有文件重名的保存路径，并以独占方式创建其临时文件_lyl
+
+        同一秒内上传的同名文件（如修订版）加序号区分，不会覆盖仍被文档记录引用的原文件。
+        """
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # 批量入库时文件名是压缩包或目录内的相对路径，保存时把路径分隔符换成下划线
+        filename = filename.replace("/", "_").replace("\\", "_")
+        for n in itertools.count():
+            name = f"{timestamp}_{filename}" if n == 0 else f"{timestamp}_{n}_{filename}"
+            file_path = self.documents_path / name
+            if file_path.exists():
+                continue
+            try:
+                return file_path, open(file_path.with_name(name + ".part"), "xb")
+            except FileExistsError:
+                continue
+
+    async def save_upload_stream_lyl(
+        self, filename: str, upload: UploadFile, limit_mb: Optional[int] = None
+    ) -> Tuple[str, int, str]:
+        """把上传文件按块流式写入磁盘，返回 (文件路径, 字节数, SHA-256)_lyl
+
+        每次只读入 UPLOAD_CHUNK_SIZE_KB 大小的一块，写入与哈希计算在工作线程中进行，
+        内存占用与文件大小无关；累计超过 limit_mb（默认 MAX_UPLOAD_SIZE_MB）时立即中止并删除已写入的部分。
+        先写入临时文件，完成后再重命名，文档目录中不会出现写了一半的文件。
+        """
+        limit_mb = limit_mb or settings.MAX_UPLOAD_SIZE_MB
+        file_path, part_file = await asyncio.to_thread(self._create_part_file_lyl, filename)
+        part_path = file_path.with_name(file_path.name + ".part")
+        limit = limit_mb * 1024 * 1024
+        chunk_size = settings.UPLOAD_CHUNK_SIZE_KB * 1024
+        hasher = hashlib.sha256()
+        size = 0
+
+        try:
+            while chunk := await upload.read(chunk_size):
+                size += len(chunk)
+                if size > limit:
+                    raise UploadTooLargeError_lyl(f"文件超过大小限制 {limit_mb} MB")
+                await asyncio.to_thread(write_chunk_lyl, part_file, hasher, chunk)
+            await asyncio.to_thread(part_file.close)
+            await asyncio.to_thread(os.replace, part_path, file_path)
+        except BaseException:
+            await asyncio.to_thread(discard_partial_lyl, part_file, part_path)
+            raise
+        return str(file_path), size, hasher.hexdigest()
+    
+    def store_stream_lyl(self, filename: str, source: BinaryIO) -> Tuple[str, int, str]:
+        """把文件流按块复制到文档目录，返回 (文件路径, 字节数, SHA-256)_lyl - 同步执行，在工作线程中调用
+
+        批量入库时用于解压压缩包条目与复制本地文件；按实际读出的字节数计算大小，
+        超过 MAX_UPLOAD_SIZE_MB 时抛出 UploadTooLargeError_lyl，不依赖压缩包声明的大小。
+        """
+        file_path, part_file = self._create_part_file_lyl(filename)
+        part_path = file_path.with_name(file_path.name + ".part")
+        limit = settings.MAX_UPLOAD_SIZE_MB * 1024 * 1024
+        chunk_size = settings.UPLOAD_CHUNK_SIZE_KB * 1024
+        hasher = hashlib.sha256()
+        size = 0
+
+        try:
+            while chunk := source.read(chunk_size):
+                size += len(chunk)
+                if size > limit:
+                    raise UploadTooLargeError_lyl(
+                        f"文件超过大小限制 {settings.MAX_UPLOAD_SIZE_MB} MB"
+                    )
+                write_chunk_lyl(part_file, hasher, chunk)
+            part_file.close()
+            os.replace(part_path, file_path)
+        except BaseException:
+            discard_partial_lyl(part_file, part_path)
+            raise
+        return str(file_path), size, hasher.hexdigest()
     
     async def delete_file_lyl(self, file_path: str) -> bool:
         """删除文件_lyl"""
@@ -106,21 +250,226 @@ class DocumentService_lyl:
             "SELECT * FROM documents WHERE id = ?", (doc_id,)
         )
     
+    async def get_document_chunks_lyl(self, doc_id: int) -> List[Dict[str, Any]]:
+        """按顺序获取文档的全部分块_lyl"""
+        chunks = await db_manager.fetch_all_lyl(
+            """SELECT id, chunk_index, content, metadata FROM chunks
+               WHERE document_id = ? ORDER BY chunk_index""",
+            (doc_id,)
+        )
+        for chunk in chunks:
+            chunk["metadata"] = json.loads(chunk["metadata"]) if chunk["metadata"] else {}
+        return chunks
+    
     async def add_document_record_lyl(
         self, filename: str, file_type: str, file_path: str, 
-        file_size: int, chunk_count: int
+        file_size: int, chunk_count: int, content_hash: Optional[str] = None
     ) -> int:
-        """添加文档记录_lyl"""
+        """添加文档记录_lyl - content_hash为文件内容的SHA-256"""
         cursor = await db_manager.execute_lyl(
-            """INSERT INTO documents (filename, file_type, file_path, file_size, chunk_count)
-               VALUES (?, ?, ?, ?, ?)""",
-            (filename, file_type, file_path, file_size, chunk_count)
+            """INSERT INTO documents (filename, file_type, file_path, file_size, chunk_count, content_hash)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            (filename, file_type, file_path, file_size, chunk_count, content_hash)
         )
         return cursor.lastrowid
     
+    async def find_document_by_hash_lyl(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """查找内容完全相同的文档_lyl"""
+        return await db_manager.fetch_one_lyl(
+            "SELECT * FROM documents WHERE content_hash = ? ORDER BY id LIMIT 1", (content_hash,)
+        )
+    
+    async def find_document_by_filename_lyl(self, filename: str) -> Optional[Dict[str, Any]]:
+        """查找同名文档的最新版本_lyl - 批量入库显式要求按文件名修订时使用"""
+        return await db_manager.fetch_one_lyl(
+            "SELECT * FROM documents WHERE filename = ? ORDER BY id DESC LIMIT 1", (filename,)
+        )
+    
+    async def get_chunk_hashes_lyl(self, doc_id: int) -> List[Tuple[int, str]]:
+        """文档全部分块的 (分块ID, 内容哈希)_lyl - 旧版分块没有记录哈希时按内容计算"""
+        rows = await db_manager.fetch_all_lyl(
+            "SELECT id, content, content_hash FROM chunks WHERE document_id = ? ORDER BY chunk_index",
+            (doc_id,)
+        )
+        return [
+            (row["id"], row["content_hash"] or content_hash_lyl(row["content"] or ""))
+            for row in rows
+        ]
+    
+    async def apply_revision_lyl(
+        self, doc_id: int, kept: List[Tuple[int, str, Dict[str, Any]]], stale_ids: List[int],
+        file_path: str, file_size: int, content_hash: str, chunk_count: int, job_id: int
+    ) -> None:
+        """在一个事务中提交文档修订_lyl
+
+        kept为沿用分块的 (分块ID, 内容哈希, 新元数据)，据此更新顺序号与元数据；
+        过期分块连同全文索引记录删除，文档记录指向新文件。
+        过期分块ID同时记入入库任务的 stale_chunk_ids，向量墓碑由调用方随后登记，
+        进程在两步之间退出时由任务恢复流程补登。
+        """
+        async with db_manager.transaction_lyl() as conn:
+            await conn.execute(
+                "UPDATE ingest_jobs SET stale_chunk_ids = ? WHERE id = ?",
+                (json.dumps(stale_ids), job_id)
+            )
+            await conn.executemany(
+                "UPDATE chunks SET chunk_index = ?, metadata = ?, content_hash = ? WHERE id = ?",
+                [
+                    (
+                        metadata["chunk_index"],
+                        json.dumps(
+                            {**metadata, "document_id": doc_id},
+                            ensure_ascii=False, default=str
+                        ),
+                        chunk_hash,
+                        chunk_id,
+                    )
+                    for chunk_id, chunk_hash, metadata in kept
+                ]
+            )
+            await self._delete_chunk_rows_lyl(conn, stale_ids)
+            await conn.execute(
+                """UPDATE documents SET file_path = ?, file_size = ?, content_hash = ?, chunk_count = ?
+                   WHERE id = ?""",
+                (file_path, file_size, content_hash, chunk_count, doc_id)
+            )
+    
+    async def find_document_by_path_lyl(self, file_path: str) -> Optional[Dict[str, Any]]:
+        """按保存路径查找文档_lyl - 每个文档的文件路径唯一"""
+        return await db_manager.fetch_one_lyl(
+            "SELECT * FROM documents WHERE file_path = ? ORDER BY id DESC LIMIT 1", (file_path,)
+        )
+    
+    async def count_chunks_lyl(self, doc_id: int) -> int:
+        """文档在chunks表中的分块行数_lyl"""
+        row = await db_manager.fetch_one_lyl(
+            "SELECT COUNT(*) AS count FROM chunks WHERE document_id = ?", (doc_id,)
+        )
+        return row["count"]
+    
+    async def save_text_cache_lyl(
+        self, doc_id: int, content_hash: Optional[str], cache: Dict[str, Any]
+    ) -> None:
+        """保存文档的提取文本缓存_lyl - cache为 TextCacheWriter_lyl.finish_lyl() 的结果
+
+        content_hash是产生该文本的文件内容哈希，文件被修订后旧缓存随之失效；没有哈希的旧文档不缓存。
+        """
+        if not content_hash:
+            return
+        await db_manager.execute_lyl(
+            """INSERT OR REPLACE INTO document_texts
+               (document_id, content_hash, text_hash, page_count, char_count, data)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            (doc_id, content_hash, cache["text_hash"], cache["page_count"],
+             cache["char_count"], cache["data"])
+        )
+    
+    async def load_text_cache_lyl(
+        self, doc_id: int, content_hash: Optional[str]
+    ) -> Optional[List[Document]]:
+        """读取文档的提取文本缓存_lyl - 没有缓存、缓存对应的不是该内容或已损坏时返回None"""
+        if not content_hash:
+            return None
+        row = await db_manager.fetch_one_lyl(
+            "SELECT text_hash, data FROM document_texts WHERE document_id = ? AND content_hash = ?",
+            (doc_id, content_hash)
+        )
+        if row is None:
+            return None
+        try:
+            return await asyncio.to_thread(decode_text_cache_lyl, row["data"], row["text_hash"])
+        except TextCacheError_lyl as e:
+            log_lyl.warning(f"文档 {doc_id} 的提取文本缓存损坏，将重新解析: {e}")
+            return None
+    
+    async def text_cache_stats_lyl(self) -> Dict[str, int]:
+        """提取文本缓存统计_lyl"""
+        row = await db_manager.fetch_one_lyl(
+            """SELECT COUNT(*) AS documents, COALESCE(SUM(char_count), 0) AS chars,
+                      COALESCE(SUM(LENGTH(data)), 0) AS bytes
+               FROM document_texts"""
+        )
+        return dict(row)
+    
+    async def set_chunk_count_lyl(self, doc_id: int, chunk_count: int) -> None:
+        """更新文档的分块数_lyl - 流式入库完成后写入"""
+        await db_manager.execute_lyl(
+            "UPDATE documents SET chunk_count = ? WHERE id = ?", (chunk_count, doc_id)
+        )
+    
+    async def delete_chunk_records_lyl(self, chunk_ids: List[int]) -> None:
+        """删除指定分块及其全文索引记录_lyl"""
+        async with db_manager.transaction_lyl() as conn:
+            await self._delete_chunk_rows_lyl(conn, chunk_ids)
+    
+    async def _delete_chunk_rows_lyl(self, conn: Any, chunk_ids: List[int]) -> None:
+        """在给定事务中删除分块及其全文索引记录_lyl"""
+        params = [(chunk_id,) for chunk_id in chunk_ids]
+        await conn.executemany("DELETE FROM chunks_fts WHERE rowid = ?", params)
+        await conn.executemany("DELETE FROM chunks WHERE id = ?", params)
+    
+    async def index_chunks_text_lyl(self, chunk_ids: List[int], chunks: List[Document]) -> None:
+        """把分块文本写入全文索引_lyl - chunk_ids与chunks一一对应"""
+        if not chunk_ids:
+            return
+        tokens = await asyncio.to_thread(
+            lambda: [index_text_lyl(chunk.page_content) for chunk in chunks]
+        )
+        async with db_manager.transaction_lyl() as conn:
+            await conn.executemany(
+                "INSERT OR REPLACE INTO chunks_fts (rowid, tokens) VALUES (?, ?)",
+                list(zip(chunk_ids, tokens))
+            )
+    
+    async def backfill_chunks_text_lyl(self) -> int:
+        """为尚未进入全文索引的分块补建索引，返回补建的分块数_lyl"""
+        total = 0
+        while True:
+            rows = await db_manager.fetch_all_lyl(
+                """SELECT id, content FROM chunks
+                   WHERE content IS NOT NULL AND id NOT IN (SELECT rowid FROM chunks_fts)
+                   ORDER BY id LIMIT ?""",
+                (FTS_BACKFILL_BATCH_LYL,)
+            )
+            if not rows:
+                return total
+            await self.index_chunks_text_lyl(
+                [row["id"] for row in rows],
+                [Document(page_content=row["content"]) for row in rows]
+            )
+            total += len(rows)
+    
+    async def search_chunks_text_lyl(
+        self, query: str, k: int, search_filter: Optional[SearchFilter_lyl] = None
+    ) -> List[Tuple[float, int]]:
+        """全文检索分块，返回按bm25升序的 (bm25, 分块ID)_lyl - bm25越小越相关"""
+        match = match_query_lyl(query)
+        if not match:
+            return []
+        where, params = "1", []
+        if search_filter is not None and not search_filter.is_empty():
+            where, params = filter_conditions_lyl(search_filter)
+        rows = await db_manager.fetch_all_lyl(
+            f"""SELECT chunks_fts.rowid AS id, bm25(chunks_fts) AS rank
+                FROM chunks_fts
+                JOIN chunks c ON c.id = chunks_fts.rowid
+                JOIN documents d ON d.id = c.document_id
+                WHERE chunks_fts MATCH ? AND {where}
+                ORDER BY rank LIMIT ?""",
+            (match, *params, k)
+        )
+        return [(row["rank"], row["id"]) for row in rows]
+    
     async def delete_document_record_lyl(self, doc_id: int) -> bool:
-        """删除文档记录_lyl"""
-        await db_manager.execute_lyl("DELETE FROM documents WHERE id = ?", (doc_id,))
+        """删除文档记录及其分块与全文索引记录_lyl"""
+        async with db_manager.transaction_lyl() as conn:
+            await conn.execute(
+                "DELETE FROM chunks_fts WHERE rowid IN (SELECT id FROM chunks WHERE document_id = ?)",
+                (doc_id,)
+            )
+            await conn.execute("DELETE FROM chunks WHERE document_id = ?", (doc_id,))
+            await conn.execute("DELETE FROM document_texts WHERE document_id = ?", (doc_id,))
+            await conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
         return True
 
 
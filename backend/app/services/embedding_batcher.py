@@ -0,0 +1,88 @@
+"""
+嵌入请求合并模块 - 把并发到达的查询合并为一次批量嵌入调用
+
+并发对话时每个请求各自嵌入一条查询，会产生大量只含一条文本的接口调用。
+这里收集一个短时间窗口内（或凑满批量上限前）到达的查询，合并为一次批量调用，
+再把结果分发给各个等待中的协程；同一批中重复的文本只发送一次。
+待发批次与定时器绑定在首次提交时的事件循环（即应用的事件循环，RAG工具为异步工具，检索都在其中进行），
+只在该循环中访问，无需加锁；从其它线程或事件循环提交的文本不参与合并，直接单独嵌入，
+不同循环的请求不会混入同一批次，等待方也不会在别的循环上被唤醒。
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+
+class EmbeddingBatcher_lyl:
+    """查询嵌入微批合并器_lyl"""
+
+    def __init__(
+        self,
+        embed: Callable[[List[str]], Awaitable[List[List[float]]]],
+        window_seconds: float,
+        max_batch: int,
+    ):
+        """初始化合并器_lyl - embed为批量嵌入函数"""
+        self._embed = embed
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # 持有进行中的批次任务，避免被垃圾回收
+        self._tasks: Set[asyncio.Task] = set()
+        # 首次提交时绑定的事件循环
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.batches = 0
+        self.texts = 0
+
+    async def submit_lyl(self, text: str) -> List[float]:
+        """提交一条文本并等待其所在批次返回向量_lyl"""
+        loop = asyncio.get_running_loop()
+        if self._loop is None or self._loop.is_closed():
+            # 原事件循环已关闭时，其中未发出的批次也随之作废
+            self._loop, self._pending, self._timer = loop, [], None
+        elif loop is not self._loop:
+            return (await self._embed([text]))[0]
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush_lyl()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_seconds, self._flush_lyl)
+        return await future
+
+    def _flush_lyl(self) -> None:
+        """把当前收集到的文本作为一个批次发出_lyl"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.create_task(self._run_batch_lyl(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch_lyl(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        """执行一次批量嵌入并把结果或异常分发给各等待方_lyl"""
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        self.batches += 1
+        self.texts += len(batch)
+        try:
+            vectors: Dict[str, List[float]] = dict(zip(texts, await self._embed(texts)))
+        except Exception as e:
+            for _, future in batch:
+                # 等待方可能已被取消
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for text, future in batch:
+            if not future.done():
+                future.set_result(vectors[text])
+
+    def stats_lyl(self) -> Dict[str, float]:
+        """合并统计_lyl - 平均每批文本数越大，节省的接口调用越多"""
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "avg_batch_size": round(self.texts / self.batches, 2) if self.batches else 0.0,
+        }
@@ -0,0 +1,219 @@
+"""
+嵌入缓存模块 - 以 (模型名, 规范化文本哈希) 为键缓存向量
+
+EmbeddingCache_lyl: 把分块向量持久化到本地SQLite文件。重复上传或修订后重新上传的文档中，
+未改动的分块直接取用缓存的向量，只有新分块调用嵌入接口。缓存与业务数据库分开存放，
+可随时删除；总大小超过上限时按最近使用时间淘汰。方法均为同步调用，由嵌入服务放到工作线程中执行。
+
+QueryEmbeddingCache_lyl: 进程内的查询向量LRU缓存，条目超过有效期后失效，
+用户重复提问时不再调用嵌入接口。读写由锁保护，可从工作线程中访问。
+"""
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+WHITESPACE_PATTERN_LYL = re.compile(r"\s+")
+
+# 超过上限时淘汰到上限的该比例，避免每次写入都触发淘汰
+EVICT_TARGET_RATIO_LYL = 0.9
+# 单条SQL中IN列表的最大参数数
+QUERY_BATCH_LYL = 500
+
+
+def normalize_text_lyl(text: str) -> str:
+    """规范化文本_lyl - 合并连续空白并去除首尾空白，排版差异不影响命中"""
+    return WHITESPACE_PATTERN_LYL.sub(" ", text).strip()
+
+
+def cache_key_lyl(model: str, text: str) -> bytes:
+    """缓存键_lyl - 模型名与规范化文本的SHA-256"""
+    return hashlib.sha256(f"{model}\0{normalize_text_lyl(text)}".encode("utf-8")).digest()
+
+
+class EmbeddingCache_lyl:
+    """磁盘嵌入缓存_lyl"""
+
+    def __init__(self, path: Path, max_bytes: int):
+        """初始化嵌入缓存_lyl - 数据库文件在首次使用时创建"""
+        self.path = path
+        self.max_bytes = max_bytes
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._size = 0
+        self._entries = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _connect_lyl(self) -> sqlite3.Connection:
+        """打开缓存数据库并统计当前大小_lyl - 调用方须持有锁"""
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(str(self.path), check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key BLOB PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL
+                ) WITHOUT ROWID
+            """)
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)"
+            )
+            connection.commit()
+            self._entries, self._size = connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+            ).fetchone()
+            self._connection = connection
+        return self._connection
+
+    def get_many_lyl(self, keys: Sequence[bytes]) -> Dict[bytes, List[float]]:
+        """批量读取缓存的向量并刷新其最近使用时间_lyl"""
+        unique = list(dict.fromkeys(keys))
+        found: Dict[bytes, List[float]] = {}
+        with self._lock:
+            connection = self._connect_lyl()
+            for start in range(0, len(unique), QUERY_BATCH_LYL):
+                batch = unique[start:start + QUERY_BATCH_LYL]
+                placeholders = ",".join("?" * len(batch))
+                rows = connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32).tolist()
+            if found:
+                now = time.time()
+                connection.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                connection.commit()
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return found
+
+    def put_many_lyl(self, model: str, vectors: Dict[bytes, List[float]]) -> None:
+        """写入新向量，总大小超过上限时淘汰最久未使用的条目_lyl"""
+        if not vectors:
+            return
+        now = time.time()
+        with self._lock:
+            connection = self._connect_lyl()
+            for key, vector in vectors.items():
+                blob = np.asarray(vector, dtype=np.float32).tobytes()
+                cursor = connection.execute(
+                    "INSERT OR IGNORE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                    (key, model, blob, now)
+                )
+                self._entries += cursor.rowcount
+                self._size += len(blob) * cursor.rowcount
+            if self._size > self.max_bytes:
+                self._evict_lyl(connection)
+            connection.commit()
+
+    def _evict_lyl(self, connection: sqlite3.Connection) -> None:
+        """按最近使用时间从旧到新删除条目，直到降到上限的九成以下_lyl"""
+        target = int(self.max_bytes * EVICT_TARGET_RATIO_LYL)
+        while self._size > target:
+            rows = connection.execute(
+                "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used LIMIT ?",
+                (QUERY_BATCH_LYL,)
+            ).fetchall()
+            if not rows:
+                self._entries, self._size = 0, 0
+                break
+            evicted = []
+            for key, size in rows:
+                evicted.append((key,))
+                self._size -= size
+                if self._size <= target:
+                    break
+            connection.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+            self._entries -= len(evicted)
+            self.evictions += len(evicted)
+
+    def stats_lyl(self) -> Dict[str, Any]:
+        """缓存命中统计与占用大小_lyl"""
+        with self._lock:
+            self._connect_lyl()
+            lookups = self.hits + self.misses
+            return {
+                "entries": self._entries,
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def close_lyl(self) -> None:
+        """关闭缓存数据库_lyl"""
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+class QueryEmbeddingCache_lyl:
+    """带有效期的查询向量LRU缓存_lyl"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        """初始化查询向量缓存_lyl"""
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[bytes, Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def get_lyl(self, key: bytes) -> Optional[List[float]]:
+        """读取未过期的向量并标记为最近使用_lyl"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put_lyl(self, key: bytes, vector: List[float]) -> None:
+        """写入向量，超过容量时淘汰最久未使用的条目_lyl"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats_lyl(self) -> Dict[str, Any]:
+        """缓存命中统计_lyl"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,152 @@
+"""
+嵌入提供方模块 - 由 EMBEDDING_PROVIDER 选择文本向量化的后端
+
+    remote  OpenAI兼容的远程嵌入接口（默认，SiliconFlow）
+    local   本地CPU推理（sentence-transformers，需另行安装），多线程分批推理，可离线运行
+    hash    确定性的特征哈希嵌入，不依赖模型与网络，用于测试与基准
+
+各提供方都实现langchain的Embeddings接口，缓存、请求合并、自适应并发与向量存储对其一视同仁。
+"""
+import asyncio
+import hashlib
+import math
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from backend.app.services.lexical_tokenizer import tokenize_lyl
+
+PROVIDER_REMOTE_LYL = "remote"
+PROVIDER_LOCAL_LYL = "local"
+PROVIDER_HASH_LYL = "hash"
+PROVIDERS_LYL = (PROVIDER_REMOTE_LYL, PROVIDER_LOCAL_LYL, PROVIDER_HASH_LYL)
+
+
+class LocalEmbeddings_lyl(Embeddings):
+    """本地CPU嵌入_lyl - 文本分批后在线程池中并行推理，异步接口不阻塞事件循环"""
+
+    def __init__(self, model_name: str, device: str, batch_size: int, threads: int):
+        """初始化本地嵌入_lyl - 模型在首次使用时加载"""
+        self.model_name = model_name
+        self.device = device
+        self.batch_size = batch_size
+        self.threads = max(1, threads)
+        self._model = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.threads, thread_name_prefix="local_embedding"
+        )
+
+    @property
+    def model(self):
+        """加载sentence-transformers模型_lyl"""
+        if self._model is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+            except ImportError as e:
+                raise RuntimeError(
+                    "本地嵌入需要安装 sentence-transformers: pip install sentence-transformers"
+                ) from e
+            self._model = SentenceTransformer(self.model_name, device=self.device)
+        return self._model
+
+    def _encode_lyl(self, texts: List[str]) -> List[List[float]]:
+        """推理一个批次并归一化_lyl"""
+        vectors = self.model.encode(
+            texts, batch_size=self.batch_size, normalize_embeddings=True, show_progress_bar=False
+        )
+        return np.asarray(vectors, dtype=np.float32).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """分批并行推理_lyl"""
+        batches = [
+            texts[start:start + self.batch_size]
+            for start in range(0, len(texts), self.batch_size)
+        ]
+        return [vector for vectors in self._executor.map(self._encode_lyl, batches) for vector in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        """推理单条查询_lyl"""
+        return self._encode_lyl([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """在线程池中分批推理_lyl"""
+        loop = asyncio.get_running_loop()
+        batches = await asyncio.gather(*(
+            loop.run_in_executor(self._executor, self._encode_lyl, texts[start:start + self.batch_size])
+            for start in range(0, len(texts), self.batch_size)
+        ))
+        return [vector for vectors in batches for vector in vectors]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """在线程池中推理单条查询_lyl"""
+        loop = asyncio.get_running_loop()
+        return (await loop.run_in_executor(self._executor, self._encode_lyl, [text]))[0]
+
+
+class HashEmbeddings_lyl(Embeddings):
+    """确定性特征哈希嵌入_lyl
+
+    按全文检索的分词规则切词，每个词经哈希映射到一个维度并带±1符号，
+    词频取对数后累加并L2归一化。同一文本在任何机器上得到相同向量，
+    共享词语越多的文本相似度越高，足以让检索结果有意义。
+    """
+
+    def __init__(self, dimension: int):
+        """初始化哈希嵌入_lyl"""
+        self.dimension = dimension
+
+    def _embed_lyl(self, text: str) -> List[float]:
+        """计算单个文本的向量_lyl"""
+        counts: dict = {}
+        for token in tokenize_lyl(text):
+            counts[token] = counts.get(token, 0) + 1
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token, count in counts.items():
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            sign = 1.0 if value >> 63 else -1.0
+            vector[value % self.dimension] += sign * (1.0 + math.log(count))
+        norm = float(np.linalg.norm(vector))
+        if norm == 0:
+            # 没有可切分的词时退化为由全文哈希决定的单位向量，保证结果确定
+            digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+            vector[int.from_bytes(digest, "little") % self.dimension] = 1.0
+            norm = 1.0
+        return (vector / norm).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """计算多个文本的向量_lyl"""
+        return [self._embed_lyl(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        """计算查询向量_lyl"""
+        return self._embed_lyl(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """在工作线程中计算多个文本的向量_lyl"""
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """计算查询向量_lyl - 单条文本开销很小，直接在事件循环中计算"""
+        return self._embed_lyl(text)
+
+
+def provider_model_name_lyl(
+    provider: str, remote_model: str, local_model: str, hash_dimension: int
+) -> str:
+    """提供方与模型的标识_lyl - 作为嵌入缓存键的一部分，切换后端不会命中其它后端的向量"""
+    if provider == PROVIDER_LOCAL_LYL:
+        return f"local:{local_model}"
+    if provider == PROVIDER_HASH_LYL:
+        return f"hash:{hash_dimension}"
+    return remote_model
+
+
+def validate_provider_lyl(provider: Optional[str]) -> str:
+    """校验提供方名称_lyl"""
+    provider = (provider or PROVIDER_REMOTE_LYL).lower()
+    if provider not in PROVIDERS_LYL:
+        raise ValueError(f"不支持的嵌入提供方: {provider}，可选: {', '.join(PROVIDERS_LYL)}")
+    return provider
@@ -1,14 +1,45 @@
 """
-Embedding服务模块 - 使用SiliconFlow API进行文本向量化
+Embedding服务模块 - 文本向量化，默认使用SiliconFlow API，后端由 EMBEDDING_PROVIDER 选择
 """
-from typing import List
-from langchain_openai import OpenAIEmbeddings
+import asyncio
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from langchain_core.embeddings import Embeddings
 
 from backend.app.core.config import settings
+from backend.app.core.logger import log_lyl
+from backend.app.services.adaptive_embedder import AdaptiveEmbedder_lyl
+from backend.app.services.embedding_batcher import EmbeddingBatcher_lyl
+from backend.app.services.embedding_providers import (
+    PROVIDER_HASH_LYL,
+    PROVIDER_LOCAL_LYL,
+    HashEmbeddings_lyl,
+    LocalEmbeddings_lyl,
+    provider_model_name_lyl,
+    validate_provider_lyl,
+)
+from backend.app.services.embedding_cache import (
+    EmbeddingCache_lyl,
+    QueryEmbeddingCache_lyl,
+    cache_key_lyl,
+)
 
 
-def create_embeddings_lyl() -> OpenAIEmbeddings:
-    """创建Embedding实例_lyl"""
+def create_embeddings_lyl() -> Embeddings:
+    """按配置的提供方创建Embedding实例_lyl"""
+    provider = validate_provider_lyl(settings.EMBEDDING_PROVIDER)
+    if provider == PROVIDER_LOCAL_LYL:
+        return LocalEmbeddings_lyl(
+            settings.EMBEDDING_LOCAL_MODEL,
+            settings.EMBEDDING_LOCAL_DEVICE,
+            settings.EMBEDDING_LOCAL_BATCH_SIZE,
+            settings.EMBEDDING_LOCAL_THREADS,
+        )
+    if provider == PROVIDER_HASH_LYL:
+        return HashEmbeddings_lyl(settings.EMBEDDING_HASH_DIM)
+
+    from langchain_openai import OpenAIEmbeddings
+
     embeddings = OpenAIEmbeddings(
         model=settings.EMBEDDING_MODEL,
         openai_api_key=settings.EMBEDDING_MODEL_API_KEY,
@@ -19,27 +50,151 @@ def create_embeddings_lyl() -> OpenAIEmbeddings:
 
 class EmbeddingService_lyl:
     """Embedding服务类_lyl"""
-    
+
     def __init__(self):
         """初始化Embedding服务_lyl"""
         self._embeddings = None
-    
+        self._cache: Optional[EmbeddingCache_lyl] = None
+        self.query_cache: Optional[QueryEmbeddingCache_lyl] = None
+        if settings.QUERY_EMBEDDING_CACHE_SIZE > 0:
+            self.query_cache = QueryEmbeddingCache_lyl(
+                settings.QUERY_EMBEDDING_CACHE_SIZE, settings.QUERY_EMBEDDING_CACHE_TTL
+            )
+        self.document_embedder = AdaptiveEmbedder_lyl(
+            lambda texts: self.embeddings.aembed_documents(texts),
+            concurrency=settings.EMBEDDING_CONCURRENCY,
+            max_concurrency=settings.EMBEDDING_MAX_CONCURRENCY,
+            batch_size=settings.EMBEDDING_BATCH_SIZE,
+            min_batch_size=settings.EMBEDDING_MIN_BATCH_SIZE,
+            max_batch_size=settings.EMBEDDING_MAX_BATCH_SIZE,
+            target_latency=settings.EMBEDDING_TARGET_LATENCY_MS / 1000,
+            max_retries=settings.EMBEDDING_MAX_RETRIES,
+            retry_base=settings.EMBEDDING_RETRY_BASE_MS / 1000,
+            retry_cap=settings.EMBEDDING_RETRY_MAX_MS / 1000,
+        )
+        self.query_batcher: Optional[EmbeddingBatcher_lyl] = None
+        if settings.QUERY_EMBEDDING_BATCH_WINDOW_MS > 0:
+            self.query_batcher = EmbeddingBatcher_lyl(
+                lambda texts: self.embeddings.aembed_documents(texts),
+                settings.QUERY_EMBEDDING_BATCH_WINDOW_MS / 1000,
+                settings.QUERY_EMBEDDING_BATCH_MAX_SIZE,
+            )
+
     @property
-    def embeddings(self) -> OpenAIEmbeddings:
+    def embeddings(self) -> Embeddings:
         """获取Embedding实例_lyl"""
         if self._embeddings is None:
             self._embeddings = create_embeddings_lyl()
         return self._embeddings
-    
+
+    @property
+    def model_name(self) -> str:
+        """当前提供方与模型的标识_lyl - 用作缓存键的一部分"""
+        return provider_model_name_lyl(
+            validate_provider_lyl(settings.EMBEDDING_PROVIDER),
+            settings.EMBEDDING_MODEL,
+            settings.EMBEDDING_LOCAL_MODEL,
+            settings.EMBEDDING_HASH_DIM,
+        )
+
+    @property
+    def cache(self) -> Optional[EmbeddingCache_lyl]:
+        """获取分块嵌入缓存_lyl - 未启用时为None"""
+        if self._cache is None and settings.EMBEDDING_CACHE_ENABLED:
+            self._cache = EmbeddingCache_lyl(
+                Path(settings.EMBEDDING_CACHE_PATH),
+                settings.EMBEDDING_CACHE_MAX_MB * 1024 * 1024
+            )
+        return self._cache
+
     async def embed_text_lyl(self, text: str) -> List[float]:
-        """向量化单个文本_lyl"""
-        return await self.embeddings.aembed_query(text)
-    
-    async def embed_texts_lyl(self, texts: List[str]) -> List[List[float]]:
-        """向量化多个文本_lyl"""
-        return await self.embeddings.aembed_documents(texts)
+        """向量化单个查询文本_lyl - 重复的查询从进程内缓存返回，
+        未命中的查询与同一时间窗口内的其它查询合并为一次批量调用"""
+        if self.query_cache is None:
+            return await self._embed_query_lyl(text)
+        key = cache_key_lyl(self.model_name, text)
+        vector = self.query_cache.get_lyl(key)
+        if vector is None:
+            vector = await self._embed_query_lyl(text)
+            self.query_cache.put_lyl(key, vector)
+        return vector
+
+    async def _embed_query_lyl(self, text: str) -> List[float]:
+        """调用嵌入接口向量化查询_lyl"""
+        if self.query_batcher is None:
+            return await self.embeddings.aembed_query(text)
+        return await self.query_batcher.submit_lyl(text)
+
+    async def embed_texts_lyl(
+        self,
+        texts: List[str],
+        progress: Optional[Callable[[int, int], None]] = None,
+    ) -> List[List[float]]:
+        """向量化多个文本_lyl - 先查磁盘缓存，只把未缓存的文本分批并行发给嵌入接口
+
+        progress以 (已完成文本数, 总文本数) 调用，命中缓存的文本计为已完成。
+        """
+        if not texts:
+            return []
+        cache = self.cache
+        keys = [cache_key_lyl(self.model_name, text) for text in texts]
+        vectors: Dict[bytes, List[float]] = {}
+        if cache is not None:
+            try:
+                vectors = await asyncio.to_thread(cache.get_many_lyl, keys)
+            except Exception as e:
+                log_lyl.warning(f"读取嵌入缓存失败，直接调用嵌入接口: {e}")
+
+        # 同一批中重复的文本只嵌入一次
+        missing: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        done = len(texts) - len(missing)
+        if progress is not None:
+            progress(done, len(texts))
+        if missing:
+            embedded = await self.document_embedder.embed_lyl(
+                list(missing.values()),
+                (lambda count: progress(done + count, len(texts))) if progress is not None else None,
+            )
+            fresh = dict(zip(missing, embedded))
+            if cache is not None:
+                try:
+                    await asyncio.to_thread(cache.put_many_lyl, self.model_name, fresh)
+                except Exception as e:
+                    log_lyl.warning(f"写入嵌入缓存失败: {e}")
+            vectors.update(fresh)
+        return [vectors[key] for key in keys]
+
+    def cache_stats_lyl(self) -> Dict[str, Any]:
+        """分块嵌入缓存统计_lyl"""
+        cache = self.cache
+        if cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **cache.stats_lyl()}
+
+    def query_cache_stats_lyl(self) -> Dict[str, Any]:
+        """查询向量缓存统计_lyl"""
+        if self.query_cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.query_cache.stats_lyl()}
+
+    def document_embedder_stats_lyl(self) -> Dict[str, Any]:
+        """分块并行嵌入的并发状态与重试统计_lyl"""
+        return self.document_embedder.stats_lyl()
+
+    def query_batcher_stats_lyl(self) -> Dict[str, Any]:
+        """查询嵌入合并统计_lyl"""
+        if self.query_batcher is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.query_batcher.stats_lyl()}
+
+    def close_lyl(self) -> None:
+        """关闭嵌入缓存_lyl"""
+        if self._cache is not None:
+            self._cache.close_lyl()
 
 
 # 全局实例
 embedding_service = EmbeddingService_lyl()
-
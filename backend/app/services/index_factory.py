@@ -0,0 +1,166 @@
+"""
+向量索引工厂模块 - 按配置创建 Flat / HNSW / IVF 索引及其量化存储
+
+上传产生的小分段始终使用精确的Flat索引；合并后的分段在有效向量数
+达到 VECTOR_INDEX_PROMOTE_THRESHOLD 时升级为配置的近似索引类型，
+IVF索引在每次合并时用当前全部向量重新训练。
+
+合并后的分段可按 VECTOR_QUANTIZATION 以SQ8或PQ编码存储向量，
+检索时多取候选，再用磁盘上的全精度向量精确重排（见 Segment_lyl）。
+"""
+import math
+from typing import Callable, List, Optional
+
+import faiss
+import numpy as np
+
+from backend.app.core.config import settings
+
+INDEX_FLAT_LYL = "flat"
+INDEX_HNSW_LYL = "hnsw"
+INDEX_IVF_FLAT_LYL = "ivf_flat"
+INDEX_TYPES_LYL = (INDEX_FLAT_LYL, INDEX_HNSW_LYL, INDEX_IVF_FLAT_LYL)
+
+QUANTIZATION_NONE_LYL = "none"
+QUANTIZATION_SQ8_LYL = "sq8"
+QUANTIZATION_PQ_LYL = "pq"
+QUANTIZATIONS_LYL = (QUANTIZATION_NONE_LYL, QUANTIZATION_SQ8_LYL, QUANTIZATION_PQ_LYL)
+
+# IVF每个聚类中心至少需要的训练样本数（faiss的经验值）
+IVF_MIN_POINTS_PER_CENTROID_LYL = 39
+# PQ每个子量化器训练256个中心所需的样本数，不足时退回SQ8
+PQ_MIN_TRAIN_POINTS_LYL = 256 * IVF_MIN_POINTS_PER_CENTROID_LYL
+
+
+def resolve_index_type_lyl(ntotal: int) -> str:
+    """根据向量数决定分段使用的索引类型_lyl"""
+    index_type = settings.VECTOR_INDEX_TYPE
+    if index_type not in INDEX_TYPES_LYL:
+        raise ValueError(f"不支持的索引类型: {index_type}")
+    if ntotal < settings.VECTOR_INDEX_PROMOTE_THRESHOLD:
+        return INDEX_FLAT_LYL
+    return index_type
+
+
+def resolve_quantization_lyl(ntotal: int) -> str:
+    """根据向量数决定合并分段使用的量化方式_lyl"""
+    quantization = settings.VECTOR_QUANTIZATION
+    if quantization not in QUANTIZATIONS_LYL:
+        raise ValueError(f"不支持的量化方式: {quantization}")
+    if quantization == QUANTIZATION_PQ_LYL and ntotal < PQ_MIN_TRAIN_POINTS_LYL:
+        return QUANTIZATION_SQ8_LYL
+    return quantization
+
+
+def ivf_nlist_lyl(ntotal: int) -> int:
+    """IVF聚类中心数_lyl - 未配置时取4*sqrt(n)，并保证训练样本充足"""
+    nlist = settings.VECTOR_IVF_NLIST or int(4 * math.sqrt(ntotal))
+    return max(1, min(nlist, ntotal // IVF_MIN_POINTS_PER_CENTROID_LYL))
+
+
+def pq_m_lyl(dimension: int) -> int:
+    """PQ子量化器个数_lyl - 未配置时取d/4（相对float32压缩16倍），须整除维度"""
+    m = settings.VECTOR_PQ_M or max(1, dimension // 4)
+    while dimension % m:
+        m -= 1
+    return m
+
+
+def factory_key_lyl(index_type: str, quantization: str, dimension: int, ntotal: int) -> str:
+    """生成faiss.index_factory描述串_lyl"""
+    codec = {
+        QUANTIZATION_NONE_LYL: "Flat",
+        QUANTIZATION_SQ8_LYL: "SQ8",
+        QUANTIZATION_PQ_LYL: f"PQ{pq_m_lyl(dimension)}",
+    }[quantization]
+    if index_type == INDEX_FLAT_LYL:
+        return codec
+    if index_type == INDEX_HNSW_LYL:
+        return f"HNSW{settings.VECTOR_HNSW_M},{codec}"
+    if index_type == INDEX_IVF_FLAT_LYL:
+        return f"IVF{ivf_nlist_lyl(ntotal)},{codec}"
+    raise ValueError(f"不支持的索引类型: {index_type}")
+
+
+def create_index_lyl(
+    index_type: str, dimension: int, ntotal: int, quantization: str = QUANTIZATION_NONE_LYL
+) -> faiss.Index:
+    """创建未训练的底层索引_lyl"""
+    key = factory_key_lyl(index_type, quantization, dimension, ntotal)
+    index = faiss.index_factory(dimension, key, faiss.METRIC_L2)
+    if index_type == INDEX_HNSW_LYL:
+        faiss.downcast_index(index).hnsw.efConstruction = settings.VECTOR_HNSW_EF_CONSTRUCTION
+    return index
+
+
+def build_index_lyl(
+    vectors: np.ndarray,
+    ids: List[int],
+    index_type: Optional[str] = None,
+    quantization: Optional[str] = None,
+    batch_size: Optional[int] = None,
+    on_batch: Optional[Callable[[int], None]] = None,
+) -> faiss.IndexIDMap2:
+    """训练（如需要）并写入向量，返回ID映射索引_lyl
+
+    指定batch_size时分批写入，每批后以已写入向量数调用on_batch（用于进度与限速）。
+    """
+    index_type = index_type or INDEX_FLAT_LYL
+    quantization = quantization or QUANTIZATION_NONE_LYL
+    base = create_index_lyl(index_type, vectors.shape[1], len(vectors), quantization)
+    if not base.is_trained:
+        base.train(vectors)
+    index = faiss.IndexIDMap2(base)
+    ids = np.asarray(ids, dtype=np.int64)
+    step = batch_size or max(len(vectors), 1)
+    for start in range(0, len(vectors), step):
+        end = min(start + step, len(vectors))
+        index.add_with_ids(vectors[start:end], ids[start:end])
+        if on_batch is not None:
+            on_batch(end)
+    if index_type == INDEX_IVF_FLAT_LYL:
+        # 合并分段时需要按位置取回向量
+        faiss.extract_index_ivf(base).make_direct_map()
+    return index
+
+
+def index_type_of_lyl(index: faiss.Index) -> str:
+    """识别ID映射索引内部的索引类型_lyl"""
+    base = faiss.downcast_index(index.index)
+    if isinstance(base, faiss.IndexHNSW):
+        return INDEX_HNSW_LYL
+    if isinstance(base, faiss.IndexIVF):
+        return INDEX_IVF_FLAT_LYL
+    return INDEX_FLAT_LYL
+
+
+def quantization_of_lyl(index: faiss.Index) -> str:
+    """识别ID映射索引内部的向量编码方式_lyl"""
+    base = faiss.downcast_index(index.index)
+    sq_types = (faiss.IndexScalarQuantizer, faiss.IndexHNSWSQ, faiss.IndexIVFScalarQuantizer)
+    pq_types = (faiss.IndexPQ, faiss.IndexHNSWPQ, faiss.IndexIVFPQ)
+    if isinstance(base, sq_types):
+        return QUANTIZATION_SQ8_LYL
+    if isinstance(base, pq_types):
+        return QUANTIZATION_PQ_LYL
+    return QUANTIZATION_NONE_LYL
+
+
+def search_params_lyl(
+    index_type: str,
+    selector: Optional[faiss.IDSelector] = None,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+) -> Optional[faiss.SearchParameters]:
+    """构建对应索引类型的检索参数_lyl - nprobe/ef_search默认取配置值"""
+    if index_type == INDEX_HNSW_LYL:
+        return faiss.SearchParametersHNSW(
+            sel=selector, efSearch=ef_search or settings.VECTOR_HNSW_EF_SEARCH
+        )
+    if index_type == INDEX_IVF_FLAT_LYL:
+        return faiss.SearchParametersIVF(
+            sel=selector, nprobe=nprobe or settings.VECTOR_IVF_NPROBE
+        )
+    if selector is not None:
+        return faiss.SearchParameters(sel=selector)
+    return None
@@ -0,0 +1,657 @@
+"""
+入库任务服务模块 - 上传的文件在后台解析、嵌入并写入索引
+
+上传接口只负责把文件保存到磁盘并在 ingest_jobs 表中登记任务，随即返回任务ID；
+INGEST_WORKERS 个工作协程从队列中取任务依次经过以下阶段：
+
+    queued     排队等待
+    parsing    开始解析文档
+    embedding  流水线运行中：逐批解析、嵌入并写入向量存储与全文索引（按已写入的页区间报告进度）
+    indexing   提交文档记录，修订版在此删除过期分块
+    done       完成
+
+解析、嵌入、写入索引三个阶段并发运行，之间以容量为 INGEST_PIPELINE_DEPTH 的队列相连，
+下游处理不过来时上游暂停，内存中的分块数与文档长度无关；每批写入后即可被检索。
+解析阶段最多提前执行与解析进程池大小相同数量的页区间任务，PDF的各页区间在多个进程中并行解析。
+
+任务状态持久化在数据库中，进度百分比在内存中实时更新、阶段切换时写入数据库。
+进程退出时未完成的任务保留在表中，下次启动时清理其写到一半的文档记录与向量后重新执行；
+因进程异常退出而中断达到 INGEST_MAX_ATTEMPTS 次的任务标记为失败，避免反复拖垮进程。
+
+去重与增量更新：内容哈希与已有文档相同的文件直接完成（outcome=duplicate）并删除多余副本；
+上传时显式指定要更新的文档（target_document_id）的文件作为该文档的修订版（outcome=updated），
+按分块内容哈希比对，只嵌入新增或改动的分块，过期分块连同其向量删除，文档ID保持不变；
+未指定时即使与已有文档同名也作为新文档入库（outcome=created），不会覆盖已有文档。
+
+提取文本缓存：解析时把逐页文本写入 document_texts，修订时若缓存对应的正是本次文件内容则直接切分缓存。
+重新分块任务（kind=rechunk）按当前 TEXT_SPLITTER 与分块参数从缓存重新切分已有文档，
+同样按分块哈希增量更新，只嵌入变化的分块；没有缓存的旧文档解析一次原文件并补建缓存。
+
+删除文档（kind=delete）登记任务后立即执行，不经过队列：依次登记向量墓碑、删除数据库记录与文件，
+各步骤都可重复执行，进程在中途退出时由恢复流程重新执行该任务，不会留下无法检索的文档记录。
+入库任务在写入文档期间持有该文档的锁，此时删除该文档抛出 DocumentBusyError_lyl；
+任务提交前再确认文档仍存在，否则撤销已写入的分块与向量，不会留下不属于任何文档的分块。
+"""
+import asyncio
+import json
+import os
+from contextlib import AsyncExitStack, aclosing, asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+
+from backend.app.core.config import settings
+from backend.app.core.logger import log_lyl
+from backend.app.database.database import db_manager
+from backend.app.services.document_service import content_hash_lyl, document_service
+from backend.app.services.embedding_service import embedding_service
+from backend.app.services.text_cache import TextCacheWriter_lyl
+from backend.app.services.vector_store_service import vector_store_service
+
+JOB_QUEUED_LYL = "queued"
+JOB_RUNNING_LYL = "running"
+JOB_COMPLETED_LYL = "completed"
+JOB_FAILED_LYL = "failed"
+
+STAGE_QUEUED_LYL = "queued"
+STAGE_PARSING_LYL = "parsing"
+STAGE_EMBEDDING_LYL = "embedding"
+STAGE_INDEXING_LYL = "indexing"
+STAGE_DONE_LYL = "done"
+
+# 各阶段在总进度中的起点（百分比），嵌入阶段占据其中大部分
+STAGE_PROGRESS_LYL = {
+    STAGE_QUEUED_LYL: 0,
+    STAGE_PARSING_LYL: 0,
+    STAGE_EMBEDDING_LYL: 10,
+    STAGE_INDEXING_LYL: 95,
+    STAGE_DONE_LYL: 100,
+}
+
+# 任务结果：新建文档 / 更新指定的文档 / 与已有文档内容相同
+OUTCOME_CREATED_LYL = "created"
+OUTCOME_UPDATED_LYL = "updated"
+OUTCOME_DUPLICATE_LYL = "duplicate"
+
+# 任务类型：上传的文件 / 按当前分块参数重新分块已有文档
+JOB_KIND_UPLOAD_LYL = "upload"
+JOB_KIND_RECHUNK_LYL = "rechunk"
+JOB_KIND_DELETE_LYL = "delete"
+
+# 列出任务时返回的最大条数
+JOB_LIST_LIMIT_LYL = 50
+
+
+class DocumentBusyError_lyl(Exception):
+    """文档有正在执行的入库任务，暂不能删除_lyl"""
+
+
+def document_key_lyl(doc_id: int) -> str:
+    """文档在任务锁中的键_lyl"""
+    return f"doc:{doc_id}"
+
+
+async def run_stages_lyl(*stages: Awaitable[None]) -> None:
+    """并发运行流水线各阶段_lyl - 任一阶段失败时取消其余阶段并抛出该异常"""
+    tasks = [asyncio.ensure_future(stage) for stage in stages]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class IngestionService_lyl:
+    """入库任务服务类_lyl"""
+
+    def __init__(self):
+        """初始化任务服务_lyl"""
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._start_task: Optional[asyncio.Task] = None
+        # 运行中任务的实时阶段与进度，查询时覆盖数据库中的值
+        self._live: Dict[int, Dict[str, Any]] = {}
+        # 按内容哈希与文档ID加的锁及其持有与等待者数，计数归零时删除
+        self._key_locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+        # 等待任务结束的调用方，任务离开工作协程时唤醒
+        self._waiters: Dict[int, List[asyncio.Future]] = {}
+        # 已在队列中或正在执行的任务ID，避免启动恢复与新登记的任务重复入队
+        self._pending: Set[int] = set()
+
+    def start_lyl(self) -> None:
+        """恢复未完成的任务并启动工作协程_lyl"""
+        if self._start_task is None:
+            self._queue = asyncio.Queue()
+            self._pending = set()
+            self._start_task = asyncio.create_task(self._start_workers_lyl())
+
+    async def _start_workers_lyl(self) -> None:
+        """把上次未完成的任务重新入队后启动工作协程_lyl"""
+        for job_id in await self._recover_jobs_lyl():
+            self._put_lyl(job_id)
+        self._workers = [
+            asyncio.create_task(self._worker_lyl(i))
+            for i in range(max(1, settings.INGEST_WORKERS))
+        ]
+
+    async def _recover_jobs_lyl(self) -> List[int]:
+        """找出需要继续执行的任务，返回其ID_lyl
+
+        状态仍为running的任务是进程异常退出时中断的，计一次中断；
+        正常关闭时中断的任务已被放回queued，不计次数。
+        """
+        async with db_manager.transaction_lyl() as conn:
+            await conn.execute(
+                """UPDATE ingest_jobs SET status = ?, attempts = attempts + 1,
+                   updated_at = CURRENT_TIMESTAMP WHERE status = ?""",
+                (JOB_QUEUED_LYL, JOB_RUNNING_LYL)
+            )
+            await conn.execute(
+                """UPDATE ingest_jobs SET status = ?, error = ?, updated_at = CURRENT_TIMESTAMP
+                   WHERE status = ? AND attempts >= ?""",
+                (JOB_FAILED_LYL, "任务多次被进程退出中断", JOB_QUEUED_LYL,
+                 settings.INGEST_MAX_ATTEMPTS)
+            )
+        rows = await db_manager.fetch_all_lyl(
+            "SELECT id FROM ingest_jobs WHERE status = ? ORDER BY id", (JOB_QUEUED_LYL,)
+        )
+        if rows:
+            log_lyl.info(f"恢复 {len(rows)} 个未完成的入库任务")
+        return [row["id"] for row in rows]
+
+    async def close_lyl(self) -> None:
+        """停止工作协程_lyl - 进行中的任务放回队列，下次启动时继续"""
+        tasks = [task for task in (self._start_task, *self._workers) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._start_task = None
+        self._workers = []
+
+    async def join_lyl(self) -> None:
+        """等待队列中的任务（包括启动时恢复的任务）全部处理完_lyl"""
+        if self._start_task is None:
+            return
+        await self._start_task
+        await self._queue.join()
+
+    async def enqueue_lyl(
+        self, filename: str, file_path: str, file_size: int, content_hash: Optional[str],
+        kind: str = JOB_KIND_UPLOAD_LYL, target_document_id: Optional[int] = None
+    ) -> int:
+        """登记入库任务并放入队列，返回任务ID_lyl - target_document_id为要修订或重新分块的文档"""
+        file_type = os.path.splitext(filename)[1].lower()
+        cursor = await db_manager.execute_lyl(
+            """INSERT INTO ingest_jobs (filename, file_type, file_path, file_size, content_hash,
+                                        kind, target_document_id)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (filename, file_type, file_path, file_size, content_hash, kind, target_document_id)
+        )
+        job_id = cursor.lastrowid
+        self._put_lyl(job_id)
+        return job_id
+
+    def _put_lyl(self, job_id: int) -> None:
+        """把任务放入队列_lyl - 工作协程未启动或任务已在队列中时忽略"""
+        if self._queue is not None and job_id not in self._pending:
+            self._pending.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    async def enqueue_rechunk_lyl(self) -> List[int]:
+        """为全部文档登记重新分块任务，返回任务ID_lyl"""
+        job_ids = []
+        for document in await document_service.get_all_documents_lyl():
+            job_ids.append(await self.enqueue_lyl(
+                document["filename"], document["file_path"], document["file_size"],
+                document["content_hash"], kind=JOB_KIND_RECHUNK_LYL,
+                target_document_id=document["id"]
+            ))
+        return job_ids
+
+    async def delete_document_lyl(self, document: Dict[str, Any]) -> int:
+        """删除文档及其向量与文件，返回登记墓碑的向量数_lyl
+
+        先登记状态为running的删除任务再执行，中途失败时放回队列由工作协程重试。
+        有入库任务正在写入或等待写入该文档时抛出 DocumentBusyError_lyl。
+        """
+        key = document_key_lyl(document["id"])
+        if key in self._key_locks:
+            raise DocumentBusyError_lyl(f"文档正在入库处理中，请稍后再删除: {document['filename']}")
+        async with self._hold_keys_lyl([key]):
+            cursor = await db_manager.execute_lyl(
+                """INSERT INTO ingest_jobs (filename, file_type, file_path, file_size, content_hash,
+                                            status, document_id, target_document_id, kind)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (document["filename"], document["file_type"], document["file_path"],
+                 document["file_size"], document["content_hash"], JOB_RUNNING_LYL,
+                 document["id"], document["id"], JOB_KIND_DELETE_LYL)
+            )
+            job_id = cursor.lastrowid
+            try:
+                removed = await self._delete_document_lyl(document["id"], document["file_path"])
+            except Exception:
+                await self._update_job_lyl(job_id, status=JOB_QUEUED_LYL)
+                self._put_lyl(job_id)
+                raise
+        await self._update_job_lyl(
+            job_id, status=JOB_COMPLETED_LYL, stage=STAGE_DONE_LYL, progress=100
+        )
+        return removed
+
+    async def wait_job_lyl(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """等待任务离开工作协程后返回任务记录_lyl
+
+        任务完成或失败时状态为completed/failed；服务关闭时被中断的任务状态为queued，重启后继续。
+        """
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(job_id, []).append(waiter)
+        try:
+            job = await self.get_job_lyl(job_id)
+            if job is None or job["status"] in (JOB_COMPLETED_LYL, JOB_FAILED_LYL):
+                return job
+            await waiter
+            return await self.get_job_lyl(job_id)
+        finally:
+            waiters = self._waiters.get(job_id)
+            if waiters is not None and waiter in waiters:
+                waiters.remove(waiter)
+                if not waiters:
+                    del self._waiters[job_id]
+
+    async def get_job_lyl(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """查询任务状态_lyl - 运行中的任务返回实时阶段与进度"""
+        job = await db_manager.fetch_one_lyl("SELECT * FROM ingest_jobs WHERE id = ?", (job_id,))
+        if job is not None and job_id in self._live:
+            job.update(self._live[job_id])
+        return job
+
+    async def list_jobs_lyl(self, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """列出最近的任务_lyl - 可按状态过滤"""
+        if status:
+            jobs = await db_manager.fetch_all_lyl(
+                "SELECT * FROM ingest_jobs WHERE status = ? ORDER BY id DESC LIMIT ?",
+                (status, JOB_LIST_LIMIT_LYL)
+            )
+        else:
+            jobs = await db_manager.fetch_all_lyl(
+                "SELECT * FROM ingest_jobs ORDER BY id DESC LIMIT ?", (JOB_LIST_LIMIT_LYL,)
+            )
+        for job in jobs:
+            job.update(self._live.get(job["id"], {}))
+        return jobs
+
+    def queue_stats_lyl(self) -> Dict[str, int]:
+        """队列状态_lyl"""
+        return {
+            "workers": len(self._workers),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": len(self._live),
+        }
+
+    async def _update_job_lyl(self, job_id: int, **fields: Any) -> None:
+        """更新任务记录_lyl"""
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        await db_manager.execute_lyl(
+            f"UPDATE ingest_jobs SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (*fields.values(), job_id)
+        )
+
+    async def _set_stage_lyl(self, job_id: int, stage: str) -> None:
+        """进入新阶段_lyl"""
+        progress = STAGE_PROGRESS_LYL[stage]
+        self._live[job_id] = {"stage": stage, "progress": progress}
+        await self._update_job_lyl(job_id, stage=stage, progress=progress)
+
+    async def _worker_lyl(self, worker_id: int) -> None:
+        """工作协程_lyl - 依次处理队列中的任务"""
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run_job_lyl(job_id)
+            except asyncio.CancelledError:
+                # 正常关闭：放回队列，下次启动时继续且不计中断次数
+                await self._update_job_lyl(job_id, status=JOB_QUEUED_LYL)
+                raise
+            except Exception as e:
+                log_lyl.error(f"入库任务 {job_id} 失败: {e}")
+                await self._update_job_lyl(job_id, status=JOB_FAILED_LYL, error=str(e))
+            finally:
+                self._pending.discard(job_id)
+                self._live.pop(job_id, None)
+                for waiter in self._waiters.pop(job_id, []):
+                    if not waiter.done():
+                        waiter.set_result(None)
+                self._queue.task_done()
+
+    @asynccontextmanager
+    async def _claim_lyl(self, job: Dict[str, Any]) -> AsyncIterator[None]:
+        """同内容或针对同一文档的任务串行执行_lyl - 避免并发的重复上传都被当作新文档入库，
+        同一文档的修订与重新分块不会交错进行
+        """
+        keys = [f"hash:{job['content_hash']}"]
+        if job["target_document_id"] is not None:
+            keys.append(document_key_lyl(job["target_document_id"]))
+        async with self._hold_keys_lyl(keys):
+            yield
+
+    @asynccontextmanager
+    async def _hold_keys_lyl(self, keys: List[str]) -> AsyncIterator[None]:
+        """按键排序依次加锁_lyl - 各锁记录持有与等待者数，计数归零时删除"""
+        keys = sorted(set(keys))
+        locks = []
+        for key in keys:
+            lock, users = self._key_locks.get(key, (None, 0))
+            lock = lock or asyncio.Lock()
+            self._key_locks[key] = (lock, users + 1)
+            locks.append(lock)
+        try:
+            async with AsyncExitStack() as stack:
+                for lock in locks:
+                    await stack.enter_async_context(lock)
+                yield
+        finally:
+            # 释放锁时被唤醒的等待者尚未取得锁，不能按 locked() 判断是否还有人使用
+            for key in keys:
+                lock, users = self._key_locks[key]
+                if users > 1:
+                    self._key_locks[key] = (lock, users - 1)
+                else:
+                    del self._key_locks[key]
+
+    async def _run_job_lyl(self, job_id: int) -> None:
+        """执行一个入库任务_lyl"""
+        job = await db_manager.fetch_one_lyl("SELECT * FROM ingest_jobs WHERE id = ?", (job_id,))
+        if job is None or job["status"] != JOB_QUEUED_LYL:
+            return
+        await vector_store_service.wait_ready_lyl()
+        await self._update_job_lyl(job_id, status=JOB_RUNNING_LYL, error=None)
+        async with self._claim_lyl(job):
+            await self._process_job_lyl(job)
+
+    async def _process_job_lyl(self, job: Dict[str, Any]) -> None:
+        """去重、解析并新建或修订文档_lyl"""
+        job_id = job["id"]
+
+        if job["kind"] == JOB_KIND_DELETE_LYL:
+            # 被中断的删除：重新执行全部步骤，已完成的步骤不产生影响
+            await self._delete_document_lyl(job["document_id"], job["file_path"])
+            await self._set_stage_lyl(job_id, STAGE_DONE_LYL)
+            await self._update_job_lyl(job_id, status=JOB_COMPLETED_LYL)
+            return
+
+        # 上次执行被中断时留下的部分写入先撤销
+        if job["document_id"] is not None:
+            await self._rollback_lyl(job)
+            await self._update_job_lyl(
+                job_id, document_id=None, outcome=None, chunk_watermark=None, stale_chunk_ids=None
+            )
+
+        if job["kind"] == JOB_KIND_RECHUNK_LYL:
+            # 重新分块即以同一文件对文档做一次修订；早期的任务没有记录文档ID，按文件路径查找
+            if job["target_document_id"] is not None:
+                previous = await document_service.get_document_by_id_lyl(job["target_document_id"])
+            else:
+                previous = await document_service.find_document_by_path_lyl(job["file_path"])
+            if previous is None:
+                raise ValueError(f"文档已被删除: {job['filename']}")
+        else:
+            # 内容完全相同的文件已入库时不做任何处理
+            if job["content_hash"]:
+                duplicate = await document_service.find_document_by_hash_lyl(job["content_hash"])
+                if duplicate is not None:
+                    await self._finish_duplicate_lyl(job, duplicate)
+                    return
+            # 只有上传时指定了要更新的文档才作为修订版，同名文件不会覆盖已有文档
+            previous = None
+            if job["target_document_id"] is not None:
+                previous = await document_service.get_document_by_id_lyl(job["target_document_id"])
+                if previous is None:
+                    raise ValueError(f"要更新的文档不存在或已被删除: {job['target_document_id']}")
+
+        await self._set_stage_lyl(job_id, STAGE_PARSING_LYL)
+        if previous is not None:
+            await self._revise_document_lyl(job, previous)
+        else:
+            await self._create_document_lyl(job)
+
+        await self._set_stage_lyl(job_id, STAGE_DONE_LYL)
+        await self._update_job_lyl(job_id, status=JOB_COMPLETED_LYL)
+
+    async def _open_chunks_lyl(
+        self, job: Dict[str, Any], doc_id: Optional[int]
+    ) -> Tuple[AsyncIterator[Tuple[List[Document], float]], Optional[TextCacheWriter_lyl]]:
+        """任务的分块来源_lyl - 文档已缓存本次文件内容的提取文本时直接切分缓存，
+        否则解析文件并返回收集页面的缓存编码器，完成后由调用方保存
+
+        预取的解析任务数取解析进程池大小，与流水线各阶段之间的队列深度无关，
+        使各进程同时解析不同的页区间。
+        """
+        prefetch = document_service.parser.workers
+        if doc_id is not None:
+            pages = await document_service.load_text_cache_lyl(doc_id, job["content_hash"])
+            if pages is not None:
+                log_lyl.info(f"使用缓存的提取文本: {job['filename']}，共 {len(pages)} 页")
+                return document_service.iter_cached_chunks_lyl(job["file_path"], pages, prefetch), None
+        cache = TextCacheWriter_lyl()
+        return document_service.iter_document_chunks_lyl(job["file_path"], prefetch, cache), cache
+
+    async def _run_pipeline_lyl(
+        self, job: Dict[str, Any], doc_id: int,
+        chunk_stream: AsyncIterator[Tuple[List[Document], float]],
+        select: Callable[[List[Document]], List[Document]]
+    ) -> Tuple[int, int]:
+        """流式入库：解析 → 嵌入 → 追加到向量存储与全文索引_lyl
+
+        chunk_stream产出 (本批分块, 已完成比例)，见 _open_chunks_lyl；
+        select从每批解析结果中选出需要嵌入的分块；返回 (解析得到的分块数, 嵌入写入的分块数)。
+        """
+        job_id = job["id"]
+        depth = max(1, settings.INGEST_PIPELINE_DEPTH)
+        parsed: asyncio.Queue = asyncio.Queue(depth)
+        embedded: asyncio.Queue = asyncio.Queue(depth)
+        start = STAGE_PROGRESS_LYL[STAGE_EMBEDDING_LYL]
+        span = STAGE_PROGRESS_LYL[STAGE_INDEXING_LYL] - start
+        counts = {"parsed": 0, "embedded": 0}
+
+        async def parse_stage_lyl() -> None:
+            async with aclosing(chunk_stream) as parts:
+                async for chunks, fraction in parts:
+                    counts["parsed"] += len(chunks)
+                    await parsed.put((select(chunks), fraction))
+            await parsed.put(None)
+
+        async def embed_stage_lyl() -> None:
+            while (item := await parsed.get()) is not None:
+                if self._live[job_id]["stage"] != STAGE_EMBEDDING_LYL:
+                    await self._set_stage_lyl(job_id, STAGE_EMBEDDING_LYL)
+                chunks, fraction = item
+                embeddings = await embedding_service.embed_texts_lyl(
+                    [chunk.page_content for chunk in chunks]
+                ) if chunks else []
+                await embedded.put((chunks, embeddings, fraction))
+            await embedded.put(None)
+
+        async def index_stage_lyl() -> None:
+            while (item := await embedded.get()) is not None:
+                chunks, embeddings, fraction = item
+                chunk_ids = await vector_store_service.append_embedded_lyl(
+                    doc_id, chunks, embeddings
+                )
+                await document_service.index_chunks_text_lyl(chunk_ids, chunks)
+                counts["embedded"] += len(chunks)
+                self._live[job_id]["progress"] = start + int(span * fraction)
+
+        await run_stages_lyl(parse_stage_lyl(), embed_stage_lyl(), index_stage_lyl())
+        return counts["parsed"], counts["embedded"]
+
+    async def _create_document_lyl(self, job: Dict[str, Any]) -> None:
+        """新文档：全部分块边解析边嵌入入库_lyl"""
+        job_id = job["id"]
+        doc_id = await document_service.add_document_record_lyl(
+            filename=job["filename"],
+            file_type=job["file_type"],
+            file_path=job["file_path"],
+            file_size=job["file_size"],
+            chunk_count=0,
+            content_hash=job["content_hash"]
+        )
+        # 写入期间持有文档锁，删除接口此时拒绝删除该文档
+        async with self._hold_keys_lyl([document_key_lyl(doc_id)]):
+            await self._update_job_lyl(job_id, document_id=doc_id, outcome=OUTCOME_CREATED_LYL)
+
+            # 失败时回滚已写入的向量和文档记录，保持索引与数据库一致
+            try:
+                chunk_stream, cache = await self._open_chunks_lyl(job, None)
+                chunk_count, _ = await self._run_pipeline_lyl(
+                    job, doc_id, chunk_stream, lambda chunks: chunks
+                )
+                await self._set_stage_lyl(job_id, STAGE_INDEXING_LYL)
+                await self._ensure_document_lyl(doc_id, job)
+                await document_service.save_text_cache_lyl(
+                    doc_id, job["content_hash"], cache.finish_lyl()
+                )
+                await document_service.set_chunk_count_lyl(doc_id, chunk_count)
+            except Exception:
+                await self._discard_document_lyl(doc_id)
+                await self._update_job_lyl(job_id, document_id=None, outcome=None)
+                raise
+            await self._update_job_lyl(job_id, chunk_count=chunk_count, embedded_count=chunk_count)
+            log_lyl.success(f"文档入库成功: {job['filename']}, ID: {doc_id}，共 {chunk_count} 个块")
+
+    async def _revise_document_lyl(self, job: Dict[str, Any], previous: Dict[str, Any]) -> None:
+        """已有文档的修订版：只嵌入新增或改动的分块，内容未变的分块沿用原向量_lyl
+
+        按内容哈希把新分块与原分块一一配对（重复的分块按出现次数配对），
+        未配对的新分块随流水线嵌入写入，未配对的原分块在最后作为过期分块删除。
+        """
+        job_id = job["id"]
+        doc_id = previous["id"]
+        old_chunks = await document_service.get_chunk_hashes_lyl(doc_id)
+        available: Dict[str, List[int]] = {}
+        for chunk_id, chunk_hash in old_chunks:
+            available.setdefault(chunk_hash, []).append(chunk_id)
+
+        # 沿用的分块只保留 (分块ID, 哈希, 元数据)，不在内存中保留其文本
+        kept: List[Tuple[int, str, Dict[str, Any]]] = []
+
+        def select_changed_lyl(chunks: List[Document]) -> List[Document]:
+            added = []
+            for chunk in chunks:
+                chunk_hash = content_hash_lyl(chunk.page_content)
+                matches = available.get(chunk_hash)
+                if matches:
+                    kept.append((matches.pop(0), chunk_hash, chunk.metadata))
+                else:
+                    added.append(chunk)
+            return added
+
+        # 记录修订前的最大分块ID，中断后据此撤销本次新增的分块
+        watermark = max((chunk_id for chunk_id, _ in old_chunks), default=0)
+        await self._update_job_lyl(
+            job_id, document_id=doc_id, outcome=OUTCOME_UPDATED_LYL, chunk_watermark=watermark
+        )
+
+        try:
+            chunk_stream, cache = await self._open_chunks_lyl(job, doc_id)
+            chunk_count, added_count = await self._run_pipeline_lyl(
+                job, doc_id, chunk_stream, select_changed_lyl
+            )
+            await self._ensure_document_lyl(doc_id, job)
+        except Exception:
+            await self._rollback_revision_lyl(doc_id, watermark)
+            await self._update_job_lyl(
+                job_id, document_id=None, outcome=None, chunk_watermark=None
+            )
+            raise
+        stale_ids = [chunk_id for ids in available.values() for chunk_id in ids]
+        log_lyl.info(
+            f"文档修订: {job['filename']}，沿用 {len(kept)} 个分块，"
+            f"新增 {added_count} 个，删除 {len(stale_ids)} 个"
+        )
+
+        # 先提交数据库（过期分块ID同时记入任务记录），再登记过期向量的墓碑；
+        # 中断在两步之间时由 _rollback_lyl 按任务记录补登墓碑
+        await self._set_stage_lyl(job_id, STAGE_INDEXING_LYL)
+        await document_service.apply_revision_lyl(
+            doc_id, kept, stale_ids, job["file_path"], job["file_size"],
+            job["content_hash"], chunk_count, job_id
+        )
+        await vector_store_service.delete_chunks_lyl(stale_ids)
+        await self._update_job_lyl(job_id, stale_chunk_ids=None)
+        if cache is not None:
+            await document_service.save_text_cache_lyl(
+                doc_id, job["content_hash"], cache.finish_lyl()
+            )
+        await self._update_job_lyl(job_id, chunk_count=chunk_count, embedded_count=added_count)
+        if previous["file_path"] != job["file_path"]:
+            await document_service.delete_file_lyl(previous["file_path"])
+        log_lyl.success(f"文档更新成功: {job['filename']}, ID: {doc_id}")
+
+    async def _ensure_document_lyl(self, doc_id: int, job: Dict[str, Any]) -> None:
+        """提交前确认文档仍存在，已被删除时抛出异常由调用方撤销本次写入_lyl"""
+        if await document_service.get_document_by_id_lyl(doc_id) is None:
+            raise ValueError(f"文档在入库过程中已被删除: {job['filename']}")
+
+    async def _finish_duplicate_lyl(self, job: Dict[str, Any], duplicate: Dict[str, Any]) -> None:
+        """重复上传：删除多余的文件副本，任务直接完成_lyl"""
+        if duplicate["file_path"] != job["file_path"]:
+            await document_service.delete_file_lyl(job["file_path"])
+        self._live[job["id"]] = {"stage": STAGE_DONE_LYL, "progress": 100}
+        await self._update_job_lyl(
+            job["id"], status=JOB_COMPLETED_LYL, stage=STAGE_DONE_LYL, progress=100,
+            document_id=duplicate["id"], outcome=OUTCOME_DUPLICATE_LYL,
+            chunk_count=duplicate["chunk_count"]
+        )
+        log_lyl.info(f"文档内容与已有文档 {duplicate['id']} 相同，跳过: {job['filename']}")
+
+    async def _rollback_lyl(self, job: Dict[str, Any]) -> None:
+        """撤销被中断任务的部分写入_lyl"""
+        if job["outcome"] == OUTCOME_UPDATED_LYL:
+            document = await document_service.get_document_by_id_lyl(job["document_id"])
+            if document is not None and await self._revision_committed_lyl(job, document):
+                # 已提交的修订可能还没来得及登记过期向量的墓碑
+                if job["stale_chunk_ids"]:
+                    await vector_store_service.delete_chunks_lyl(json.loads(job["stale_chunk_ids"]))
+                return
+            await self._rollback_revision_lyl(job["document_id"], job["chunk_watermark"] or 0)
+        elif job["outcome"] == OUTCOME_CREATED_LYL:
+            await self._discard_document_lyl(job["document_id"])
+
+    async def _revision_committed_lyl(self, job: Dict[str, Any], document: Dict[str, Any]) -> bool:
+        """被中断的修订是否已提交_lyl - 已提交时不再撤销
+
+        上传的修订版以文档哈希已是新版本为准，重新执行会按重复上传直接完成；
+        重新分块不改变文档哈希，未提交时原分块全部保留，分块行数多于文档记录的分块数。
+        """
+        if job["kind"] == JOB_KIND_RECHUNK_LYL:
+            return await document_service.count_chunks_lyl(document["id"]) == document["chunk_count"]
+        return document["content_hash"] == job["content_hash"]
+
+    async def _rollback_revision_lyl(self, doc_id: int, watermark: int) -> None:
+        """删除修订过程中新增的分块及其向量_lyl"""
+        rows = await db_manager.fetch_all_lyl(
+            "SELECT id FROM chunks WHERE document_id = ? AND id > ?", (doc_id, watermark)
+        )
+        chunk_ids = [row["id"] for row in rows]
+        await vector_store_service.delete_chunks_lyl(chunk_ids)
+        await document_service.delete_chunk_records_lyl(chunk_ids)
+
+    async def _delete_document_lyl(self, doc_id: int, file_path: str) -> int:
+        """删除文档的向量、数据库记录与文件，返回登记墓碑的向量数_lyl
+
+        先登记墓碑再删除分块记录，中断后重新执行时仍能按分块记录找到全部向量。
+        """
+        removed = await vector_store_service.delete_by_document_lyl(doc_id)
+        await document_service.delete_document_record_lyl(doc_id)
+        await document_service.delete_file_lyl(file_path)
+        return removed
+
+    async def _discard_document_lyl(self, doc_id: int) -> None:
+        """删除文档记录及其向量_lyl"""
+        await vector_store_service.delete_by_document_lyl(doc_id)
+        await document_service.delete_document_record_lyl(doc_id)
+
+
+# 全局实例
+ingestion_service = IngestionService_lyl()
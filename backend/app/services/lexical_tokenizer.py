@@ -0,0 +1,56 @@
+"""
+全文检索分词模块 - 为SQLite FTS5生成中英文混合的检索词
+
+FTS5内置的unicode61分词器不切分连续的中日韩文字，整段中文会成为一个词。
+这里在写入与查询前自行分词：中日韩文字切为重叠的二元组（单字成段时保留单字），
+字母数字按连续片段成词，转为小写；结果以空格连接后交给unicode61按空格切分。
+课程代码、型号等标识符因此可以精确命中，中文词语也能按二元组匹配。
+"""
+import re
+import unicodedata
+from typing import List
+
+# 中日韩统一表意文字（含扩展A与兼容区）、日文假名与韩文音节
+CJK_RUN_PATTERN_LYL = re.compile(
+    r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]+"
+)
+WORD_PATTERN_LYL = re.compile(r"[0-9a-z\u00c0-\u024f]+")
+
+# 单个查询最多使用的检索词数，限制超长查询的匹配开销
+MAX_QUERY_TERMS_LYL = 64
+
+
+def tokenize_lyl(text: str) -> List[str]:
+    """把文本切分为检索词_lyl - 中日韩文字取二元组，字母数字按片段成词"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens: List[str] = []
+    position = 0
+    for match in CJK_RUN_PATTERN_LYL.finditer(text):
+        tokens.extend(WORD_PATTERN_LYL.findall(text, position, match.start()))
+        run = match.group()
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        position = match.end()
+    tokens.extend(WORD_PATTERN_LYL.findall(text, position))
+    return tokens
+
+
+def index_text_lyl(text: str) -> str:
+    """生成写入FTS5表的分词文本_lyl"""
+    return " ".join(tokenize_lyl(text))
+
+
+def match_query_lyl(query: str) -> str:
+    """生成FTS5 MATCH表达式_lyl - 各检索词以OR连接，由bm25为稀有词加权
+
+    检索词只含字母数字与中日韩文字，加双引号后不会被解析为FTS5运算符；
+    单独的中日韩字符用前缀匹配，以命中以该字开头的二元组。
+    查询中没有可检索的词时返回空串。
+    """
+    terms = list(dict.fromkeys(tokenize_lyl(query)))[:MAX_QUERY_TERMS_LYL]
+    return " OR ".join(
+        f'"{term}"*' if len(term) == 1 and CJK_RUN_PATTERN_LYL.match(term) else f'"{term}"'
+        for term in terms
+    )
@@ -1,12 +1,15 @@
 """
 RAG工具模块 - 将RAG封装为LangChain工具供Agent使用
-使用LangChain v1.0的@tool装饰器方式
+使用LangChain v1.0的@tool装饰器方式，工具为异步函数，在应用的事件循环中执行
 """
-import asyncio
 import json
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional
 from langchain.tools import tool
 
+from backend.app.core.config import settings
 from backend.app.core.logger import log_lyl
+from backend.app.models.schemas import SearchFilter_lyl
 from backend.app.services.vector_store_service import vector_store_service
 
 # 全局变量存储最近的检索结果，供前端溯源使用
@@ -25,13 +28,20 @@ def clear_sources_lyl():
     _last_search_sources_lyl = []
 
 
-async def search_knowledge_base_async_lyl(query: str) -> str:
+async def search_knowledge_base_async_lyl(
+    query: str, search_filter: Optional[SearchFilter_lyl] = None
+) -> str:
     """异步搜索知识库_lyl"""
     global _last_search_sources_lyl
     log_lyl.info(f"RAG工具: 开始搜索知识库，query: {query[:50]}...")
     try:
         # 搜索相关文档
-        results = await vector_store_service.search_lyl(query, k=3)
+        results = await vector_store_service.search_lyl(
+            query,
+            k=settings.RAG_TOP_K,
+            search_filter=search_filter,
+            mode=settings.RAG_SEARCH_MODE
+        )
 
         if not results:
             log_lyl.info("RAG工具: 未找到相关信息")
@@ -66,36 +76,67 @@ async def search_knowledge_base_async_lyl(query: str) -> str:
         return f"检索知识库时发生错误: {str(e)}"
 
 
+def parse_date_lyl(value: Optional[str]) -> Optional[date]:
+    """值只含日期（YYYY-MM-DD）时返回该日期，否则返回None_lyl"""
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value.strip())
+    except ValueError:
+        return None
+
+
+def build_search_filter_lyl(
+    file_types: Optional[List[str]] = None,
+    created_after: Optional[str] = None,
+    created_before: Optional[str] = None,
+) -> SearchFilter_lyl:
+    """按工具参数创建过滤条件_lyl
+
+    只给出日期的 created_before 包含当天：转换为次日零点（不含）的上限，
+    否则会被解析为当天零点而排除当天上传的文档。不带时区的日期与时间按本机时区解释。
+    """
+    before_day = parse_date_lyl(created_before)
+    if before_day is None:
+        return SearchFilter_lyl(
+            file_types=file_types, created_after=created_after, created_before=created_before
+        )
+    return SearchFilter_lyl(
+        file_types=file_types,
+        created_after=created_after,
+        created_before_exclusive=datetime.combine(before_day + timedelta(days=1), time()),
+    )
+
+
 @tool
-def knowledge_base_search_lyl(query: str) -> str:
+async def knowledge_base_search_lyl(
+    query: str,
+    file_types: Optional[List[str]] = None,
+    created_after: Optional[str] = None,
+    created_before: Optional[str] = None,
+) -> str:
     """从个人知识库中检索相关信息的工具。
     当用户询问的问题可能与知识库中的文档相关时，使用此工具搜索相关内容。
     输入应该是用户问题的关键部分或完整问题。
+    用户明确限定文件类型或上传时间时，可填写对应的过滤参数，否则留空。
     返回知识库中与问题最相关的文档片段。
 
     Args:
         query: 用户的问题或查询内容
+        file_types: 只检索这些类型的文件，如 ["pdf", "md"]
+        created_after: 只检索该日期（含当天）之后上传的文档，格式 YYYY-MM-DD，按本地时间
+        created_before: 只检索该日期（含当天）之前上传的文档，格式 YYYY-MM-DD，按本地时间
 
     Returns:
         知识库中与问题最相关的文档片段
     """
-    # 在同步上下文中运行异步函数
     try:
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            # 如果事件循环正在运行，创建新任务
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(
-                    asyncio.run,
-                    search_knowledge_base_async_lyl(query)
-                )
-                return future.result()
-        else:
-            return loop.run_until_complete(search_knowledge_base_async_lyl(query))
-    except RuntimeError:
-        # 没有事件循环，创建新的
-        return asyncio.run(search_knowledge_base_async_lyl(query))
+        search_filter = build_search_filter_lyl(file_types, created_after, created_before)
+    except ValueError as e:
+        return f"过滤参数无效: {str(e)}"
+
+    # Agent经astream_events在应用的事件循环中调用本工具，检索与查询嵌入合并都在同一个循环中进行
+    return await search_knowledge_base_async_lyl(query, search_filter)
 
 
 def get_rag_tools_lyl() -> list:
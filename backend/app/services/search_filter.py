@@ -0,0 +1,41 @@
+"""
+检索过滤模块 - 把检索过滤条件转换为SQL条件
+
+向量检索与全文检索共用，过滤条件作用于 documents 表（别名d）。
+documents.created_at 由 CURRENT_TIMESTAMP 写入，是UTC时间；用户给出的时间多为本地时间，
+因此不带时区的时间按本机时区解释，比较前统一转换为UTC。
+"""
+from datetime import datetime, timezone
+from typing import Any, List, Tuple
+
+from backend.app.models.schemas import SearchFilter_lyl
+
+
+def sqlite_timestamp_lyl(value: datetime) -> str:
+    """转换为与 CURRENT_TIMESTAMP 一致的UTC时间字符串_lyl - 不带时区的时间按本机时区解释"""
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def filter_conditions_lyl(search_filter: SearchFilter_lyl) -> Tuple[str, List[Any]]:
+    """把过滤条件转换为针对 documents 表（别名d）的WHERE子句与参数_lyl"""
+    conditions: List[str] = []
+    params: List[Any] = []
+    if search_filter.document_ids is not None:
+        conditions.append(f"d.id IN ({','.join('?' * len(search_filter.document_ids))})")
+        params.extend(search_filter.document_ids)
+    if search_filter.file_types is not None:
+        file_types = {
+            "." + file_type.lower().lstrip(".") for file_type in search_filter.file_types
+        }
+        conditions.append(f"d.file_type IN ({','.join('?' * len(file_types))})")
+        params.extend(sorted(file_types))
+    if search_filter.created_after is not None:
+        conditions.append("d.created_at >= ?")
+        params.append(sqlite_timestamp_lyl(search_filter.created_after))
+    if search_filter.created_before is not None:
+        conditions.append("d.created_at <= ?")
+        params.append(sqlite_timestamp_lyl(search_filter.created_before))
+    if search_filter.created_before_exclusive is not None:
+        conditions.append("d.created_at < ?")
+        params.append(sqlite_timestamp_lyl(search_filter.created_before_exclusive))
+    return " AND ".join(conditions) or "1", params
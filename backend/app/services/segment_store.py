@@ -0,0 +1,294 @@
+"""
+向量分段存储模块 - 以只追加的不可变分段文件持久化向量索引
+
+目录结构:
+    manifest.json               当前有效的分段列表与已删除向量ID（墓碑）
+    segments/seg_000001.faiss   分段的 IndexIDMap2 索引
+    segments/seg_000001.ids.npy      升序排列的分段内向量ID
+    segments/seg_000001.vectors.npy  与ids同序的全精度float32向量
+    segments/seg_000007.pca.npz      PCA降维参数（启用PCA降维时，以训练它的重建分段命名）
+
+分块的文本与元数据保存在数据库 chunks 表中，以向量ID为主键，检索时只读取命中的分块。
+
+每次上传只写入一个新分段并原子替换 manifest，磁盘写入量与上传文档大小成正比；
+分段一经写入不再修改，删除通过墓碑记录，由后台合并时真正清除。
+索引文件可以内存映射方式打开，启动时无需读入全部数据；
+全精度向量同样以内存映射方式打开，只在合并和量化索引的精确重排时读取。
+"""
+import io
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Any, Iterator, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from backend.app.services.dimension_reducer import DimensionReducer_lyl
+from backend.app.services.index_factory import (
+    QUANTIZATION_NONE_LYL,
+    index_type_of_lyl,
+    quantization_of_lyl,
+)
+
+MANIFEST_FILE_LYL = "manifest.json"
+SEGMENTS_DIR_LYL = "segments"
+
+# 旧版分段把分块内容保存在jsonl文件中，加载时回填到chunks表
+LEGACY_SEGMENT_SUFFIXES_LYL = (".jsonl", ".offsets.npy")
+
+
+def fsync_write_lyl(path: Path, data: bytes) -> None:
+    """写入临时文件、fsync后原子替换目标文件_lyl"""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_dir_lyl(path.parent)
+
+
+def fsync_dir_lyl(directory: Path) -> None:
+    """fsync目录项，保证重命名落盘_lyl（Windows不支持时忽略）"""
+    try:
+        fd = os.open(str(directory), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def npy_bytes_lyl(array: np.ndarray) -> bytes:
+    """序列化为.npy格式字节_lyl"""
+    buffer = io.BytesIO()
+    np.save(buffer, array)
+    return buffer.getvalue()
+
+
+class Segment_lyl:
+    """不可变向量分段_lyl"""
+
+    def __init__(
+        self,
+        name: str,
+        index: faiss.IndexIDMap2,
+        raw_ids: Optional[np.ndarray] = None,
+        raw_vectors: Optional[np.ndarray] = None,
+    ):
+        """初始化分段_lyl - raw_ids须升序，raw_vectors与之同序"""
+        self.name = name
+        self.index = index
+        self.raw_ids = raw_ids
+        self.raw_vectors = raw_vectors
+        self.index_type = index_type_of_lyl(index)
+        self.quantization = quantization_of_lyl(index)
+
+    @property
+    def ids(self) -> np.ndarray:
+        """分段内全部向量ID_lyl"""
+        return faiss.vector_to_array(self.index.id_map)
+
+    @property
+    def is_quantized(self) -> bool:
+        """索引是否以有损编码存储向量_lyl"""
+        return self.quantization != QUANTIZATION_NONE_LYL
+
+    def all_vectors_lyl(self) -> Tuple[np.ndarray, np.ndarray]:
+        """取回分段内全部向量及其ID_lyl - 优先读取全精度向量文件"""
+        if self.raw_vectors is not None:
+            return np.asarray(self.raw_ids), np.asarray(self.raw_vectors)
+        return self.ids, self.index.index.reconstruct_n(0, self.index.ntotal)
+
+    def exact_distances_lyl(self, query: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        """用全精度向量计算查询到候选的L2距离平方_lyl - 无效ID返回inf"""
+        distances = np.full(len(ids), np.inf, dtype=np.float32)
+        valid = ids != -1
+        if not valid.any():
+            return distances
+        if self.raw_vectors is not None:
+            positions = np.searchsorted(self.raw_ids, ids[valid])
+            vectors = self.raw_vectors[positions]
+        else:
+            vectors = np.stack([self.index.reconstruct(int(i)) for i in ids[valid]])
+        distances[valid] = ((vectors - query) ** 2).sum(axis=1)
+        return distances
+
+
+class SegmentStore_lyl:
+    """分段文件与manifest的读写_lyl"""
+
+    def __init__(self, root: Path):
+        """初始化分段存储_lyl"""
+        self.root = root
+        self.segments_path = root / SEGMENTS_DIR_LYL
+        self.segments_path.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def manifest_path(self) -> Path:
+        """manifest文件路径_lyl"""
+        return self.root / MANIFEST_FILE_LYL
+
+    def exists_lyl(self) -> bool:
+        """是否已存在分段存储_lyl"""
+        return self.manifest_path.exists()
+
+    def empty_manifest_lyl(self) -> Dict[str, Any]:
+        """空manifest_lyl"""
+        return {"version": 1, "next_segment": 1, "segments": [], "tombstones": []}
+
+    def load_manifest_lyl(self) -> Dict[str, Any]:
+        """读取manifest_lyl"""
+        if not self.exists_lyl():
+            return self.empty_manifest_lyl()
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def write_manifest_lyl(self, manifest: Dict[str, Any]) -> None:
+        """原子写入manifest_lyl"""
+        data = json.dumps(manifest, ensure_ascii=False).encode("utf-8")
+        fsync_write_lyl(self.manifest_path, data)
+
+    def allocate_name_lyl(self, manifest: Dict[str, Any]) -> str:
+        """分配新分段名称并递增计数_lyl"""
+        name = f"seg_{manifest['next_segment']:06d}"
+        manifest["next_segment"] += 1
+        return name
+
+    def segment_files_lyl(self, name: str) -> List[Path]:
+        """分段包含的全部文件_lyl"""
+        suffixes = (".faiss", ".ids.npy", ".vectors.npy") + LEGACY_SEGMENT_SUFFIXES_LYL
+        return [self.segments_path / f"{name}{suffix}" for suffix in suffixes]
+
+    def write_segment_lyl(self, segment: Segment_lyl) -> None:
+        """写入分段文件并fsync_lyl - 须在manifest引用该分段之前调用"""
+        index_bytes = faiss.serialize_index(segment.index).tobytes()
+        fsync_write_lyl(self.segments_path / f"{segment.name}.faiss", index_bytes)
+
+        if segment.raw_vectors is not None:
+            fsync_write_lyl(
+                self.segments_path / f"{segment.name}.ids.npy",
+                npy_bytes_lyl(np.asarray(segment.raw_ids, dtype=np.int64)),
+            )
+            fsync_write_lyl(
+                self.segments_path / f"{segment.name}.vectors.npy",
+                npy_bytes_lyl(np.ascontiguousarray(segment.raw_vectors, dtype=np.float32)),
+            )
+
+    def _load_raw_ids_lyl(self, name: str) -> Optional[np.ndarray]:
+        """读取与全精度向量同序的ID_lyl - 旧版分段从偏移表首列取得"""
+        ids_path = self.segments_path / f"{name}.ids.npy"
+        if ids_path.exists():
+            return np.load(ids_path, mmap_mode="r")
+        offsets_path = self.segments_path / f"{name}.offsets.npy"
+        if offsets_path.exists():
+            ids = np.ascontiguousarray(np.load(offsets_path)[:, 0])
+            fsync_write_lyl(ids_path, npy_bytes_lyl(ids))
+            return ids
+        return None
+
+    def read_segment_lyl(self, name: str, mmap: bool = False) -> Segment_lyl:
+        """打开分段_lyl - mmap为True时索引以只读内存映射方式打开"""
+        index_path = str(self.segments_path / f"{name}.faiss")
+        index = None
+        if mmap:
+            try:
+                index = faiss.read_index(
+                    index_path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+                )
+            except RuntimeError:
+                # 当前平台或索引类型不支持内存映射时退回普通读取
+                index = None
+        if index is None:
+            index = faiss.read_index(index_path)
+
+        raw_ids, raw_vectors = None, None
+        vectors_path = self.segments_path / f"{name}.vectors.npy"
+        if vectors_path.exists():
+            raw_ids = self._load_raw_ids_lyl(name)
+            raw_vectors = np.load(vectors_path, mmap_mode="r")
+        return Segment_lyl(name, index, raw_ids, raw_vectors)
+
+    def legacy_chunks_lyl(self, name: str) -> Iterator[Tuple[int, str, Dict[str, Any]]]:
+        """遍历旧版分段jsonl中的分块 (向量ID, 文本, 元数据)_lyl"""
+        path = self.segments_path / f"{name}.jsonl"
+        if not path.exists():
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    yield item["id"], item["page_content"], item["metadata"]
+
+    def drop_legacy_files_lyl(self, name: str) -> None:
+        """分块内容回填到chunks表后删除旧版jsonl与偏移表_lyl"""
+        for suffix in LEGACY_SEGMENT_SUFFIXES_LYL:
+            path = self.segments_path / f"{name}{suffix}"
+            if path.exists():
+                path.unlink()
+
+    def warm_segment_lyl(self, name: str, block_size: int = 4 * 1024 * 1024) -> None:
+        """顺序读取索引与ID文件，把热点页预读进页缓存_lyl
+
+        全精度向量只在重排时按行读取，不预热。
+        """
+        for suffix in (".faiss", ".ids.npy"):
+            path = self.segments_path / f"{name}{suffix}"
+            if not path.exists():
+                continue
+            with open(path, "rb") as f:
+                if hasattr(os, "posix_fadvise"):
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+                while f.read(block_size):
+                    pass
+
+    def delete_segment_files_lyl(self, names: List[str]) -> None:
+        """删除已不被manifest引用的分段文件_lyl"""
+        for name in names:
+            for path in self.segment_files_lyl(name):
+                try:
+                    if path.exists():
+                        path.unlink()
+                except OSError:
+                    # Windows下仍被内存映射的文件无法删除，留待下次启动时清理
+                    pass
+
+    def reducer_file_lyl(self, name: str) -> str:
+        """降维参数文件名_lyl"""
+        return f"{name}.pca.npz"
+
+    def write_reducer_lyl(self, file_name: str, reducer: DimensionReducer_lyl) -> None:
+        """写入PCA降维参数并fsync_lyl - 须在manifest引用之前调用"""
+        fsync_write_lyl(self.segments_path / file_name, reducer.to_bytes_lyl())
+
+    def load_reducer_lyl(self, manifest: Dict[str, Any]) -> DimensionReducer_lyl:
+        """按manifest记录加载降维器_lyl - 旧manifest没有记录时不降维"""
+        reduction = manifest.get("reduction")
+        if not reduction:
+            return DimensionReducer_lyl()
+        path = self.segments_path / reduction["file"] if reduction.get("file") else None
+        return DimensionReducer_lyl.load_lyl(reduction["method"], reduction["dim"], path)
+
+    def delete_file_lyl(self, file_name: str) -> None:
+        """删除分段目录下已不被引用的单个文件_lyl"""
+        try:
+            (self.segments_path / file_name).unlink(missing_ok=True)
+        except OSError:
+            pass
+
+    def cleanup_orphans_lyl(self, manifest: Dict[str, Any]) -> None:
+        """删除未被manifest引用的分段文件、降维参数与残留临时文件_lyl"""
+        referenced = set(manifest["segments"])
+        reduction_file = (manifest.get("reduction") or {}).get("file")
+        if reduction_file:
+            referenced.add(reduction_file.split(".", 1)[0])
+        for path in self.segments_path.iterdir():
+            if path.name.split(".", 1)[0] not in referenced:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
@@ -0,0 +1,82 @@
+"""
+提取文本缓存模块 - 压缩保存解析出的逐页文本，重新分块时直接读取而不再解析原文件
+
+PyPDFLoader、Docx2txtLoader 与 unstructured 的解析占入库耗时的大部分，
+而分块参数变化后只需要把已提取的文本重新切分。缓存为zlib压缩的JSON Lines，每行一页：
+
+    {"text": 页面文本, "metadata": 页面元数据（source、page、page_label等）}
+
+行与行之间即页面边界。text_hash为未压缩内容的SHA-256，读取时校验，不一致视为缓存损坏。
+页面文本在切分前统一规范化（见 normalize_text_lyl），缓存中保存的正是分割器看到的文本，
+从缓存切分与重新解析得到的分块相同。
+
+本模块在解析子进程中也会被导入，不依赖配置与全局服务实例。
+"""
+import hashlib
+import json
+import unicodedata
+import zlib
+from typing import Any, Dict, List
+
+from langchain_core.documents import Document
+
+COMPRESSION_LEVEL_LYL = 6
+
+
+class TextCacheError_lyl(Exception):
+    """提取文本缓存损坏_lyl"""
+
+
+def normalize_text_lyl(text: str) -> str:
+    """规范化提取出的文本_lyl - 统一换行符、去掉NUL字符并转为NFC形式"""
+    text = text.replace("\r\n", "\n").replace("\r", "\n").replace("\x00", "")
+    return unicodedata.normalize("NFC", text)
+
+
+class TextCacheWriter_lyl:
+    """逐批写入页面的缓存编码器_lyl - 内存中只保留压缩后的数据"""
+
+    def __init__(self):
+        """初始化编码器_lyl"""
+        self._compressor = zlib.compressobj(COMPRESSION_LEVEL_LYL)
+        self._hasher = hashlib.sha256()
+        self._parts: List[bytes] = []
+        self.page_count = 0
+        self.char_count = 0
+
+    def add_pages_lyl(self, pages: List[Document]) -> None:
+        """按页序追加页面_lyl"""
+        for page in pages:
+            line = json.dumps(
+                {"text": page.page_content, "metadata": page.metadata},
+                ensure_ascii=False, default=str
+            ).encode("utf-8") + b"\n"
+            self._hasher.update(line)
+            self._parts.append(self._compressor.compress(line))
+            self.page_count += 1
+            self.char_count += len(page.page_content)
+
+    def finish_lyl(self) -> Dict[str, Any]:
+        """结束写入，返回 data（压缩数据）、text_hash、page_count 与 char_count_lyl"""
+        self._parts.append(self._compressor.flush())
+        return {
+            "data": b"".join(self._parts),
+            "text_hash": self._hasher.hexdigest(),
+            "page_count": self.page_count,
+            "char_count": self.char_count,
+        }
+
+
+def decode_text_cache_lyl(data: bytes, text_hash: str) -> List[Document]:
+    """解压并校验缓存，返回按页序排列的页面_lyl - 损坏时抛出 TextCacheError_lyl"""
+    try:
+        raw = zlib.decompress(data)
+    except zlib.error as e:
+        raise TextCacheError_lyl(f"解压失败: {e}") from None
+    if hashlib.sha256(raw).hexdigest() != text_hash:
+        raise TextCacheError_lyl("内容哈希不一致")
+    pages = []
+    for line in raw.splitlines():
+        item = json.loads(line)
+        pages.append(Document(page_content=item["text"], metadata=item["metadata"]))
+    return pages
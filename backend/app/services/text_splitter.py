@@ -0,0 +1,232 @@
+"""
+中英文句子感知的文本分割模块 - 单遍扫描切分，支持字符数或近似token数预算
+
+RecursiveCharacterTextSplitter 对每一级分隔符整体 re.split 一次，超长片段再逐级重切，
+没有标点的长段中文最终按单字拆开再逐字合并，大文本上开销很高；句末标点还会被分到下一块的开头。
+
+这里从每块的起点向后只看一个预算窗口，按与 RecursiveCharacterTextSplitter 相同的分隔符优先级
+（段落 > 换行 > 句末 > 空白）选窗口内出现的最高一级断点，同级取最靠后的一个，没有断点时在窗口末尾硬切；
+标点留在句末。下一块与 RecursiveCharacterTextSplitter 一样只重叠本块所在级别的完整片段：
+从重叠预算内最早的同级断点开始，且该处到下一片段结束不超过预算，没有这样的断点时不重叠；硬切的块按重叠预算硬切。
+每个字符只被扫描常数次，额外内存只与块大小有关。
+
+与 RecursiveCharacterTextSplitter 的对应关系:
+    由空行分隔、每段都短于 chunk_size 的文本，分块与其完全相同
+    中文只在句末标点（。！？）后或块长达到预算处断开，不在逗号等分句标点处断开
+    超过预算的段落在句末断开，标点留在句末而不是下一块开头，这部分分块与其不同
+
+吞吐: 按字符计长度时，有段落与标点的文本没有提速（约为 RecursiveCharacterTextSplitter 的0.6～1.2倍）；
+按近似token计长度或长段无标点的中文明显更快（见 backend/benchmarks/text_splitter_benchmark_lyl.py）。
+
+长度单位:
+    chars   字符数，与 RecursiveCharacterTextSplitter(length_function=len) 相同
+    tokens  近似token数：中日韩文字每字计1，其它字符每4个计1，与常见嵌入模型的分词结果大致相当
+
+本模块在解析子进程中执行，不依赖配置与全局服务实例。
+"""
+import re
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+from langchain_text_splitters import TextSplitter
+
+UNIT_CHARS_LYL = "chars"
+UNIT_TOKENS_LYL = "tokens"
+UNITS_LYL = (UNIT_CHARS_LYL, UNIT_TOKENS_LYL)
+
+LEVEL_PARAGRAPH_LYL = 0
+LEVEL_LINE_LYL = 1
+
+# 各级断点按优先级排列（段落 > 换行 > 句末 > 空白），与 RecursiveCharacterTextSplitter 的分隔符相同；
+# 段落、换行与空白在其之前断开（空白归入下一块开头后被去掉），标点在其之后断开（留在句末）
+BREAK_LEVELS_LYL = [
+    (re.compile(r"\n[ \t\r\f\v\u3000]*\n"), False),
+    (re.compile(r"\n"), False),
+    (re.compile(r"[。！？!?]+[”’」』）)\]\"']*|\.(?=\s)"), True),
+    (re.compile(r"[ \t\r\f\v\u3000]+"), False),
+]
+# 贪婪前缀使正则从窗口末尾回溯，直接得到每一级最靠后的断点
+LAST_BREAK_LEVELS_LYL = [
+    (re.compile(f"(?s:.*)({pattern.pattern})"), after) for pattern, after in BREAK_LEVELS_LYL
+]
+# 断点前后的空白，段落断点可能跨过窗口末尾
+SPACE_RUN_PATTERN_LYL = re.compile(r"\s*")
+
+# 近似token数以1/4 token为单位计算，避免浮点误差
+QUARTERS_PER_TOKEN_LYL = 4
+# 按1个token估算的Unicode区块（以256个码位为单位）：全角标点与日文假名、中日韩统一表意文字（含扩展A）、
+# 韩文音节、兼容表意文字与全角字符；其余字符每个计1/4 token
+CJK_BLOCKS_LYL = (
+    (0x30, 0x30),
+    (0x34, 0x4D),
+    (0x4E, 0x9F),
+    (0xAC, 0xD7),
+    (0xF9, 0xFA),
+    (0xFF, 0xFF),
+)
+BLOCK_WEIGHTS_LYL = np.ones(256, dtype=np.int32)
+for _low, _high in CJK_BLOCKS_LYL:
+    BLOCK_WEIGHTS_LYL[_low:_high + 1] = QUARTERS_PER_TOKEN_LYL
+
+
+def char_weights_lyl(text: str) -> np.ndarray:
+    """各字符的近似长度，单位1/4 token_lyl - 中日韩字符计4，其它字符计1"""
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    return BLOCK_WEIGHTS_LYL[np.minimum(codes >> 8, 0xFF)]
+
+
+def estimate_tokens_lyl(text: str) -> float:
+    """估算文本的token数_lyl - 中日韩文字每字1个，其它字符每4个1个"""
+    return int(char_weights_lyl(text).sum()) / QUARTERS_PER_TOKEN_LYL
+
+
+class SentenceTextSplitter_lyl(TextSplitter):
+    """中英文句子感知的单遍文本分割器_lyl"""
+
+    def __init__(
+        self, chunk_size: int = 500, chunk_overlap: int = 50,
+        unit: str = UNIT_CHARS_LYL, **kwargs: Any
+    ):
+        """初始化分割器_lyl - chunk_size与chunk_overlap以unit计"""
+        if unit not in UNITS_LYL:
+            raise ValueError(f"不支持的长度单位: {unit}，可选: {', '.join(UNITS_LYL)}")
+        length_function = len if unit == UNIT_CHARS_LYL else estimate_tokens_lyl
+        super().__init__(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+            length_function=length_function, **kwargs
+        )
+        self.unit = unit
+        self._scale = 1 if unit == UNIT_CHARS_LYL else QUARTERS_PER_TOKEN_LYL
+        self._budget = chunk_size * self._scale
+        self._overlap = chunk_overlap * self._scale
+
+    def _window_end_lyl(self, text: str, start: int) -> int:
+        """从start起长度不超过预算的最远位置_lyl"""
+        # 每个字符至少计1个单位，窗口不会超过 start + budget
+        limit = min(len(text), start + self._budget)
+        if self.unit == UNIT_CHARS_LYL:
+            return limit
+        cumulative = np.cumsum(char_weights_lyl(text[start:limit]))
+        return start + max(1, int(np.searchsorted(cumulative, self._budget, side="right")))
+
+    def _overlap_start_lyl(self, text: str, end: int, floor: int) -> int:
+        """末尾长度不超过重叠预算的最早位置_lyl - 不早于floor"""
+        low = max(floor, end - self._overlap)
+        if self.unit == UNIT_CHARS_LYL or low >= end:
+            return low
+        cumulative = np.cumsum(char_weights_lyl(text[low:end])[::-1])
+        return end - int(np.searchsorted(cumulative, self._overlap, side="right"))
+
+    def _measure_lyl(self, text: str, start: int, end: int) -> int:
+        """text[start:end] 的长度，单位与预算相同_lyl"""
+        if self.unit == UNIT_CHARS_LYL:
+            return end - start
+        return int(char_weights_lyl(text[start:end]).sum())
+
+    @staticmethod
+    def _last_break_lyl(text: str, start: int, end: int) -> Optional[Tuple[int, int]]:
+        """(start, end] 内优先级最高的断点及其级别，同级取最靠后的一个_lyl
+
+        逐级查找，多数窗口在句末一级即可找到；越过窗口末尾的空白再多扫描一个字符，
+        使从窗口末尾开始的段落断点与窗口末尾的英文句点都能被看到。
+        """
+        scan_end = min(len(text), SPACE_RUN_PATTERN_LYL.match(text, end).end() + 1)
+        last_newline = text.rfind("\n", start, scan_end)
+        for level, (pattern, after) in enumerate(LAST_BREAK_LEVELS_LYL):
+            if level <= LEVEL_LINE_LYL:
+                if last_newline < 0:
+                    continue
+                # 换行类断点不会越过最后一个换行，从那里开始回溯
+                stop = last_newline + 1
+            else:
+                stop = scan_end
+            while (match := pattern.match(text, start, stop)) is not None:
+                position = match.end(1) if after else match.start(1)
+                if position <= end:
+                    if position > start:
+                        return position, level
+                    break
+                stop = match.start(1)
+        return None
+
+    @staticmethod
+    def _first_break_lyl(text: str, start: int, end: int, level: int) -> Optional[int]:
+        """[start, end) 内不低于level一级的最早断点_lyl
+
+        逐级用单个正则查找后取最早的一个，比合并成一个带分组的正则快一倍；从start前一个字符开始，
+        使紧贴start的句末标点也能被看到。
+        """
+        scan_end = min(len(text), SPACE_RUN_PATTERN_LYL.match(text, end).end() + 1)
+        has_newline = text.find("\n", start, scan_end) >= 0
+        first = None
+        for found, (pattern, after) in enumerate(BREAK_LEVELS_LYL[:level + 1]):
+            if found <= LEVEL_LINE_LYL and not has_newline:
+                continue
+            search_from = max(0, start - 1)
+            while (match := pattern.search(text, search_from, scan_end)) is not None:
+                position = match.end() if after else match.start()
+                if position >= start:
+                    if position < end and (first is None or position < first):
+                        first = position
+                    break
+                search_from = match.end()
+        return first
+
+    def _piece_end_lyl(self, text: str, end: int, level: int) -> Optional[int]:
+        """end之后下一片段的结束位置，即下一个不低于level一级的断点_lyl - 超出预算时返回None"""
+        stop = min(len(text), end + self._budget + 1)
+        position = self._first_break_lyl(text, end + 1, stop, level)
+        if position is None and stop == len(text):
+            return len(text)
+        return position
+
+    def _cut_lyl(self, text: str, end: int, floor: int) -> Tuple[int, Optional[int]]:
+        """选定本块的结束位置及断点级别_lyl - (floor, end] 内没有断点时在end硬切，级别为None
+
+        floor为上一块的结束位置，重叠的块不会被上一块完全包含。
+        """
+        found = self._last_break_lyl(text, floor, end)
+        return (end, None) if found is None else found
+
+    def _next_start_lyl(self, text: str, start: int, end: int, level: Optional[int]) -> int:
+        """下一块的起点_lyl
+
+        与 RecursiveCharacterTextSplitter 相同，只重叠本块所在级别的完整片段：
+        取重叠预算内最早的同级断点，且从该处到下一片段结束不超过预算；没有这样的断点时不重叠。
+        """
+        if self._overlap <= 0:
+            return end
+        floor = self._overlap_start_lyl(text, end, start + 1)
+        if level is None:
+            return floor
+        position = self._first_break_lyl(text, floor, end, level)
+        if position is None:
+            return end
+        piece_end = self._piece_end_lyl(text, end, level)
+        if piece_end is None:
+            return end
+        # 越靠后的断点到下一片段结束越短，找到第一个放得下的即可
+        while position is not None:
+            if self._measure_lyl(text, position, piece_end) <= self._budget:
+                return position
+            position = self._first_break_lyl(text, position + 1, end, level)
+        return end
+
+    def split_text(self, text: str) -> List[str]:
+        """切分文本_lyl"""
+        chunks: List[str] = []
+        start = end = 0
+        while start < len(text):
+            # 与 RecursiveCharacterTextSplitter 相同，块长从分隔符开始计，空白在取出分块时去掉
+            window_end = self._window_end_lyl(text, start)
+            if window_end == len(text):
+                end, level = window_end, None
+            else:
+                end, level = self._cut_lyl(text, window_end, max(start, end))
+            chunk = text[start:end].strip()
+            if chunk:
+                chunks.append(chunk)
+            if end >= len(text):
+                break
+            start = self._next_start_lyl(text, start, end, level)
+        return chunks
@@ -1,124 +1,1116 @@
 """
 向量存储服务模块 - 管理文档向量的存储和检索
+
+每个分块的向量ID即 chunks 表的自增主键，分块文本与元数据也保存在该表中，
+检索时只按命中的ID读取。向量以只追加的分段持久化（见 segment_store），
+每次上传写入一个新分段；删除文档只记录墓碑，检索时通过 IDSelector 排除，
+分段数超过阈值后由后台任务按大小分层合并：只把大小相近的小分段合并在一起，
+已合并的大分段不会因为一批新的小分段而整体重写（见 _merge_candidates_lyl）；
+墓碑过多或需要升级索引时合并全部分段并清除墓碑；有效向量数达到升级阈值后，
+合并产生的分段使用配置的近似索引类型（见 index_factory）。
+量化存储的分段检索时多取 VECTOR_RERANK_FACTOR 倍候选，再用全精度向量精确重排。
+按文档、文件类型或上传时间过滤时，先在数据库中求出对应的分块ID区间，
+再以区间或位图选择器传入索引检索，过滤发生在扫描过程中。
+混合检索模式同时查询 chunks_fts 全文索引，两路结果按倒数排名融合。
+
+并发模型：写入、删除与合并提交由写锁串行化，每次提交生成新的只读快照
+（StoreSnapshot_lyl）并整体替换；检索不加锁，取得快照引用后在工作线程中扫描，
+既不会被上传阻塞，也不会看到写到一半的索引。
+
+启动时在后台加载：索引文件以内存映射方式打开，
+加载完成后即可检索（is_ready），随后在后台预热分段文件的页缓存。
 """
-import os
-from pathlib import Path
-from typing import List, Optional, Dict, Any
+import asyncio
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path, PureWindowsPath
+from typing import Callable, Iterator, List, Optional, Dict, Any, Set, Tuple
 
-from langchain_community.vectorstores import FAISS
+import faiss
+import numpy as np
 from langchain_core.documents import Document
 
 from backend.app.core.config import settings
+from backend.app.core.logger import log_lyl
+from backend.app.database.database import db_manager
+from backend.app.models.schemas import SearchFilter_lyl
+from backend.app.services.dimension_reducer import (
+    REDUCTION_NONE_LYL,
+    REDUCTION_PCA_LYL,
+    REDUCTION_TRUNCATE_LYL,
+    DimensionReducer_lyl,
+    train_pca_lyl,
+)
+from backend.app.services.document_service import content_hash_lyl, document_service
 from backend.app.services.embedding_service import embedding_service
+from backend.app.services.index_factory import (
+    INDEX_FLAT_LYL,
+    build_index_lyl,
+    resolve_index_type_lyl,
+    resolve_quantization_lyl,
+    search_params_lyl,
+)
+from backend.app.services.search_filter import filter_conditions_lyl
+from backend.app.services.segment_store import Segment_lyl, SegmentStore_lyl
+
+SEARCH_MODE_VECTOR_LYL = "vector"
+SEARCH_MODE_HYBRID_LYL = "hybrid"
+SEARCH_MODES_LYL = (SEARCH_MODE_VECTOR_LYL, SEARCH_MODE_HYBRID_LYL)
+
+# 旧版 langchain FAISS.save_local 生成的文件名
+LEGACY_INDEX_FILE_LYL = "index.faiss"
+LEGACY_DOCSTORE_FILE_LYL = "index.pkl"
+
+
+REBUILD_IDLE_LYL = "idle"
+REBUILD_RUNNING_LYL = "running"
+REBUILD_SUCCEEDED_LYL = "succeeded"
+REBUILD_FAILED_LYL = "failed"
+
+
+def build_segment_lyl(
+    name: str,
+    vectors: np.ndarray,
+    ids: List[int],
+    index_type: Optional[str] = None,
+    quantization: Optional[str] = None,
+    on_batch: Optional[Callable[[int], None]] = None,
+) -> Segment_lyl:
+    """由向量和ID构建内存中的分段_lyl - 传入on_batch时按 VECTOR_REBUILD_BATCH_SIZE 分批写入"""
+    batch_size = settings.VECTOR_REBUILD_BATCH_SIZE if on_batch is not None else None
+    index = build_index_lyl(vectors, ids, index_type, quantization, batch_size, on_batch)
+    order = np.argsort(ids)
+    return Segment_lyl(
+        name,
+        index,
+        raw_ids=np.asarray(ids, dtype=np.int64)[order],
+        raw_vectors=vectors[order],
+    )
+
+
+def throttle_lyl(
+    progress: Optional[Callable[[int], None]] = None
+) -> Callable[[int], None]:
+    """生成分批写入回调_lyl - 报告进度，并按本批耗时的 VECTOR_REBUILD_IDLE_RATIO 倍休眠，
+    把CPU让给在线检索；只在工作线程中调用"""
+    last = time.perf_counter()
+
+    def on_batch_lyl(done: int) -> None:
+        nonlocal last
+        if progress is not None:
+            progress(done)
+        idle = (time.perf_counter() - last) * settings.VECTOR_REBUILD_IDLE_RATIO
+        if idle > 0:
+            time.sleep(idle)
+        last = time.perf_counter()
+
+    return on_batch_lyl
+
+
+@contextmanager
+def limited_threads_lyl(threads: int) -> Iterator[None]:
+    """在当前线程内临时限制faiss的OpenMP线程数_lyl - threads为0时不限制"""
+    if threads <= 0:
+        yield
+        return
+    previous = faiss.omp_get_max_threads()
+    faiss.omp_set_num_threads(threads)
+    try:
+        yield
+    finally:
+        faiss.omp_set_num_threads(previous)
+
+
+def id_ranges_lyl(ids: np.ndarray) -> List[Tuple[int, int]]:
+    """把升序ID压缩为连续闭区间列表_lyl"""
+    if len(ids) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(ids) != 1)
+    starts = np.concatenate(([ids[0]], ids[breaks + 1]))
+    ends = np.concatenate((ids[breaks], [ids[-1]]))
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def merge_ranges_lyl(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """排序并合并相邻或重叠的闭区间_lyl"""
+    merged: List[Tuple[int, int]] = []
+    for lo, hi in sorted(ranges):
+        if merged and lo <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else:
+            merged.append((lo, hi))
+    return merged
+
+
+def reciprocal_rank_fusion_lyl(
+    rankings: List[List[int]], rrf_k: int = 60
+) -> List[Tuple[float, int]]:
+    """倒数排名融合_lyl - 各路排名第r的结果得 1/(rrf_k+r) 分，返回按融合分数降序的 (分数, ID)"""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, 1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(
+        ((score, item_id) for item_id, score in scores.items()),
+        key=lambda hit: (-hit[0], hit[1])
+    )
+
+
+class StoreSnapshot_lyl:
+    """向量存储某次提交后的只读视图_lyl
+
+    分段列表、墓碑集合、排除墓碑的选择器与降维器在提交时整体替换（写时复制），不原地修改。
+    检索先取得当前快照的引用，再在工作线程中扫描其中的分段，无需加锁，
+    也不会看到写到一半的状态；快照引用的分段与选择器在检索结束前不会被回收。
+    """
+
+    def __init__(
+        self,
+        segments: List[Segment_lyl],
+        tombstones: frozenset,
+        reducer: Optional[DimensionReducer_lyl] = None,
+    ):
+        """由分段列表、墓碑集合与分段向量所用的降维器构建快照_lyl"""
+        self.segments = segments
+        self.tombstones = tombstones
+        self.reducer = reducer or DimensionReducer_lyl()
+        self.tombstone_batch: Optional[faiss.IDSelectorBatch] = None
+        self.tombstone_selector: Optional[faiss.IDSelector] = None
+        if tombstones:
+            self.tombstone_batch = faiss.IDSelectorBatch(
+                np.fromiter(tombstones, dtype=np.int64, count=len(tombstones))
+            )
+            self.tombstone_selector = faiss.IDSelectorNot(self.tombstone_batch)
+
+    @property
+    def vector_count(self) -> int:
+        """快照中的有效向量数_lyl"""
+        return sum(segment.index.ntotal for segment in self.segments) - len(self.tombstones)
+
+
+class FilterSelector_lyl:
+    """过滤条件对应的向量ID选择器_lyl
+
+    过滤后的ID为单个连续区间时使用 IDSelectorRange 并与墓碑选择器取交集，
+    否则使用按ID置位的 IDSelectorBitmap，墓碑直接在位图中清除。
+    对象持有位图数组与子选择器的引用，检索结束前不得释放。
+    """
+
+    def __init__(
+        self,
+        ranges: List[Tuple[int, int]],
+        tombstones: Set[int],
+        tombstone_selector: Optional[faiss.IDSelector],
+    ):
+        """由升序且互不相邻的ID闭区间构建选择器_lyl"""
+        self._refs: List[Any] = []
+        if len(ranges) == 1:
+            lo, hi = ranges[0]
+            selector = faiss.IDSelectorRange(lo, hi + 1)
+            if tombstone_selector is not None:
+                self._refs.extend([selector, tombstone_selector])
+                selector = faiss.IDSelectorAnd(selector, tombstone_selector)
+        else:
+            size = ranges[-1][1] + 1
+            bits = np.zeros(size, dtype=bool)
+            for lo, hi in ranges:
+                bits[lo:hi + 1] = True
+            if tombstones:
+                dead = np.fromiter(tombstones, dtype=np.int64, count=len(tombstones))
+                bits[dead[dead < size]] = False
+            bitmap = np.packbits(bits, bitorder="little")
+            self._refs.append(bitmap)
+            selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+        self.selector = selector
 
 
 class VectorStoreService_lyl:
     """向量存储服务类_lyl"""
-    
+
     def __init__(self):
         """初始化向量存储服务_lyl"""
         self.store_path = Path(settings.VECTOR_STORE_PATH)
         self.store_path.mkdir(parents=True, exist_ok=True)
-        self._vector_store: Optional[FAISS] = None
-    
+        self.segment_store = SegmentStore_lyl(self.store_path)
+        self._manifest: Dict[str, Any] = self.segment_store.empty_manifest_lyl()
+        self._snapshot = StoreSnapshot_lyl([], frozenset())
+        # 串行化分段写入、删除与合并结果的提交
+        self._write_lock = asyncio.Lock()
+        # 合并与重建互斥，二者都替换整组分段
+        self._compaction_lock = asyncio.Lock()
+        self._merge_task: Optional[asyncio.Task] = None
+        self._rebuild_task: Optional[asyncio.Task] = None
+        self._rebuild_status: Dict[str, Any] = {"state": REBUILD_IDLE_LYL}
+        # 重新嵌入期间新上传分段的未降维向量，降维方式改变时用于重建这些分段
+        self._reembed_pending: Optional[Dict[str, Tuple[List[int], np.ndarray]]] = None
+        self._load_task: Optional[asyncio.Task] = None
+        self._warmup_task: Optional[asyncio.Task] = None
+        self._ready = False
+
+    @property
+    def segments(self) -> List[Segment_lyl]:
+        """当前有效分段列表_lyl"""
+        return self._snapshot.segments
+
     @property
-    def vector_store(self) -> Optional[FAISS]:
-        """获取向量存储实例_lyl"""
-        return self._vector_store
-    
+    def is_ready(self) -> bool:
+        """向量存储是否已加载完成、可以检索_lyl"""
+        return self._ready
+
     async def initialize_lyl(self) -> None:
         """初始化或加载向量存储_lyl"""
-        index_path = self.store_path / "index.faiss"
-        if index_path.exists():
-            await self.load_store_lyl()
-    
+        if self.segment_store.exists_lyl():
+            loaded = await self.load_store_lyl()
+        elif (self.store_path / LEGACY_INDEX_FILE_LYL).exists():
+            loaded = await self.migrate_legacy_store_lyl()
+        else:
+            loaded = True
+        if loaded:
+            await self._backfill_lexical_index_lyl()
+        self._ready = loaded
+        if loaded and settings.VECTOR_STORE_WARMUP and self._snapshot.segments:
+            self._warmup_task = asyncio.create_task(self.warmup_lyl())
+
+    def start_lyl(self) -> None:
+        """在后台开始加载向量存储，不阻塞应用启动_lyl"""
+        if self._load_task is None:
+            self._load_task = asyncio.create_task(self.initialize_lyl())
+
+    async def wait_ready_lyl(self) -> None:
+        """等待后台加载完成，加载失败时抛出异常_lyl"""
+        if self._load_task is not None:
+            await asyncio.shield(self._load_task)
+        if not self._ready:
+            raise RuntimeError("向量存储未就绪")
+
     async def load_store_lyl(self) -> bool:
-        """加载已存在的向量存储_lyl"""
+        """打开manifest引用的全部分段_lyl"""
         try:
-            self._vector_store = FAISS.load_local(
-                str(self.store_path),
-                embedding_service.embeddings,
-                allow_dangerous_deserialization=True
-            )
-            return True
+            manifest = self.segment_store.load_manifest_lyl()
+            await asyncio.to_thread(self.segment_store.cleanup_orphans_lyl, manifest)
+            segments = [
+                await asyncio.to_thread(
+                    self.segment_store.read_segment_lyl, name, settings.VECTOR_STORE_MMAP
+                )
+                for name in manifest["segments"]
+            ]
+            await self._backfill_legacy_chunks_lyl(manifest["segments"])
         except Exception as e:
-            print(f"加载向量存储失败: {e}")
+            log_lyl.error(f"加载向量存储失败: {e}")
             return False
-    
-    async def save_store_lyl(self) -> bool:
-        """保存向量存储到磁盘_lyl"""
-        if self._vector_store:
+
+        self._manifest = manifest
+        reducer = self.segment_store.load_reducer_lyl(manifest)
+        self._snapshot = StoreSnapshot_lyl(segments, frozenset(manifest["tombstones"]), reducer)
+        log_lyl.info(
+            f"向量存储加载完成，{len(segments)} 个分段，共 {self.get_document_count_lyl()} 个向量"
+        )
+        if segments and not reducer.matches_lyl(
+            settings.VECTOR_REDUCTION, settings.VECTOR_REDUCED_DIM
+        ):
+            log_lyl.warning(
+                f"向量存储使用的降维方式 {reducer.method}/{reducer.dim} 与配置不一致，"
+                f"以重新嵌入方式重建索引后生效"
+            )
+        return True
+
+    async def warmup_lyl(self) -> None:
+        """后台顺序读取分段文件预热页缓存_lyl"""
+        for segment in list(self._snapshot.segments):
             try:
-                self._vector_store.save_local(str(self.store_path))
-                return True
-            except Exception as e:
-                print(f"保存向量存储失败: {e}")
-                return False
-        return False
-    
-    async def add_documents_lyl(self, documents: List[Document]) -> int:
-        """添加文档到向量存储_lyl"""
+                await asyncio.to_thread(self.segment_store.warm_segment_lyl, segment.name)
+            except OSError:
+                # 预热期间分段可能已被合并删除
+                continue
+        log_lyl.debug("向量分段预热完成")
+
+    async def _commit_manifest_lyl(
+        self,
+        segments: List[Segment_lyl],
+        tombstones: Set[int],
+        reducer: Optional[DimensionReducer_lyl] = None,
+        reducer_file: Optional[str] = None,
+    ) -> None:
+        """持久化新的分段列表与墓碑并切换到新快照_lyl - 调用方须持有写锁
+
+        manifest落盘后才替换快照，检索要么看到提交前的状态，要么看到提交后的状态。
+        传入reducer时一并切换降维器，PCA参数文件须已写入。
+        """
+        self._manifest["segments"] = [segment.name for segment in segments]
+        self._manifest["tombstones"] = sorted(tombstones)
+        if reducer is not None:
+            self._manifest["reduction"] = {**reducer.describe_lyl(), "file": reducer_file}
+        await asyncio.to_thread(self.segment_store.write_manifest_lyl, self._manifest)
+        self._snapshot = StoreSnapshot_lyl(
+            segments, frozenset(tombstones), reducer or self._snapshot.reducer
+        )
+
+    def _write_and_open_lyl(self, segment: Segment_lyl) -> Segment_lyl:
+        """写入新分段后按启动模式重新打开，内存中不常驻分块内容_lyl"""
+        self.segment_store.write_segment_lyl(segment)
+        return self.segment_store.read_segment_lyl(segment.name, settings.VECTOR_STORE_MMAP)
+
+    async def _insert_chunks_lyl(
+        self, batches: List[Tuple[int, List[Document]]]
+    ) -> List[List[int]]:
+        """把各文档的分块在一个事务中写入chunks表并分配向量ID_lyl - 按文档返回ID列表"""
+        all_ids = []
+        async with db_manager.transaction_lyl() as conn:
+            for document_id, documents in batches:
+                ids = []
+                for i, doc in enumerate(documents):
+                    doc.metadata["document_id"] = document_id
+                    cursor = await conn.execute(
+                        """INSERT INTO chunks (document_id, chunk_index, content, metadata, content_hash)
+                           VALUES (?, ?, ?, ?, ?)""",
+                        (
+                            document_id,
+                            doc.metadata.get("chunk_index", i),
+                            doc.page_content,
+                            json.dumps(doc.metadata, ensure_ascii=False, default=str),
+                            content_hash_lyl(doc.page_content),
+                        )
+                    )
+                    ids.append(cursor.lastrowid)
+                all_ids.append(ids)
+        return all_ids
+
+    async def fetch_chunks_lyl(self, ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """按向量ID读取分块文本与元数据_lyl"""
+        if not ids:
+            return {}
+        placeholders = ",".join("?" * len(ids))
+        rows = await db_manager.fetch_all_lyl(
+            f"SELECT id, content, metadata FROM chunks WHERE id IN ({placeholders})",
+            tuple(ids)
+        )
+        return {
+            row["id"]: {
+                "content": row["content"] or "",
+                "metadata": json.loads(row["metadata"]) if row["metadata"] else {},
+            }
+            for row in rows
+        }
+
+    async def _backfill_legacy_chunks_lyl(self, names: List[str]) -> None:
+        """把旧版分段jsonl中的分块内容回填到chunks表后删除jsonl_lyl"""
+        for name in names:
+            items = await asyncio.to_thread(
+                lambda: list(self.segment_store.legacy_chunks_lyl(name))
+            )
+            if not items:
+                continue
+            async with db_manager.transaction_lyl() as conn:
+                await conn.executemany(
+                    "UPDATE chunks SET content = ?, metadata = ? WHERE id = ? AND content IS NULL",
+                    [
+                        (content, json.dumps(metadata, ensure_ascii=False, default=str), vector_id)
+                        for vector_id, content, metadata in items
+                    ]
+                )
+            await asyncio.to_thread(self.segment_store.drop_legacy_files_lyl, name)
+            log_lyl.info(f"分段 {name} 的 {len(items)} 个分块已迁移到chunks表")
+
+    async def _backfill_lexical_index_lyl(self) -> None:
+        """为旧版数据库或迁移得到的分块补建全文索引_lyl - 失败时只影响混合检索的全文一路"""
+        try:
+            count = await document_service.backfill_chunks_text_lyl()
+        except Exception as e:
+            log_lyl.error(f"补建全文索引失败: {e}")
+            return
+        if count:
+            log_lyl.info(f"已为 {count} 个分块补建全文索引")
+
+    async def add_documents_lyl(
+        self,
+        document_id: int,
+        documents: List[Document],
+        progress: Optional[Callable[[int, int], None]] = None,
+    ) -> List[int]:
+        """添加文档分块到向量存储，返回分配的向量ID_lyl
+
+        只写入本次上传的分段文件与manifest，不重写已有分段；
+        progress以 (已嵌入分块数, 总分块数) 报告嵌入进度。
+        """
         if not documents:
-            return 0
-        
-        if self._vector_store is None:
-            # 创建新的向量存储
-            self._vector_store = await FAISS.afrom_documents(
-                documents,
-                embedding_service.embeddings
+            return []
+        await self.wait_ready_lyl()
+
+        embeddings = await embedding_service.embed_texts_lyl(
+            [doc.page_content for doc in documents], progress
+        )
+        return await self.append_embedded_lyl(document_id, documents, embeddings)
+
+    async def append_embedded_lyl(
+        self,
+        document_id: int,
+        documents: List[Document],
+        embeddings: List[List[float]],
+    ) -> List[int]:
+        """把已嵌入的分块作为一个新分段追加到向量存储，返回分配的向量ID_lyl
+
+        提交后即可被检索；入库流水线按批调用，文档未解析完时已写入的分块就能被检索到。
+        """
+        if not documents:
+            return []
+        ids = await self.append_embedded_batch_lyl([(document_id, documents)], embeddings)
+        return ids[0]
+
+    async def append_embedded_batch_lyl(
+        self,
+        batches: List[Tuple[int, List[Document]]],
+        embeddings: Any,
+    ) -> List[List[int]]:
+        """把多个文档已嵌入的分块一次写入同一个新分段，按文档返回分配的向量ID_lyl
+
+        embeddings按batches中分块的先后顺序排列；批量入库在全部文件嵌入完成后调用一次，
+        只写一个分段文件、提交一次manifest。
+        """
+        if not any(documents for _, documents in batches):
+            return [[] for _ in batches]
+        await self.wait_ready_lyl()
+
+        full_vectors = np.asarray(embeddings, dtype=np.float32)
+        batch_ids = await self._insert_chunks_lyl(batches)
+        ids = [vector_id for document_ids in batch_ids for vector_id in document_ids]
+
+        async with self._write_lock:
+            snapshot = self._snapshot
+            reducer = None
+            if not snapshot.segments and settings.VECTOR_REDUCTION == REDUCTION_TRUNCATE_LYL:
+                # 空存储可以直接采用截断降维；PCA需要语料训练，由重新嵌入重建启用
+                reducer = DimensionReducer_lyl(REDUCTION_TRUNCATE_LYL, settings.VECTOR_REDUCED_DIM)
+            vectors = (reducer or snapshot.reducer).apply_lyl(full_vectors)
+            name = self.segment_store.allocate_name_lyl(self._manifest)
+            segment = await asyncio.to_thread(
+                self._write_and_open_lyl, build_segment_lyl(name, vectors, ids)
             )
-        else:
-            # 添加到现有存储
-            await self._vector_store.aadd_documents(documents)
-        
-        # 保存到磁盘
-        await self.save_store_lyl()
-        return len(documents)
-    
+            if self._reembed_pending is not None:
+                self._reembed_pending[name] = (ids, full_vectors)
+            await self._commit_manifest_lyl(
+                snapshot.segments + [segment], snapshot.tombstones, reducer
+            )
+
+        self.schedule_merge_lyl()
+        return batch_ids
+
     async def search_lyl(
-        self, 
-        query: str, 
+        self,
+        query: str,
         k: int = 4,
-        score_threshold: float = 0.5
+        score_threshold: float = 0.5,
+        search_filter: Optional[SearchFilter_lyl] = None,
+        mode: str = SEARCH_MODE_VECTOR_LYL
     ) -> List[Dict[str, Any]]:
-        """搜索相关文档_lyl"""
-        if self._vector_store is None:
-            return []
-        
+        """搜索相关文档_lyl - search_filter限定文档、文件类型或上传时间范围
+
+        mode为vector时score是L2距离（越小越相似）；
+        为hybrid时同时做全文检索并按倒数排名融合，score是融合分数（越大越相关）。
+        """
         try:
-            # 使用相似度搜索
-            docs_with_scores = await self._vector_store.asimilarity_search_with_score(
-                query, k=k
+            return (await self.search_texts_lyl([query], k, score_threshold, search_filter, mode))[0]
+        except Exception as e:
+            log_lyl.error(f"搜索失败: {e}")
+            return []
+
+    async def search_batch_lyl(
+        self,
+        queries: List[str],
+        k: int = 4,
+        score_threshold: float = 0.5,
+        search_filter: Optional[SearchFilter_lyl] = None,
+        mode: str = SEARCH_MODE_VECTOR_LYL
+    ) -> List[List[Dict[str, Any]]]:
+        """批量搜索_lyl - 一次嵌入调用，每个分段一次 (N×d) 检索，按查询顺序返回结果"""
+        if not queries:
+            return []
+        return await self.search_texts_lyl(queries, k, score_threshold, search_filter, mode)
+
+    async def search_texts_lyl(
+        self,
+        queries: List[str],
+        k: int,
+        score_threshold: float,
+        search_filter: Optional[SearchFilter_lyl],
+        mode: str
+    ) -> List[List[Dict[str, Any]]]:
+        """按检索模式检索一组查询，每个查询对应一组结果_lyl"""
+        if mode not in SEARCH_MODES_LYL:
+            raise ValueError(f"不支持的检索模式: {mode}")
+
+        if mode == SEARCH_MODE_VECTOR_LYL:
+            hits = await self._vector_hits_lyl(queries, k, score_threshold, search_filter)
+            return await self._hits_to_results_lyl(hits)
+
+        # 向量与全文两路并发召回，再按倒数排名融合
+        depth = max(k, settings.SEARCH_HYBRID_CANDIDATES)
+        vector_hits, lexical_hits = await asyncio.gather(
+            self._vector_hits_lyl(queries, depth, score_threshold, search_filter),
+            asyncio.gather(*(
+                document_service.search_chunks_text_lyl(query, depth, search_filter)
+                for query in queries
+            )),
+        )
+        hits = [
+            reciprocal_rank_fusion_lyl(
+                [[vector_id for _, vector_id in ranking] for ranking in (vector_row, lexical_row)],
+                settings.SEARCH_RRF_K
+            )[:k]
+            for vector_row, lexical_row in zip(vector_hits, lexical_hits)
+        ]
+        return await self._hits_to_results_lyl(hits)
+
+    async def _vector_hits_lyl(
+        self,
+        queries: List[str],
+        k: int,
+        score_threshold: float,
+        search_filter: Optional[SearchFilter_lyl]
+    ) -> List[List[Tuple[float, int]]]:
+        """嵌入查询并做向量检索_lyl - 多个查询共用一次嵌入调用"""
+        if not self._snapshot.segments:
+            return [[] for _ in queries]
+        if len(queries) == 1:
+            embeddings = [await embedding_service.embed_text_lyl(queries[0])]
+        else:
+            embeddings = await embedding_service.embed_texts_lyl(queries)
+        query_vectors = np.asarray(embeddings, dtype=np.float32)
+        return await self.search_vector_hits_lyl(query_vectors, k, score_threshold, search_filter)
+
+    async def _filter_ranges_lyl(self, search_filter: SearchFilter_lyl) -> List[Tuple[int, int]]:
+        """查询满足过滤条件的分块ID区间_lyl
+
+        同一文档的分块在一个事务内连续插入，ID通常连续，按文档聚合即可得到区间，
+        只有不连续的文档才读取全部分块ID。
+        """
+        where, params = filter_conditions_lyl(search_filter)
+        rows = await db_manager.fetch_all_lyl(
+            f"""SELECT c.document_id, MIN(c.id) AS min_id, MAX(c.id) AS max_id, COUNT(*) AS n
+                FROM chunks c JOIN documents d ON d.id = c.document_id
+                WHERE {where}
+                GROUP BY c.document_id""",
+            tuple(params)
+        )
+        ranges = []
+        scattered = []
+        for row in rows:
+            if row["max_id"] - row["min_id"] + 1 == row["n"]:
+                ranges.append((row["min_id"], row["max_id"]))
+            else:
+                scattered.append(row["document_id"])
+        if scattered:
+            placeholders = ",".join("?" * len(scattered))
+            id_rows = await db_manager.fetch_all_lyl(
+                f"SELECT id FROM chunks WHERE document_id IN ({placeholders}) ORDER BY id",
+                tuple(scattered)
+            )
+            ranges.extend(
+                id_ranges_lyl(np.asarray([row["id"] for row in id_rows], dtype=np.int64))
+            )
+        return merge_ranges_lyl(ranges)
+
+    @staticmethod
+    def _search_segments_lyl(
+        snapshot: StoreSnapshot_lyl,
+        query_vectors: np.ndarray,
+        k: int,
+        id_filter: Optional[FilterSelector_lyl] = None
+    ) -> List[List[Tuple[float, int]]]:
+        """在快照的全部分段中检索，返回每个查询按距离升序的 (距离, 向量ID) 前k个_lyl
+
+        在工作线程中执行，只读访问快照；过滤与墓碑排除都通过选择器在索引扫描内完成，
+        不在检索后再筛选。
+        """
+        segments = snapshot.segments
+        selector = id_filter.selector if id_filter is not None else snapshot.tombstone_selector
+        hits: List[List[Tuple[float, int]]] = [[] for _ in range(len(query_vectors))]
+        for segment in segments:
+            # 检索参数每次新建：IndexIDMap2检索时会临时改写参数中的选择器，不能跨线程共享
+            params = search_params_lyl(segment.index_type, selector)
+            if segment.is_quantized:
+                # 量化距离只用于召回候选，最终按全精度距离排序
+                _, ids = segment.index.search(
+                    query_vectors, k * settings.VECTOR_RERANK_FACTOR, params=params
+                )
+                distances = np.stack([
+                    segment.exact_distances_lyl(query_vectors[row], ids[row])
+                    for row in range(len(query_vectors))
+                ])
+            else:
+                distances, ids = segment.index.search(query_vectors, k, params=params)
+            for row in range(len(query_vectors)):
+                for score, vector_id in zip(distances[row], ids[row]):
+                    if vector_id != -1:
+                        hits[row].append((float(score), int(vector_id)))
+        return [sorted(row_hits)[:k] for row_hits in hits]
+
+    async def search_vector_hits_lyl(
+        self,
+        query_vectors: np.ndarray,
+        k: int = 4,
+        score_threshold: float = 0.5,
+        search_filter: Optional[SearchFilter_lyl] = None
+    ) -> List[List[Tuple[float, int]]]:
+        """按查询向量矩阵检索，每行查询对应按距离升序的 (距离, 向量ID)_lyl
+
+        查询向量为嵌入模型输出的原始维度，检索前按快照的降维器降维。
+        """
+        snapshot = self._snapshot
+        query_vectors = snapshot.reducer.apply_lyl(query_vectors)
+        id_filter = None
+        if search_filter is not None and not search_filter.is_empty():
+            ranges = await self._filter_ranges_lyl(search_filter)
+            if not ranges:
+                return [[] for _ in range(len(query_vectors))]
+            id_filter = FilterSelector_lyl(
+                ranges, snapshot.tombstones, snapshot.tombstone_selector
             )
-            
-            results = []
-            for doc, score in docs_with_scores:
-                # 分数越低越相似（L2距离）
-                if score < score_threshold * 10:  # 调整阈值
-                    results.append({
-                        "content": doc.page_content,
-                        "metadata": doc.metadata,
-                        "score": float(score)
+
+        # 逐分段检索后按距离归并取前k个，扫描在工作线程中进行，不阻塞事件循环
+        hits = await asyncio.to_thread(
+            self._search_segments_lyl, snapshot, query_vectors, k, id_filter
+        )
+
+        # 分数越低越相似（L2距离）
+        return [
+            [hit for hit in row_hits if hit[0] < score_threshold * 10]  # 调整阈值
+            for row_hits in hits
+        ]
+
+    async def _hits_to_results_lyl(
+        self, hits: List[List[Tuple[float, int]]]
+    ) -> List[List[Dict[str, Any]]]:
+        """一次读取全部命中分块并组装检索结果_lyl"""
+        chunks = await self.fetch_chunks_lyl(
+            list({vector_id for row_hits in hits for _, vector_id in row_hits})
+        )
+
+        results = []
+        for row_hits in hits:
+            row_results = []
+            for score, vector_id in row_hits:
+                chunk = chunks.get(vector_id)
+                if chunk is not None:
+                    row_results.append({
+                        "content": chunk["content"],
+                        "metadata": chunk["metadata"],
+                        "score": score
                     })
-            
-            return results
-        except Exception as e:
-            print(f"搜索失败: {e}")
+            results.append(row_results)
+        return results
+
+    async def delete_by_document_lyl(self, document_id: int) -> int:
+        """删除某个文档的全部向量，返回删除的向量数_lyl
+
+        只把该文档登记的向量ID写入墓碑，耗时与文档分块数成正比，无需重建索引。
+        chunks表中的记录与documents表记录在同一事务中删除，
+        见 DocumentService_lyl.delete_document_record_lyl。
+        """
+        await self.wait_ready_lyl()
+        rows = await db_manager.fetch_all_lyl(
+            "SELECT id FROM chunks WHERE document_id = ?", (document_id,)
+        )
+        return await self.delete_chunks_lyl([row["id"] for row in rows])
+
+    async def delete_chunks_lyl(self, chunk_ids: List[int]) -> int:
+        """删除指定分块的向量，返回删除的向量数_lyl - 只写入墓碑，分块记录由调用方删除"""
+        ids = set(chunk_ids)
+        if not ids:
+            return 0
+        await self.wait_ready_lyl()
+
+        async with self._write_lock:
+            snapshot = self._snapshot
+            await self._commit_manifest_lyl(snapshot.segments, snapshot.tombstones | ids)
+
+        self.schedule_merge_lyl()
+        return len(ids)
+
+    def needs_promotion_lyl(self) -> bool:
+        """有效向量数达到升级阈值而最大分段仍不是目标索引类型_lyl"""
+        if not self._snapshot.segments:
+            return False
+        live = self.get_document_count_lyl()
+        largest = max(self._snapshot.segments, key=lambda segment: segment.index.ntotal)
+        target = resolve_index_type_lyl(live)
+        if target != INDEX_FLAT_LYL and largest.index_type != target:
+            return True
+        return (
+            len(self._snapshot.segments) > 1
+            and largest.quantization != resolve_quantization_lyl(live)
+        )
+
+    def _merge_candidates_lyl(self) -> List[Segment_lyl]:
+        """选出本次应合并的分段，不需要合并时返回空列表_lyl
+
+        墓碑数超过有效向量数或需要升级索引时合并全部分段；
+        否则分段数达到阈值时按向量数从小到大选取：先取最小的两个，
+        之后的分段不超过已选总量的 VECTOR_MERGE_SIZE_RATIO 倍才一并合并。
+        每个向量只在所在分段规模增长约一个倍数时才被重写，写放大随语料规模对数增长，
+        流式入库逐批追加的小分段不会触发整个索引的重写。
+        """
+        segments = self._snapshot.segments
+        live = self.get_document_count_lyl()
+        if segments and (len(self._snapshot.tombstones) > max(live, 1) or self.needs_promotion_lyl()):
+            return list(segments)
+        if len(segments) < max(2, settings.VECTOR_SEGMENT_MERGE_THRESHOLD):
             return []
-    
-    async def delete_by_source_lyl(self, source_file: str) -> bool:
-        """根据源文件删除文档_lyl"""
-        # FAISS不支持直接删除，需要重建索引
-        # 这里简化处理，实际项目中可能需要更复杂的逻辑
+        ordered = sorted(segments, key=lambda segment: segment.index.ntotal)
+        selected = ordered[:2]
+        total = sum(segment.index.ntotal for segment in selected)
+        for segment in ordered[2:]:
+            if segment.index.ntotal > settings.VECTOR_MERGE_SIZE_RATIO * max(total, 1):
+                break
+            selected.append(segment)
+            total += segment.index.ntotal
+        return selected
+
+    def should_merge_lyl(self) -> bool:
+        """分段数或墓碑数超过阈值、或需要升级索引时应当合并_lyl"""
+        return bool(self._merge_candidates_lyl())
+
+    def schedule_merge_lyl(self) -> None:
+        """需要合并且没有进行中的合并时启动后台合并_lyl"""
+        if self._merge_task is not None and not self._merge_task.done():
+            return
+        if self.should_merge_lyl():
+            self._merge_task = asyncio.create_task(self._run_merges_lyl())
+
+    async def _run_merges_lyl(self) -> None:
+        """持续合并直到不再满足合并条件_lyl - 合并期间的新上传可能再次触发条件"""
+        while self.should_merge_lyl():
+            if not await self.merge_segments_lyl():
+                break
+
+    async def merge_segments_lyl(
+        self, force: bool = False, progress: Optional[Callable[[int], None]] = None
+    ) -> bool:
+        """把选出的分段合并为一个新分段并清除其中的墓碑_lyl
+
+        后台合并的分段由 _merge_candidates_lyl 选出；force为True时合并全部分段，
+        即使只有一个分段、没有墓碑也重建（用于应用新的索引配置）。
+        直接使用分段中保存的全精度向量，按合并后规模对应的索引类型与量化方式重建。
+        合并在工作线程中分批进行并限速，期间新的上传、删除与检索照常进行；
+        提交时保留合并开始后新增的分段和墓碑。
+        """
+        async with self._compaction_lock:
+            async with self._write_lock:
+                merging = list(self._snapshot.segments) if force else self._merge_candidates_lyl()
+                tombstones = set(self._snapshot.tombstones)
+                if not merging:
+                    return False
+                name = self.segment_store.allocate_name_lyl(self._manifest)
+
+            def build_lyl() -> Tuple[Optional[Segment_lyl], np.ndarray]:
+                vectors, ids, merged_ids = [], [], []
+                dead = np.fromiter(tombstones, dtype=np.int64, count=len(tombstones))
+                for segment in merging:
+                    segment_ids, segment_vectors = segment.all_vectors_lyl()
+                    merged_ids.append(np.asarray(segment_ids))
+                    keep = ~np.isin(segment_ids, dead)
+                    vectors.append(segment_vectors[keep])
+                    ids.extend(segment_ids[keep].tolist())
+                if not ids:
+                    return None, np.concatenate(merged_ids)
+                with limited_threads_lyl(settings.VECTOR_REBUILD_THREADS):
+                    segment = build_segment_lyl(
+                        name,
+                        np.concatenate(vectors),
+                        ids,
+                        resolve_index_type_lyl(len(ids)),
+                        resolve_quantization_lyl(len(ids)),
+                        on_batch=throttle_lyl(progress),
+                    )
+                return self._write_and_open_lyl(segment), np.concatenate(merged_ids)
+
+            try:
+                merged, merged_ids = await asyncio.to_thread(build_lyl)
+            except Exception as e:
+                log_lyl.error(f"合并向量分段失败: {e}")
+                if force:
+                    raise
+                return False
+
+            await self._swap_segments_lyl(merging, tombstones, merged, merged_ids)
+        log_lyl.info(
+            f"向量分段合并完成: {len(merging)} 个分段 -> {name}"
+            f"（{f'{merged.index_type}/{merged.quantization}' if merged is not None else '空'}）"
+        )
         return True
-    
+
+    async def reembed_segments_lyl(
+        self, progress: Optional[Callable[[int], None]] = None
+    ) -> bool:
+        """按chunks表中的分块文本重新嵌入并重建全部分段_lyl
+
+        用于更换嵌入模型或降维方式等向量本身失效的情况；分块ID保持不变，
+        chunks表中已不存在的向量（孤立向量）在重建时丢弃。
+        降维器按当前配置重新确定（PCA在重新嵌入的向量上训练），
+        降维方式改变时，重建期间新上传的分段在提交前按新降维器重建。
+        """
+        async with self._compaction_lock:
+            async with self._write_lock:
+                merging = list(self._snapshot.segments)
+                tombstones = set(self._snapshot.tombstones)
+                if not merging:
+                    return False
+                name = self.segment_store.allocate_name_lyl(self._manifest)
+                self._reembed_pending = {}
+
+            try:
+                merged_ids = await asyncio.to_thread(
+                    lambda: np.concatenate([segment.ids for segment in merging])
+                )
+                live_ids = np.setdiff1d(
+                    merged_ids, np.fromiter(tombstones, dtype=np.int64, count=len(tombstones))
+                ).tolist()
+
+                vectors, ids = [], []
+                batch_size = settings.VECTOR_REBUILD_EMBED_BATCH
+                for start in range(0, len(live_ids), batch_size):
+                    chunks = await self.fetch_chunks_lyl(live_ids[start:start + batch_size])
+                    batch_ids = [vector_id for vector_id in live_ids[start:start + batch_size] if vector_id in chunks]
+                    if batch_ids:
+                        vectors.extend(await embedding_service.embed_texts_lyl(
+                            [chunks[vector_id]["content"] for vector_id in batch_ids]
+                        ))
+                        ids.extend(batch_ids)
+                    if progress is not None:
+                        progress(min(start + batch_size, len(live_ids)))
+
+                def build_lyl() -> Tuple[Optional[Segment_lyl], DimensionReducer_lyl, Optional[str]]:
+                    full_vectors = np.asarray(vectors, dtype=np.float32)
+                    reducer, reducer_file = self._configured_reducer_lyl(full_vectors, name)
+                    if not ids:
+                        return None, reducer, reducer_file
+                    with limited_threads_lyl(settings.VECTOR_REBUILD_THREADS):
+                        segment = build_segment_lyl(
+                            name,
+                            reducer.apply_lyl(full_vectors),
+                            ids,
+                            resolve_index_type_lyl(len(ids)),
+                            resolve_quantization_lyl(len(ids)),
+                            on_batch=throttle_lyl(),
+                        )
+                    return self._write_and_open_lyl(segment), reducer, reducer_file
+
+                rebuilt, reducer, reducer_file = await asyncio.to_thread(build_lyl)
+                await self._swap_segments_lyl(
+                    merging, tombstones, rebuilt, merged_ids, reducer, reducer_file
+                )
+            finally:
+                self._reembed_pending = None
+        log_lyl.info(
+            f"向量索引重新嵌入完成: {len(merging)} 个分段 -> {name}，共 {len(ids)} 个向量"
+            f"（降维: {reducer.method}/{reducer.dim or '-'}）"
+        )
+        return True
+
+    def _configured_reducer_lyl(
+        self, full_vectors: np.ndarray, name: str
+    ) -> Tuple[DimensionReducer_lyl, Optional[str]]:
+        """按配置构建降维器，返回降维器与PCA参数文件名_lyl - 在工作线程中调用
+
+        PCA在给定的未降维向量上训练并写入参数文件；向量数少于目标维度时无法训练。
+        """
+        method, dim = settings.VECTOR_REDUCTION, settings.VECTOR_REDUCED_DIM
+        if method == REDUCTION_NONE_LYL:
+            return DimensionReducer_lyl(), None
+        if method == REDUCTION_TRUNCATE_LYL:
+            return DimensionReducer_lyl(REDUCTION_TRUNCATE_LYL, dim), None
+        if method != REDUCTION_PCA_LYL:
+            raise ValueError(f"不支持的降维方式: {method}")
+        if len(full_vectors) < dim:
+            raise ValueError(f"向量数 {len(full_vectors)} 少于PCA目标维度 {dim}，无法训练PCA")
+        reducer = train_pca_lyl(full_vectors, dim, settings.VECTOR_PCA_TRAIN_SIZE)
+        reducer_file = self.segment_store.reducer_file_lyl(name)
+        self.segment_store.write_reducer_lyl(reducer_file, reducer)
+        return reducer, reducer_file
+
+    async def _swap_segments_lyl(
+        self,
+        replaced: List[Segment_lyl],
+        tombstones: Set[int],
+        segment: Optional[Segment_lyl],
+        replaced_ids: np.ndarray,
+        reducer: Optional[DimensionReducer_lyl] = None,
+        reducer_file: Optional[str] = None,
+    ) -> None:
+        """用新分段原子替换一组旧分段并删除旧分段文件_lyl
+
+        tombstones为开始构建时的墓碑集合，其中属于被替换分段的墓碑已在新分段中清除；
+        构建期间新增的分段与墓碑保留。传入与当前不同的reducer时，
+        构建期间新增的分段用登记的未降维向量按新降维器重建后一并切换。
+        """
+        cleared = tombstones & set(replaced_ids.tolist()) if tombstones else set()
+        previous_file = (self._manifest.get("reduction") or {}).get("file")
+        async with self._write_lock:
+            replaced_names = {s.name for s in replaced}
+            remaining = [s for s in self._snapshot.segments if s.name not in replaced_names]
+            # 重新训练的PCA即使维度相同投影也不同
+            if reducer is not None and (
+                reducer.method == REDUCTION_PCA_LYL
+                or reducer.describe_lyl() != self._snapshot.reducer.describe_lyl()
+            ):
+                converted = []
+                for old in remaining:
+                    old_ids, full_vectors = self._reembed_pending[old.name]
+                    new_name = self.segment_store.allocate_name_lyl(self._manifest)
+                    converted.append(await asyncio.to_thread(
+                        self._write_and_open_lyl,
+                        build_segment_lyl(new_name, reducer.apply_lyl(full_vectors), old_ids),
+                    ))
+                    replaced_names.add(old.name)
+                remaining = converted
+            segments = ([segment] if segment is not None else []) + remaining
+            await self._commit_manifest_lyl(
+                segments, self._snapshot.tombstones - cleared, reducer, reducer_file
+            )
+
+        await asyncio.to_thread(
+            self.segment_store.delete_segment_files_lyl, sorted(replaced_names)
+        )
+        if previous_file and previous_file != reducer_file and reducer is not None:
+            await asyncio.to_thread(self.segment_store.delete_file_lyl, previous_file)
+
+    def start_rebuild_lyl(self, reembed: bool = False) -> Dict[str, Any]:
+        """在后台启动索引重建，返回重建状态_lyl - 已有重建在进行时抛出RuntimeError"""
+        if self._rebuild_task is not None and not self._rebuild_task.done():
+            raise RuntimeError("索引重建正在进行")
+        self._rebuild_status = {
+            "state": REBUILD_RUNNING_LYL,
+            "mode": "reembed" if reembed else "compact",
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "finished_at": None,
+            "processed": 0,
+            "total": self.get_document_count_lyl(),
+            "error": None,
+        }
+        self._rebuild_task = asyncio.create_task(self._run_rebuild_lyl(reembed))
+        return dict(self._rebuild_status)
+
+    async def _run_rebuild_lyl(self, reembed: bool) -> None:
+        """执行索引重建并记录结果_lyl"""
+        status = self._rebuild_status
+
+        def progress_lyl(done: int) -> None:
+            status["processed"] = done
+
+        try:
+            await self.wait_ready_lyl()
+            if reembed:
+                await self.reembed_segments_lyl(progress_lyl)
+            else:
+                await self.merge_segments_lyl(force=True, progress=progress_lyl)
+            status["state"] = REBUILD_SUCCEEDED_LYL
+        except Exception as e:
+            log_lyl.error(f"索引重建失败: {e}")
+            status["state"] = REBUILD_FAILED_LYL
+            status["error"] = str(e)
+        finally:
+            status["finished_at"] = datetime.now().isoformat(timespec="seconds")
+        self.schedule_merge_lyl()
+
+    def index_status_lyl(self) -> Dict[str, Any]:
+        """当前索引结构与最近一次重建的状态_lyl"""
+        snapshot = self._snapshot
+        return {
+            "ready": self._ready,
+            "vector_count": snapshot.vector_count,
+            "tombstones": len(snapshot.tombstones),
+            "reduction": snapshot.reducer.describe_lyl(),
+            "segments": [
+                {
+                    "name": segment.name,
+                    "index_type": segment.index_type,
+                    "quantization": segment.quantization,
+                    "vectors": segment.index.ntotal,
+                }
+                for segment in snapshot.segments
+            ],
+            "merging": self._merge_task is not None and not self._merge_task.done(),
+            "rebuild": dict(self._rebuild_status),
+        }
+
+    async def close_lyl(self) -> None:
+        """取消预热与重建，并等待进行中的后台加载与合并完成_lyl
+
+        被取消的重建不会提交，其写了一半的分段文件在下次启动时清理。
+        """
+        for task in (self._warmup_task, self._rebuild_task):
+            if task is not None:
+                task.cancel()
+        for task in (self._load_task, self._merge_task):
+            if task is not None:
+                await task
+
+    async def migrate_legacy_store_lyl(self) -> bool:
+        """将旧版langchain FAISS存储迁移为分段存储_lyl
+
+        按分块元数据中的source_file匹配documents表中的文档，
+        已被删除文档遗留的向量在迁移时丢弃。
+        """
+        from langchain_community.vectorstores import FAISS
+
+        try:
+            legacy = FAISS.load_local(
+                str(self.store_path),
+                embedding_service.embeddings,
+                allow_dangerous_deserialization=True
+            )
+        except Exception as e:
+            log_lyl.error(f"加载旧版向量存储失败: {e}")
+            return False
+
+        documents = await db_manager.fetch_all_lyl("SELECT id, file_path FROM documents")
+        doc_ids = {
+            PureWindowsPath(doc["file_path"]).name: doc["id"] for doc in documents
+        }
+
+        grouped: Dict[int, List[tuple]] = {}
+        dropped = 0
+        for position, docstore_id in legacy.index_to_docstore_id.items():
+            doc = legacy.docstore.search(docstore_id)
+            document_id = doc_ids.get(doc.metadata.get("source_file"))
+            if document_id is None:
+                dropped += 1
+                continue
+            grouped.setdefault(document_id, []).append(
+                (doc, legacy.index.reconstruct(position))
+            )
+
+        batch_ids = await self._insert_chunks_lyl(
+            [(document_id, [doc for doc, _ in items]) for document_id, items in grouped.items()]
+        )
+        all_ids = [vector_id for ids in batch_ids for vector_id in ids]
+        all_vectors = [vector for items in grouped.values() for _, vector in items]
+
+        async with self._write_lock:
+            segments = []
+            if all_ids:
+                name = self.segment_store.allocate_name_lyl(self._manifest)
+                segment = build_segment_lyl(
+                    name, np.asarray(all_vectors, dtype=np.float32), all_ids
+                )
+                segments.append(await asyncio.to_thread(self._write_and_open_lyl, segment))
+            await self._commit_manifest_lyl(segments, set())
+
+        # 保留旧文件作为备份
+        for name in (LEGACY_INDEX_FILE_LYL, LEGACY_DOCSTORE_FILE_LYL):
+            legacy_path = self.store_path / name
+            legacy_path.rename(legacy_path.with_name(name + ".legacy"))
+
+        log_lyl.info(
+            f"旧版向量存储迁移完成: 保留 {len(all_ids)} 个向量，丢弃 {dropped} 个孤立向量"
+        )
+        return True
+
     def get_document_count_lyl(self) -> int:
-        """获取文档数量_lyl"""
-        if self._vector_store and hasattr(self._vector_store, 'index'):
-            return self._vector_store.index.ntotal
-        return 0
+        """获取有效向量数量_lyl"""
+        return self._snapshot.vector_count
 
 
 # 全局实例
 vector_store_service = VectorStoreService_lyl()
-
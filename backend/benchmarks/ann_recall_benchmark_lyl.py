@@ -0,0 +1,151 @@
+"""
+近似索引召回率与延迟基准_lyl
+
+以精确Flat索引的检索结果为基准，报告HNSW / IVF-Flat在不同efSearch / nprobe
+下的recall@k与单查询延迟，用于调整 VECTOR_HNSW_EF_SEARCH 与 VECTOR_IVF_NPROBE；
+并报告SQ8 / PQ量化存储在精确重排前后的recall@k与每向量内存占用。
+
+使用方式:
+    python -m backend.benchmarks.ann_recall_benchmark_lyl --n 100000 --dim 1024
+    python -m backend.benchmarks.ann_recall_benchmark_lyl --store data/vector_store
+"""
+import argparse
+import time
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+
+import faiss
+
+from backend.app.services.index_factory import (
+    INDEX_FLAT_LYL,
+    INDEX_HNSW_LYL,
+    INDEX_IVF_FLAT_LYL,
+    QUANTIZATION_PQ_LYL,
+    QUANTIZATION_SQ8_LYL,
+    build_index_lyl,
+    search_params_lyl,
+)
+from backend.app.services.segment_store import Segment_lyl, SegmentStore_lyl
+
+EF_SEARCH_SWEEP_LYL = [16, 32, 64, 128, 256]
+NPROBE_SWEEP_LYL = [1, 4, 8, 16, 32, 64]
+
+
+def synthetic_vectors_lyl(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    """生成归一化的聚簇向量，近似真实嵌入的分布_lyl"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 500), dim)).astype(np.float32)
+    labels = rng.integers(0, len(centers), n)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def store_vectors_lyl(store_path: str) -> np.ndarray:
+    """读取现有向量存储中全部分段的向量_lyl"""
+    store = SegmentStore_lyl(Path(store_path))
+    manifest = store.load_manifest_lyl()
+    vectors = [
+        store.read_segment_lyl(name).all_vectors_lyl()[1] for name in manifest["segments"]
+    ]
+    if not vectors:
+        raise SystemExit(f"向量存储为空: {store_path}")
+    return np.concatenate(vectors).astype(np.float32)
+
+
+def timed_search_lyl(index, queries: np.ndarray, k: int, params) -> Tuple[np.ndarray, float]:
+    """逐条查询并返回结果与平均延迟（毫秒）_lyl"""
+    results = np.empty((len(queries), k), dtype=np.int64)
+    start = time.perf_counter()
+    for i, query in enumerate(queries):
+        _, ids = index.search(query[None, :], k, params=params)
+        results[i] = ids[0]
+    elapsed = time.perf_counter() - start
+    return results, elapsed * 1000 / len(queries)
+
+
+def timed_rerank_search_lyl(
+    segment: Segment_lyl, queries: np.ndarray, k: int, factor: int
+) -> Tuple[np.ndarray, float]:
+    """量化索引多取候选后用全精度向量重排_lyl"""
+    results = np.empty((len(queries), k), dtype=np.int64)
+    start = time.perf_counter()
+    for i, query in enumerate(queries):
+        _, ids = segment.index.search(query[None, :], k * factor)
+        distances = segment.exact_distances_lyl(query, ids[0])
+        results[i] = ids[0][np.argsort(distances)[:k]]
+    elapsed = time.perf_counter() - start
+    return results, elapsed * 1000 / len(queries)
+
+
+def recall_lyl(results: np.ndarray, truth: np.ndarray) -> float:
+    """recall@k - 与精确结果的平均交集比例_lyl"""
+    hits = sum(len(set(r) & set(t)) for r, t in zip(results, truth))
+    return hits / truth.size
+
+
+def main_lyl():
+    """运行基准并打印报告_lyl"""
+    parser = argparse.ArgumentParser(description="近似索引召回率与延迟基准")
+    parser.add_argument("--n", type=int, default=50000, help="合成向量数")
+    parser.add_argument("--dim", type=int, default=1024, help="合成向量维度")
+    parser.add_argument("--store", type=str, default=None, help="使用现有向量存储中的向量")
+    parser.add_argument("--queries", type=int, default=200, help="查询数")
+    parser.add_argument("--k", type=int, default=5, help="recall@k中的k")
+    parser.add_argument("--rerank-factor", type=int, default=4, help="量化重排候选倍数")
+    args = parser.parse_args()
+
+    vectors = store_vectors_lyl(args.store) if args.store else synthetic_vectors_lyl(args.n, args.dim)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), args.queries, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+    ids = list(range(len(vectors)))
+    print(f"向量数: {len(vectors)}  维度: {vectors.shape[1]}  查询数: {len(queries)}  k: {args.k}")
+
+    exact = build_index_lyl(vectors, ids, INDEX_FLAT_LYL)
+    truth, flat_latency = timed_search_lyl(exact, queries, args.k, None)
+
+    print(f"\n{'索引':<10}{'参数':<14}{'构建(s)':>10}{'recall@k':>10}{'延迟(ms)':>10}{'QPS':>10}")
+    print(f"{'flat':<10}{'-':<14}{'-':>10}{1.0:>10.4f}{flat_latency:>10.3f}{1000 / flat_latency:>10.0f}")
+
+    sweeps = [
+        (INDEX_HNSW_LYL, "efSearch", EF_SEARCH_SWEEP_LYL),
+        (INDEX_IVF_FLAT_LYL, "nprobe", NPROBE_SWEEP_LYL),
+    ]
+    for index_type, param_name, values in sweeps:
+        start = time.perf_counter()
+        index = build_index_lyl(vectors, ids, index_type)
+        build_seconds = time.perf_counter() - start
+        for value in values:
+            if param_name == "efSearch":
+                params = search_params_lyl(index_type, ef_search=value)
+            else:
+                params = search_params_lyl(index_type, nprobe=value)
+            results, latency = timed_search_lyl(index, queries, args.k, params)
+            print(
+                f"{index_type:<10}{f'{param_name}={value}':<14}{build_seconds:>10.2f}"
+                f"{recall_lyl(results, truth):>10.4f}{latency:>10.3f}{1000 / latency:>10.0f}"
+            )
+
+    print(f"\n{'量化':<10}{'重排':<14}{'字节/向量':>10}{'recall@k':>10}{'延迟(ms)':>10}{'QPS':>10}")
+    print(f"{'none':<10}{'-':<14}{vectors.shape[1] * 4:>10}{1.0:>10.4f}{flat_latency:>10.3f}{1000 / flat_latency:>10.0f}")
+    raw_ids = np.arange(len(vectors), dtype=np.int64)
+    for quantization in (QUANTIZATION_SQ8_LYL, QUANTIZATION_PQ_LYL):
+        index = build_index_lyl(vectors, ids, INDEX_FLAT_LYL, quantization)
+        bytes_per_vector = faiss.downcast_index(index.index).code_size
+        segment = Segment_lyl(quantization, index, raw_ids, vectors)
+        rows = [
+            ("否", timed_search_lyl(index, queries, args.k, None)),
+            (f"x{args.rerank_factor}", timed_rerank_search_lyl(segment, queries, args.k, args.rerank_factor)),
+        ]
+        for label, (results, latency) in rows:
+            print(
+                f"{quantization:<10}{label:<14}{bytes_per_vector:>10}"
+                f"{recall_lyl(results, truth):>10.4f}{latency:>10.3f}{1000 / latency:>10.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main_lyl()
@@ -0,0 +1,245 @@
+"""
+向量存储并发压力测试_lyl
+
+在同一事件循环中并发执行上传、删除与检索（向量/混合两种模式），检查:
+    - 检索从不抛出异常，返回的分块内容与其元数据属于同一文档（未读到写到一半的索引）
+    - 上传期间的检索延迟与空闲时相当，事件循环的最大调度延迟
+    - 结束并完成后台合并后，有效向量数与chunks表行数一致，重新加载后仍一致
+
+默认使用确定性的伪嵌入并可模拟嵌入接口延迟，只压测存储本身；
+数据写入临时目录，不影响 data/ 下的知识库。存在失败时以非零状态退出。
+
+使用方式:
+    python -m backend.benchmarks.concurrency_stress_lyl --uploads 40 --searchers 8
+    python -m backend.benchmarks.concurrency_stress_lyl --chunks 400 --merge-threshold 4
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+# 常用词加上编号标识符，使全文检索的命中分布接近真实文档（少数高频词、大量低频词）
+VOCABULARY_LYL = [
+    "向量", "索引", "检索", "分段", "合并", "墓碑", "快照", "并发", "课程", "考试",
+    "faiss", "sqlite", "python", "hnsw", "量化", "嵌入", "文档", "知识库",
+] + [f"CS{n:04d}" for n in range(5000)]
+VOCABULARY_WEIGHTS_LYL = [1.0 / (rank + 1) for rank in range(len(VOCABULARY_LYL))]
+
+
+def percentile_lyl(values: List[float], q: float) -> float:
+    """百分位数（毫秒）_lyl"""
+    return float(np.percentile(values, q)) * 1000 if values else 0.0
+
+
+def fake_vector_lyl(text: str, dim: int) -> List[float]:
+    """由文本哈希生成确定性的归一化向量_lyl"""
+    seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def patch_embeddings_lyl(dim: int, latency: float) -> None:
+    """用伪嵌入替换嵌入服务，latency模拟每次接口调用的耗时（秒）_lyl"""
+    from backend.app.services.embedding_service import embedding_service
+
+    async def embed_text_lyl(text: str) -> List[float]:
+        await asyncio.sleep(latency)
+        return fake_vector_lyl(text, dim)
+
+    async def embed_texts_lyl(texts: List[str], progress=None) -> List[List[float]]:
+        # 批量生成放到工作线程，与真实接口一样不占用事件循环
+        await asyncio.sleep(latency)
+        return await asyncio.to_thread(lambda: [fake_vector_lyl(text, dim) for text in texts])
+
+    embedding_service.embed_text_lyl = embed_text_lyl
+    embedding_service.embed_texts_lyl = embed_texts_lyl
+
+
+async def run_stress_lyl(args) -> int:
+    """运行压力测试，返回失败数_lyl"""
+    from langchain_core.documents import Document
+
+    from backend.app.database.database import db_manager
+    from backend.app.services.document_service import document_service
+    from backend.app.services.vector_store_service import (
+        SEARCH_MODE_HYBRID_LYL,
+        SEARCH_MODE_VECTOR_LYL,
+        VectorStoreService_lyl,
+        vector_store_service,
+    )
+
+    await db_manager.init_tables_lyl()
+    vector_store_service.start_lyl()
+    await vector_store_service.wait_ready_lyl()
+
+    rng = random.Random(0)
+    failures: List[str] = []
+    live_docs: Dict[int, str] = {}
+    uploads_in_flight = 0
+    done = asyncio.Event()
+    latencies: Dict[tuple, List[float]] = {}
+    max_loop_lag = 0.0
+    search_count = 0
+
+    # 预先生成全部分块，避免压测本身的开销计入检索延迟与事件循环延迟
+    uploads = {
+        n: [
+            Document(
+                page_content=f"doc{n:04d} 第{i}块 " + " ".join(
+                    rng.choices(VOCABULARY_LYL, VOCABULARY_WEIGHTS_LYL, k=30)
+                ),
+                metadata={"chunk_index": i, "source_file": f"doc{n:04d}"},
+            )
+            for i in range(args.chunks)
+        ]
+        for n in range(args.uploads)
+    }
+
+    async def upload_lyl(n: int) -> None:
+        nonlocal uploads_in_flight
+        tag = f"doc{n:04d}"
+        chunks = uploads[n]
+        uploads_in_flight += 1
+        try:
+            doc_id = await document_service.add_document_record_lyl(
+                filename=tag, file_type=".txt", file_path=tag,
+                file_size=0, chunk_count=len(chunks)
+            )
+            chunk_ids = await vector_store_service.add_documents_lyl(doc_id, chunks)
+            await document_service.index_chunks_text_lyl(chunk_ids, chunks)
+            live_docs[doc_id] = tag
+        except Exception as e:
+            failures.append(f"上传 {tag} 失败: {e!r}")
+        finally:
+            uploads_in_flight -= 1
+
+    async def uploader_lyl() -> None:
+        semaphore = asyncio.Semaphore(args.upload_concurrency)
+
+        async def limited_upload_lyl(n: int) -> None:
+            async with semaphore:
+                await upload_lyl(n)
+
+        await asyncio.gather(*(limited_upload_lyl(n) for n in range(1, args.uploads)))
+
+    async def deleter_lyl() -> None:
+        while not done.is_set():
+            await asyncio.sleep(args.delete_interval)
+            if len(live_docs) < 2:
+                continue
+            doc_id = rng.choice(sorted(live_docs))
+            live_docs.pop(doc_id)
+            try:
+                await vector_store_service.delete_by_document_lyl(doc_id)
+                await document_service.delete_document_record_lyl(doc_id)
+            except Exception as e:
+                failures.append(f"删除文档 {doc_id} 失败: {e!r}")
+
+    async def searcher_lyl(worker: int) -> None:
+        nonlocal search_count
+        modes = [SEARCH_MODE_VECTOR_LYL, SEARCH_MODE_HYBRID_LYL]
+        while not done.is_set():
+            query = " ".join(rng.choices(VOCABULARY_LYL, VOCABULARY_WEIGHTS_LYL, k=3))
+            busy = uploads_in_flight > 0
+            mode = modes[search_count % 2]
+            start = time.perf_counter()
+            try:
+                results = await vector_store_service.search_texts_lyl(
+                    [query], args.k, 10.0, None, mode
+                )
+            except Exception as e:
+                failures.append(f"检索线程{worker} 失败: {e!r}")
+                continue
+            latencies.setdefault((busy, mode), []).append(time.perf_counter() - start)
+            search_count += 1
+            for result in results[0]:
+                tag = result["metadata"].get("source_file", "")
+                if not result["content"].startswith(tag):
+                    failures.append(f"分块内容与元数据不一致: {tag} / {result['content'][:20]}")
+
+    async def loop_monitor_lyl() -> None:
+        nonlocal max_loop_lag
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            max_loop_lag = max(max_loop_lag, time.perf_counter() - start - 0.01)
+
+    # 先写入一个文档，使检索从一开始就有数据可查
+    await upload_lyl(0)
+    background = [asyncio.create_task(searcher_lyl(i)) for i in range(args.searchers)]
+    background += [asyncio.create_task(deleter_lyl()), asyncio.create_task(loop_monitor_lyl())]
+
+    started = time.perf_counter()
+    await uploader_lyl()
+    # 上传结束后继续检索一段时间，作为空闲对照
+    await asyncio.sleep(args.idle_seconds)
+    done.set()
+    await asyncio.gather(*background)
+    elapsed = time.perf_counter() - started
+
+    await vector_store_service.close_lyl()
+    row = await db_manager.fetch_one_lyl("SELECT COUNT(*) AS n FROM chunks")
+    vector_count = vector_store_service.get_document_count_lyl()
+    if vector_count != row["n"]:
+        failures.append(f"有效向量数 {vector_count} 与chunks表行数 {row['n']} 不一致")
+
+    reloaded = VectorStoreService_lyl()
+    await reloaded.initialize_lyl()
+    if reloaded.get_document_count_lyl() != row["n"]:
+        failures.append(
+            f"重新加载后向量数 {reloaded.get_document_count_lyl()} 与chunks表行数 {row['n']} 不一致"
+        )
+
+    print(f"耗时 {elapsed:.1f}s  上传 {args.uploads} 个文档 x {args.chunks} 块  检索 {search_count} 次")
+    print(f"剩余文档 {len(live_docs)}  有效向量 {vector_count}  分段数 {len(reloaded.segments)}")
+    for (busy, mode), values in sorted(latencies.items(), reverse=True):
+        print(
+            f"{'上传期间' if busy else '空闲'} {mode:<7} 检索: {len(values)} 次"
+            f"  p50 {percentile_lyl(values, 50):.2f}ms  p99 {percentile_lyl(values, 99):.2f}ms"
+        )
+    print(f"事件循环最大调度延迟: {max_loop_lag * 1000:.1f}ms")
+
+    await db_manager.disconnect_lyl()
+    for failure in failures[:20]:
+        print(f"失败: {failure}")
+    print("通过" if not failures else f"失败 {len(failures)} 项")
+    return len(failures)
+
+
+def main_lyl():
+    """解析参数、准备临时数据目录并运行压力测试_lyl"""
+    parser = argparse.ArgumentParser(description="向量存储并发压力测试")
+    parser.add_argument("--uploads", type=int, default=40, help="上传文档数")
+    parser.add_argument("--chunks", type=int, default=100, help="每个文档的分块数")
+    parser.add_argument("--upload-concurrency", type=int, default=2, help="同时进行的上传数")
+    parser.add_argument("--searchers", type=int, default=8, help="并发检索协程数")
+    parser.add_argument("--k", type=int, default=5, help="每次检索的结果数")
+    parser.add_argument("--dim", type=int, default=256, help="伪嵌入维度")
+    parser.add_argument("--embed-latency-ms", type=float, default=20, help="模拟嵌入接口延迟")
+    parser.add_argument("--delete-interval", type=float, default=0.2, help="删除文档的间隔（秒）")
+    parser.add_argument("--idle-seconds", type=float, default=2.0, help="上传结束后继续检索的时长")
+    parser.add_argument("--merge-threshold", type=int, default=4, help="分段合并阈值")
+    args = parser.parse_args()
+
+    # 配置在导入时读取，须在导入应用模块前指向临时目录
+    work_dir = tempfile.mkdtemp(prefix="vector_stress_")
+    os.environ["DATABASE_URL"] = os.path.join(work_dir, "stress.db")
+    os.environ["VECTOR_STORE_PATH"] = os.path.join(work_dir, "vector_store")
+    os.environ["DOCUMENTS_PATH"] = os.path.join(work_dir, "documents")
+    os.environ["VECTOR_SEGMENT_MERGE_THRESHOLD"] = str(args.merge_threshold)
+    os.environ.setdefault("EMBEDDING_MODEL_API_KEY", "stress")
+    print(f"数据目录: {work_dir}")
+
+    patch_embeddings_lyl(args.dim, args.embed_latency_ms / 1000)
+    sys.exit(1 if asyncio.run(run_stress_lyl(args)) else 0)
+
+
+if __name__ == "__main__":
+    main_lyl()
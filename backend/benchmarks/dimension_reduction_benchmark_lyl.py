@@ -0,0 +1,118 @@
+"""
+向量降维召回率与开销基准_lyl
+
+以原始维度Flat索引的精确结果为基准，报告截断（truncate）与PCA降到不同维度后的
+recall@k、每向量字节数、索引总内存与单查询延迟，用于选择 VECTOR_REDUCTION 与 VECTOR_REDUCED_DIM。
+
+默认使用方差随维度递减的合成向量（近似Matryoshka式训练模型的前缀性质）；
+真实效果请用 --vectors 传入由嵌入模型生成的 (n, dim) float32 .npy 文件，
+例如对知识库分块调用嵌入接口后保存的向量。
+
+使用方式:
+    python -m backend.benchmarks.dimension_reduction_benchmark_lyl --n 50000 --dim 1024
+    python -m backend.benchmarks.dimension_reduction_benchmark_lyl --vectors chunks_bge_m3.npy
+"""
+import argparse
+import time
+from typing import List, Tuple
+
+import numpy as np
+
+from backend.app.services.dimension_reducer import (
+    REDUCTION_PCA_LYL,
+    REDUCTION_TRUNCATE_LYL,
+    DimensionReducer_lyl,
+    normalize_rows_lyl,
+    train_pca_lyl,
+)
+from backend.app.services.index_factory import INDEX_FLAT_LYL, build_index_lyl
+
+DIM_SWEEP_LYL = [64, 128, 256, 512]
+
+
+def synthetic_vectors_lyl(n: int, dim: int, decay: float, seed: int = 0) -> np.ndarray:
+    """生成聚簇的归一化向量，第i维的尺度按 (i+1)^-decay 递减_lyl"""
+    rng = np.random.default_rng(seed)
+    scale = (np.arange(dim) + 1.0) ** -decay
+    centers = rng.standard_normal((max(1, n // 500), dim)).astype(np.float32)
+    labels = rng.integers(0, len(centers), n)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return normalize_rows_lyl(vectors * scale.astype(np.float32)).astype(np.float32)
+
+
+def timed_search_lyl(index, queries: np.ndarray, k: int) -> Tuple[np.ndarray, float]:
+    """逐条查询并返回结果与平均延迟（毫秒）_lyl"""
+    results = np.empty((len(queries), k), dtype=np.int64)
+    start = time.perf_counter()
+    for i, query in enumerate(queries):
+        _, ids = index.search(query[None, :], k)
+        results[i] = ids[0]
+    elapsed = time.perf_counter() - start
+    return results, elapsed * 1000 / len(queries)
+
+
+def recall_lyl(results: np.ndarray, truth: np.ndarray) -> float:
+    """recall@k - 与精确结果的平均交集比例_lyl"""
+    hits = sum(len(set(r) & set(t)) for r, t in zip(results, truth))
+    return hits / truth.size
+
+
+def main_lyl():
+    """运行基准并打印报告_lyl"""
+    parser = argparse.ArgumentParser(description="向量降维召回率与开销基准")
+    parser.add_argument("--n", type=int, default=50000, help="合成向量数")
+    parser.add_argument("--dim", type=int, default=1024, help="合成向量维度")
+    parser.add_argument("--decay", type=float, default=0.5, help="合成向量各维尺度的衰减指数")
+    parser.add_argument("--vectors", type=str, default=None, help="使用 .npy 文件中的真实嵌入向量")
+    parser.add_argument("--queries", type=int, default=200, help="查询数")
+    parser.add_argument("--k", type=int, default=5, help="recall@k中的k")
+    parser.add_argument("--dims", type=int, nargs="+", default=DIM_SWEEP_LYL, help="降维后的维度")
+    parser.add_argument("--pca-train-size", type=int, default=50000, help="训练PCA的最大抽样数")
+    args = parser.parse_args()
+
+    if args.vectors:
+        vectors = normalize_rows_lyl(np.load(args.vectors).astype(np.float32)).astype(np.float32)
+    else:
+        vectors = synthetic_vectors_lyl(args.n, args.dim, args.decay)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), args.queries, replace=False)]
+    queries = normalize_rows_lyl(
+        queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+    ).astype(np.float32)
+    ids = list(range(len(vectors)))
+    full_dim = vectors.shape[1]
+    print(f"向量数: {len(vectors)}  维度: {full_dim}  查询数: {len(queries)}  k: {args.k}")
+
+    exact = build_index_lyl(vectors, ids, INDEX_FLAT_LYL)
+    truth, full_latency = timed_search_lyl(exact, queries, args.k)
+    full_bytes = full_dim * 4
+
+    print(f"\n{'降维':<10}{'维度':>6}{'训练(s)':>9}{'recall@k':>10}{'字节/向量':>10}"
+          f"{'内存(MB)':>10}{'内存节省':>9}{'延迟(ms)':>10}{'加速':>7}")
+    print(f"{'none':<10}{full_dim:>6}{'-':>9}{1.0:>10.4f}{full_bytes:>10}"
+          f"{full_bytes * len(vectors) / 2**20:>10.1f}{'-':>9}{full_latency:>10.3f}{'-':>7}")
+
+    rows: List[Tuple[str, int]] = [
+        (method, dim)
+        for method in (REDUCTION_TRUNCATE_LYL, REDUCTION_PCA_LYL)
+        for dim in args.dims if dim < full_dim
+    ]
+    for method, dim in rows:
+        start = time.perf_counter()
+        if method == REDUCTION_PCA_LYL:
+            reducer = train_pca_lyl(vectors, dim, args.pca_train_size)
+        else:
+            reducer = DimensionReducer_lyl(method, dim)
+        train_seconds = time.perf_counter() - start
+        index = build_index_lyl(reducer.apply_lyl(vectors), ids, INDEX_FLAT_LYL)
+        results, latency = timed_search_lyl(index, reducer.apply_lyl(queries), args.k)
+        reduced_bytes = dim * 4
+        print(
+            f"{method:<10}{dim:>6}{train_seconds:>9.2f}{recall_lyl(results, truth):>10.4f}"
+            f"{reduced_bytes:>10}{reduced_bytes * len(vectors) / 2**20:>10.1f}"
+            f"{1 - reduced_bytes / full_bytes:>9.0%}{latency:>10.3f}{full_latency / latency:>6.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main_lyl()
@@ -0,0 +1,223 @@
+"""
+文本分割器吞吐与分块边界对照基准_lyl
+
+在中英文混合的大文本上比较 recursive（langchain RecursiveCharacterTextSplitter）与
+sentence（单遍扫描的句子感知分割器）两种 TEXT_SPLITTER，分别以字符数与近似token数计长度，报告：
+
+    吞吐      每秒处理的字符数（取 --repeat 次中最快的一次）
+    块数      分块数量，块越满嵌入调用越少
+    填充率    平均块长度 / chunk_size
+    句末率    结束在句末标点或换行处的分块比例
+    边界一致  recursive 的分块结束位置中，sentence 也在该处结束的比例
+              （recursive 把句末标点分到下一块开头，比较前先越过结束处紧随的标点与空白）
+
+默认语料为合成的中英文混合文本，分四种形态：带空行的段落、PDF式短行、无换行的长段、无标点的连续中文；
+真实效果请用 --files 传入 txt/md 文件，按文件逐个切分。
+
+--check 时对每个分割器校验分块边界不变量，任一项不满足即以非零状态退出：
+    1. 每块长度不超过 chunk_size（按各自的长度单位）
+    2. 分块按原文顺序排列，且都是原文的连续片段
+    3. 原文中的每个非空白字符都落在某个分块中
+    4. 相邻分块的重叠部分不超过 chunk_overlap
+
+使用方式:
+    python -m backend.benchmarks.text_splitter_benchmark_lyl --chars 2000000 --check
+    python -m backend.benchmarks.text_splitter_benchmark_lyl --files data/documents/*.txt
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Set, Tuple
+
+from backend.app.services.document_parser import (
+    SPLITTER_RECURSIVE_LYL,
+    SPLITTER_SENTENCE_LYL,
+    create_text_splitter_lyl,
+)
+from backend.app.services.text_splitter import UNIT_CHARS_LYL, UNIT_TOKENS_LYL
+
+# 合成语料使用的常用汉字与英文词
+CJK_CHARS_LYL = (
+    "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定"
+    "行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些"
+    "然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公"
+)
+LATIN_WORDS_LYL = (
+    "the model returns a json response with version 3.14 of the api and python server data "
+    "index query vector embedding chunk course lecture chapter example figure table section"
+).split()
+SENTENCE_ENDINGS_LYL = ("。", "！", "？", ".", "!", "?", "…", "\n")
+BOUNDARY_CHARS_LYL = set("。！？.!?…，；、,;：:”’」』）)]\"' \t\r\n\u3000")
+
+
+def synthetic_sentence_lyl(rng: random.Random) -> str:
+    """生成一句中文或英文_lyl"""
+    if rng.random() < 0.6:
+        body = "".join(rng.choice(CJK_CHARS_LYL) for _ in range(rng.randint(8, 40)))
+        return body + rng.choice("。。。！？，；")
+    words = " ".join(rng.choice(LATIN_WORDS_LYL) for _ in range(rng.randint(5, 20)))
+    return words.capitalize() + rng.choice([". ", ". ", "! ", "? ", ", "])
+
+
+def synthetic_corpora_lyl(chars: int, seed: int = 0) -> Dict[str, str]:
+    """生成四种形态的合成语料，每种约chars个字符_lyl"""
+    rng = random.Random(seed)
+    paragraphs: List[str] = []
+    total = 0
+    while total < chars:
+        paragraph = "".join(synthetic_sentence_lyl(rng) for _ in range(rng.randint(1, 12)))
+        paragraphs.append(paragraph)
+        total += len(paragraph) + 2
+    text = "".join(paragraphs)
+    return {
+        "paragraphs": "\n\n".join(paragraphs),
+        "pdf_lines": "\n".join(text[i:i + 40] for i in range(0, len(text), 40)),
+        "long_block": text,
+        "no_punct_cjk": "".join(rng.choice(CJK_CHARS_LYL) for _ in range(chars)),
+    }
+
+
+def chunk_spans_lyl(text: str, chunks: List[str]) -> List[Tuple[int, int]]:
+    """把分块定位到原文中的 [start, end) 区间_lyl - 分块不是按序排列的原文片段时抛出ValueError
+
+    每块从上一块起点之后开始、在上一块终点之后结束，很短的分块（如单独的句号）不会被定位到重叠区里。
+    """
+    spans: List[Tuple[int, int]] = []
+    cursor = previous_end = 0
+    for chunk in chunks:
+        start = text.find(chunk, cursor)
+        while 0 <= start and start + len(chunk) <= previous_end:
+            start = text.find(chunk, start + 1)
+        if start < 0:
+            raise ValueError(f"分块不是原文的按序片段: {chunk[:30]!r}")
+        spans.append((start, start + len(chunk)))
+        cursor = start + 1
+        previous_end = start + len(chunk)
+    return spans
+
+
+def check_invariants_lyl(
+    text: str, chunks: List[str], length: Callable[[str], float], chunk_size: int, chunk_overlap: int
+) -> List[str]:
+    """校验分块边界不变量，返回违反项说明_lyl"""
+    problems: List[str] = []
+    oversized = sum(1 for chunk in chunks if length(chunk) > chunk_size)
+    if oversized:
+        problems.append(f"{oversized} 个分块超过 chunk_size")
+    try:
+        spans = chunk_spans_lyl(text, chunks)
+    except ValueError as e:
+        return problems + [str(e)]
+
+    covered = 0
+    missing = 0
+    excess_overlap = 0
+    previous_end = 0
+    for start, end in spans:
+        if start > covered:
+            missing += sum(1 for ch in text[covered:start] if not ch.isspace())
+        if start < previous_end and length(text[start:previous_end]) > chunk_overlap:
+            excess_overlap += 1
+        covered = max(covered, end)
+        previous_end = end
+    missing += sum(1 for ch in text[covered:] if not ch.isspace())
+    if missing:
+        problems.append(f"{missing} 个非空白字符不在任何分块中")
+    if excess_overlap:
+        problems.append(f"{excess_overlap} 处相邻分块重叠超过 chunk_overlap")
+    return problems
+
+
+def sentence_end_ratio_lyl(text: str, spans: List[Tuple[int, int]]) -> float:
+    """结束在句末标点或换行处的分块比例_lyl"""
+    ended = sum(
+        1 for _, end in spans
+        if end >= len(text) or text[end - 1] in SENTENCE_ENDINGS_LYL or text[end] == "\n"
+    )
+    return ended / max(1, len(spans))
+
+
+def boundaries_lyl(text: str, spans: List[Tuple[int, int]]) -> Set[int]:
+    """分块结束位置，越过紧随的标点与空白_lyl"""
+    ends = set()
+    for _, end in spans:
+        while end < len(text) and text[end] in BOUNDARY_CHARS_LYL:
+            end += 1
+        ends.add(end)
+    return ends
+
+
+def timed_split_lyl(splitter, text: str, repeat: int) -> Tuple[List[str], float]:
+    """切分文本并返回分块与最短耗时（秒）_lyl"""
+    best = float("inf")
+    chunks: List[str] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = splitter.split_text(text)
+        best = min(best, time.perf_counter() - start)
+    return chunks, best
+
+
+def main_lyl():
+    """运行基准并打印报告_lyl"""
+    parser = argparse.ArgumentParser(description="文本分割器吞吐与分块边界对照基准")
+    parser.add_argument("--chars", type=int, default=1000000, help="每种合成语料的字符数")
+    parser.add_argument("--files", type=str, nargs="+", default=None, help="使用真实的 txt/md 文件")
+    parser.add_argument("--chunk-size", type=int, default=500, help="按字符计的块大小")
+    parser.add_argument("--chunk-overlap", type=int, default=50, help="按字符计的重叠")
+    parser.add_argument("--token-chunk-size", type=int, default=300, help="按近似token计的块大小")
+    parser.add_argument("--token-chunk-overlap", type=int, default=30, help="按近似token计的重叠")
+    parser.add_argument("--repeat", type=int, default=3, help="每项测量的重复次数")
+    parser.add_argument("--check", action="store_true", help="校验分块边界不变量，失败时非零退出")
+    args = parser.parse_args()
+
+    if args.files:
+        corpora = {Path(path).name: Path(path).read_text(encoding="utf-8") for path in args.files}
+    else:
+        corpora = synthetic_corpora_lyl(args.chars)
+
+    sizes = {
+        UNIT_CHARS_LYL: (args.chunk_size, args.chunk_overlap),
+        UNIT_TOKENS_LYL: (args.token_chunk_size, args.token_chunk_overlap),
+    }
+    failures = 0
+    print(f"{'语料':<14}{'单位':<8}{'分割器':<11}{'吞吐(M字/s)':>12}{'块数':>8}"
+          f"{'填充率':>8}{'句末率':>8}{'边界一致':>9}{'加速':>8}")
+    for name, text in corpora.items():
+        for unit, (chunk_size, chunk_overlap) in sizes.items():
+            results = {}
+            for kind in (SPLITTER_RECURSIVE_LYL, SPLITTER_SENTENCE_LYL):
+                splitter = create_text_splitter_lyl({
+                    "kind": kind, "unit": unit,
+                    "chunk_size": chunk_size, "chunk_overlap": chunk_overlap,
+                })
+                chunks, seconds = timed_split_lyl(splitter, text, args.repeat)
+                results[kind] = (splitter, chunks, seconds)
+
+            baseline = boundaries_lyl(text, chunk_spans_lyl(text, results[SPLITTER_RECURSIVE_LYL][1]))
+            for kind, (splitter, chunks, seconds) in results.items():
+                length = splitter._length_function
+                spans = chunk_spans_lyl(text, chunks)
+                ends = boundaries_lyl(text, spans)
+                fill = sum(length(chunk) for chunk in chunks) / max(1, len(chunks)) / chunk_size
+                speedup = results[SPLITTER_RECURSIVE_LYL][2] / seconds
+                print(
+                    f"{name:<14}{unit:<8}{kind:<11}{len(text) / seconds / 1e6:>12.2f}{len(chunks):>8}"
+                    f"{fill:>8.0%}{sentence_end_ratio_lyl(text, spans):>8.0%}"
+                    f"{len(baseline & ends) / max(1, len(baseline)):>9.0%}{speedup:>7.1f}x"
+                )
+                if args.check:
+                    for problem in check_invariants_lyl(text, chunks, length, chunk_size, chunk_overlap):
+                        failures += 1
+                        print(f"  ✗ {name}/{unit}/{kind}: {problem}")
+
+    if args.check:
+        print("\n分块边界校验: " + ("全部通过" if not failures else f"{failures} 项失败"))
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_lyl()
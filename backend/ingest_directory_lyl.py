@@ -0,0 +1,110 @@
+"""
+离线批量入库脚本_lyl - 把本地目录树或zip压缩包中的全部文档导入知识库
+
+与 POST /knowledge/upload/archive 使用同一套批量入库流程：逐个保存并并行解析，
+分块合并批次嵌入，全部完成后一次写入索引；指定 --revise 时与已有文档同名的文件作为修订版
+进入入库任务队列，脚本等待这些任务完成后退出，最后打印每个文件的结果。
+未指定 --revise 时同名文件作为新文档入库，不会覆盖已有文档。
+
+脚本直接读写数据库与向量存储，运行前请先停止后端服务。
+
+使用方式:
+    python -m backend.ingest_directory_lyl data/course_materials
+    python -m backend.ingest_directory_lyl lectures.zip labs/ --quiet
+    python -m backend.ingest_directory_lyl data/course_materials --revise
+"""
+import argparse
+import asyncio
+import sys
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, List
+
+from backend.app.database.database import db_manager
+from backend.app.services.bulk_ingest_service import (
+    BATCH_SUCCEEDED_LYL,
+    FILE_FAILED_LYL,
+    bulk_ingest_service,
+)
+from backend.app.services.document_service import document_service
+from backend.app.services.embedding_service import embedding_service
+from backend.app.services.ingestion_service import ingestion_service
+from backend.app.services.vector_store_service import vector_store_service
+
+
+def print_batch_lyl(batch: Dict[str, Any], quiet: bool) -> None:
+    """打印批次汇总与各文件结果_lyl"""
+    print(f"\n{batch['source']}: {batch['state']}，共 {batch['total']} 个文件")
+    if batch["error"]:
+        print(f"  错误: {batch['error']}")
+    for result in batch["files"]:
+        if quiet and result["status"] != FILE_FAILED_LYL:
+            continue
+        detail = []
+        if result["document_id"] is not None:
+            detail.append(f"文档 {result['document_id']}")
+        if result["job_id"] is not None:
+            detail.append(f"任务 {result['job_id']}")
+        if result["chunk_count"] is not None:
+            detail.append(f"{result['chunk_count']} 个分块")
+        if result["error"]:
+            detail.append(result["error"])
+        print(f"  {result['status']:<10}{result['name']}  {'，'.join(detail)}")
+    print("  " + "  ".join(f"{key}: {value}" for key, value in batch["counts"].items()))
+
+
+async def run_ingest_lyl(sources: List[str], quiet: bool, revise: bool) -> bool:
+    """依次入库各来源，返回是否全部成功_lyl"""
+    await db_manager.init_tables_lyl()
+    vector_store_service.start_lyl()
+    await vector_store_service.wait_ready_lyl()
+    # 同时继续上次未完成的入库任务
+    ingestion_service.start_lyl()
+
+    ok = True
+    try:
+        batches = []
+        for source in sources:
+            path = Path(source)
+            if path.is_dir():
+                batch = await bulk_ingest_service.ingest_directory_lyl(str(path), revise)
+            elif path.is_file() and zipfile.is_zipfile(path):
+                batch = await bulk_ingest_service.ingest_archive_lyl(str(path), revise)
+            else:
+                print(f"跳过 {source}: 不是目录或zip压缩包", file=sys.stderr)
+                ok = False
+                continue
+            batches.append(batch)
+
+        # 修订版交给了入库任务队列，等其处理完再退出
+        await ingestion_service.join_lyl()
+        for batch in batches:
+            print_batch_lyl(batch, quiet)
+            ok = ok and batch["state"] == BATCH_SUCCEEDED_LYL and not batch["counts"][FILE_FAILED_LYL]
+        for batch in batches:
+            for result in batch["files"]:
+                if result["job_id"] is not None:
+                    job = await ingestion_service.get_job_lyl(result["job_id"])
+                    print(f"  任务 {job['id']} {job['filename']}: {job['status']} {job['error'] or ''}")
+    finally:
+        await bulk_ingest_service.close_lyl()
+        await ingestion_service.close_lyl()
+        document_service.close_lyl()
+        await vector_store_service.close_lyl()
+        embedding_service.close_lyl()
+        await db_manager.disconnect_lyl()
+    return ok
+
+
+def main_lyl():
+    """解析命令行参数并运行_lyl"""
+    parser = argparse.ArgumentParser(description="把目录树或zip压缩包中的文档批量导入知识库")
+    parser.add_argument("sources", nargs="+", help="目录或zip压缩包路径")
+    parser.add_argument("--quiet", action="store_true", help="只列出失败的文件")
+    parser.add_argument("--revise", action="store_true", help="与已有文档同名的文件作为其修订版增量更新")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run_ingest_lyl(args.sources, args.quiet, args.revise)) else 1)
+
+
+if __name__ == "__main__":
+    main_lyl()
@@ -6,7 +6,7 @@ import { Table, Button, Upload, Card, Statistic, Row, Col, message as antMessage
 import { UploadOutlined, DeleteOutlined, FileTextOutlined, DatabaseOutlined, ReloadOutlined } from '@ant-design/icons';
 import type { UploadProps } from 'antd';
 import type { Document_lyl, KnowledgeStats_lyl } from '../types/index_lyl';
-import { getDocuments_lyl, uploadDocument_lyl, deleteDocument_lyl, getKnowledgeStats_lyl } from '../services/api_lyl';
+import { getDocuments_lyl, uploadDocument_lyl, waitIngestJob_lyl, deleteDocument_lyl, getKnowledgeStats_lyl } from '../services/api_lyl';
 import './KnowledgePage_lyl.css';
 
 const KnowledgePage_lyl: React.FC = () => {
@@ -41,8 +41,22 @@ const KnowledgePage_lyl: React.FC = () => {
     beforeUpload: async (file) => {
       setUploading(true);
       try {
-        await uploadDocument_lyl(file);
-        antMessage.success(`${file.name} 上传成功`);
+        const result = await uploadDocument_lyl(file);
+        if (result.duplicate) {
+          antMessage.info(`${file.name} 与已有文档内容相同，未重复上传`);
+          return false;
+        }
+        const job_id = result.job_id;
+        const key = `ingest_${job_id}`;
+        const job = await waitIngestJob_lyl(job_id, (stage, progress) => {
+          antMessage.loading({ content: `${file.name} 处理中（${stage} ${progress}%）`, key, duration: 0 });
+        });
+        antMessage.destroy(key);
+        if (job.status === 'completed') {
+          antMessage.success(`${file.name} ${job.outcome === 'updated' ? '已更新' : '上传成功'}`);
+        } else {
+          antMessage.error(`${file.name} 处理失败: ${job.error || '未知错误'}`);
+        }
         loadData_lyl();
       } catch (error: any) {
         antMessage.error(error.response?.data?.detail || '上传失败');
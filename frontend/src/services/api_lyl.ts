@@ -117,16 +117,43 @@ export const getDocuments_lyl = async () => {
   return response.data;
 };
 
-/** 上传文档_lyl */
-export const uploadDocument_lyl = async (file: File) => {
+/** 上传文档_lyl - 立即返回入库任务ID（wait=false），进度见 waitIngestJob_lyl；
+ *  指定replaceDocumentId时作为该文档的修订版，否则作为新文档入库 */
+export const uploadDocument_lyl = async (file: File, replaceDocumentId?: number) => {
   const formData = new FormData();
   formData.append('file', file);
+  if (replaceDocumentId !== undefined) {
+    formData.append('replace_document_id', String(replaceDocumentId));
+  }
   const response = await api.post('/knowledge/upload', formData, {
+    params: { wait: false },
     headers: { 'Content-Type': 'multipart/form-data' },
   });
   return response.data;
 };
 
+/** 查询入库任务状态_lyl */
+export const getIngestJob_lyl = async (jobId: number) => {
+  const response = await api.get(`/knowledge/jobs/${jobId}`);
+  return response.data;
+};
+
+/** 等待入库任务完成_lyl - 轮询任务状态，onProgress接收阶段与进度百分比 */
+export const waitIngestJob_lyl = async (
+  jobId: number,
+  onProgress?: (stage: string, progress: number) => void,
+  intervalMs = 1000,
+) => {
+  while (true) {
+    const job = await getIngestJob_lyl(jobId);
+    onProgress?.(job.stage, job.progress);
+    if (job.status === 'completed' || job.status === 'failed') {
+      return job;
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+};
+
 /** 删除文档_lyl */
 export const deleteDocument_lyl = async (documentId: number) => {
   const response = await api.delete(`/knowledge/documents/${documentId}`);
@@ -1,4 +1,5 @@
 """启动器_lyl"""
+import multiprocessing
 import os
 import sys
 import webbrowser
@@ -21,6 +22,8 @@ def open_browser_lyl():
     webbrowser.open('http://localhost:8000')
 
 if __name__ == '__main__':
+    # 打包后文档解析进程池以spawn方式启动子进程，需要此调用
+    multiprocessing.freeze_support()
     os.makedirs('data/documents', exist_ok=True)
     os.makedirs('data/vector_store', exist_ok=True)
     print("=" * 50)
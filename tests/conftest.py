@@ -0,0 +1,58 @@
+"""
+测试公共夹具_lyl
+"""
+import asyncio
+from typing import Any, Awaitable, Callable
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from backend.app.core.config import settings
+from backend.app.database.database import db_manager
+from backend.app.services import ingestion_service as ingestion_module
+from backend.app.services import vector_store_service as vector_store_module
+from backend.app.services.document_service import document_service
+from backend.app.services.embedding_service import embedding_service
+
+DIM_LYL = 16
+
+
+class KnowledgeBase_lyl:
+    """隔离的知识库环境_lyl - 临时数据库、向量存储与文档目录"""
+
+    def __init__(self, store: vector_store_module.VectorStoreService_lyl):
+        """初始化环境_lyl"""
+        self.store = store
+
+    def run_lyl(self, body: Callable[[], Awaitable[Any]]) -> Any:
+        """建表并加载向量存储后在新事件循环中运行body，结束时关闭存储与数据库连接_lyl"""
+        async def main_lyl():
+            await db_manager.init_tables_lyl()
+            await self.store.initialize_lyl()
+            try:
+                return await body()
+            finally:
+                await self.store.close_lyl()
+                await db_manager.disconnect_lyl()
+
+        return asyncio.run(main_lyl())
+
+
+@pytest.fixture
+def knowledge_base_lyl(tmp_path, monkeypatch):
+    """使用确定性假嵌入的隔离知识库_lyl - 入库任务服务写入其中的向量存储"""
+    monkeypatch.setattr(db_manager, "db_path", tmp_path / "knowledge_qa.db")
+    monkeypatch.setattr(db_manager, "_connection", None)
+    monkeypatch.setattr(settings, "VECTOR_STORE_PATH", str(tmp_path / "vector_store"))
+    monkeypatch.setattr(settings, "VECTOR_STORE_WARMUP", False)
+    monkeypatch.setattr(settings, "VECTOR_REDUCTION", "none")
+    monkeypatch.setattr(settings, "EMBEDDING_CACHE_ENABLED", False)
+    monkeypatch.setattr(embedding_service, "_embeddings", DeterministicFakeEmbedding(size=DIM_LYL))
+    monkeypatch.setattr(embedding_service, "_cache", None)
+    documents_path = tmp_path / "documents"
+    documents_path.mkdir()
+    monkeypatch.setattr(document_service, "documents_path", documents_path)
+    store = vector_store_module.VectorStoreService_lyl()
+    monkeypatch.setattr(ingestion_module, "vector_store_service", store)
+    yield KnowledgeBase_lyl(store)
+    document_service.close_lyl()
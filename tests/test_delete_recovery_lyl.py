@@ -0,0 +1,178 @@
+"""
+文档删除中断恢复测试_lyl
+
+删除在登记墓碑之后、删除数据库记录之前被进程退出打断时，
+下次启动由入库任务恢复流程补完删除：文档与分块记录、文件都被删除，向量保持墓碑。
+入库任务写入文档期间删除该文档被拒绝；删除抢在任务之前时任务撤销写入而不留下孤立分块。
+"""
+import asyncio
+import io
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from backend.app.core.config import settings
+from backend.app.database.database import db_manager
+from backend.app.services import ingestion_service as ingestion_module
+from backend.app.services import vector_store_service as vector_store_module
+from backend.app.services.document_service import document_service
+from backend.app.services.embedding_service import embedding_service
+
+DIM_LYL = 16
+
+
+class ProcessExit_lyl(BaseException):
+    """模拟进程在删除中途退出_lyl"""
+
+
+def test_interrupted_delete_is_completed_on_recovery_lyl(tmp_path, monkeypatch):
+    """中断的删除在恢复时补完_lyl"""
+    embeddings = DeterministicFakeEmbedding(size=DIM_LYL)
+    monkeypatch.setattr(db_manager, "db_path", tmp_path / "knowledge_qa.db")
+    monkeypatch.setattr(db_manager, "_connection", None)
+    monkeypatch.setattr(settings, "VECTOR_STORE_PATH", str(tmp_path / "vector_store"))
+    monkeypatch.setattr(settings, "VECTOR_STORE_WARMUP", False)
+    monkeypatch.setattr(settings, "VECTOR_REDUCTION", "none")
+    monkeypatch.setattr(embedding_service, "_embeddings", embeddings)
+    store = vector_store_module.VectorStoreService_lyl()
+    monkeypatch.setattr(ingestion_module, "vector_store_service", store)
+
+    file_path = tmp_path / "20240101_000000_a.txt"
+    file_path.write_text("第一章 绪论\n第二章 方法", encoding="utf-8")
+    texts = ["第一章 绪论", "第二章 方法"]
+
+    async def run_lyl():
+        await db_manager.init_tables_lyl()
+        await store.initialize_lyl()
+        try:
+            doc_id = await document_service.add_document_record_lyl(
+                filename="a.txt", file_type=".txt", file_path=str(file_path),
+                file_size=file_path.stat().st_size, chunk_count=len(texts), content_hash="a",
+            )
+            chunk_ids = await store.append_embedded_lyl(
+                doc_id,
+                [Document(page_content=text, metadata={"chunk_index": i}) for i, text in enumerate(texts)],
+                embeddings.embed_documents(texts),
+            )
+            document = await document_service.get_document_by_id_lyl(doc_id)
+
+            async def exit_lyl(_doc_id):
+                raise ProcessExit_lyl()
+
+            service = ingestion_module.IngestionService_lyl()
+            with monkeypatch.context() as patch:
+                patch.setattr(document_service, "delete_document_record_lyl", exit_lyl)
+                with pytest.raises(ProcessExit_lyl):
+                    await service.delete_document_lyl(document)
+            # 墓碑已登记而记录仍在
+            assert set(chunk_ids) <= store._snapshot.tombstones
+            assert await document_service.count_chunks_lyl(doc_id) == len(texts)
+
+            # 下次启动：恢复并重新执行删除任务
+            service = ingestion_module.IngestionService_lyl()
+            job_ids = await service._recover_jobs_lyl()
+            assert len(job_ids) == 1
+            await service._run_job_lyl(job_ids[0])
+            job = await service.get_job_lyl(job_ids[0])
+            return doc_id, chunk_ids, job
+        finally:
+            await store.close_lyl()
+
+    async def check_lyl(doc_id):
+        try:
+            return (
+                await document_service.get_document_by_id_lyl(doc_id),
+                await document_service.count_chunks_lyl(doc_id),
+            )
+        finally:
+            await db_manager.disconnect_lyl()
+
+    doc_id, chunk_ids, job = asyncio.run(run_lyl())
+    document, chunk_count = asyncio.run(check_lyl(doc_id))
+
+    assert job["kind"] == ingestion_module.JOB_KIND_DELETE_LYL
+    assert job["status"] == ingestion_module.JOB_COMPLETED_LYL
+    assert document is None
+    assert chunk_count == 0
+    assert not file_path.exists()
+    assert set(chunk_ids) <= store._snapshot.tombstones
+
+
+def pause_after_first_batch_lyl(monkeypatch):
+    """入库流水线写入第一批分块后暂停，返回 (已暂停事件, 继续事件)_lyl"""
+    paused, resume = asyncio.Event(), asyncio.Event()
+    index_chunks_text = document_service.index_chunks_text_lyl
+
+    async def index_lyl(chunk_ids, chunks):
+        await index_chunks_text(chunk_ids, chunks)
+        paused.set()
+        await resume.wait()
+
+    monkeypatch.setattr(document_service, "index_chunks_text_lyl", index_lyl)
+    return paused, resume
+
+
+async def start_upload_lyl(service, name: str, text: str):
+    """保存文件并在后台执行其入库任务_lyl"""
+    file_path, size, content_hash = document_service.store_stream_lyl(
+        name, io.BytesIO(text.encode("utf-8"))
+    )
+    job_id = await service.enqueue_lyl(name, file_path, size, content_hash)
+    return job_id, asyncio.create_task(service._run_job_lyl(job_id))
+
+
+def test_delete_rejected_while_ingesting_lyl(knowledge_base_lyl, monkeypatch):
+    """入库任务写入期间删除该文档被拒绝，任务完成后可正常删除_lyl"""
+    service = ingestion_module.IngestionService_lyl()
+
+    async def body_lyl():
+        paused, resume = pause_after_first_batch_lyl(monkeypatch)
+        job_id, task = await start_upload_lyl(service, "a.txt", "第一章 绪论\n\n第二章 方法")
+        await paused.wait()
+        document = await document_service.get_document_by_id_lyl(
+            (await service.get_job_lyl(job_id))["document_id"]
+        )
+        with pytest.raises(ingestion_module.DocumentBusyError_lyl):
+            await service.delete_document_lyl(document)
+        resume.set()
+        await task
+        job = await service.get_job_lyl(job_id)
+        kept = await document_service.get_document_by_id_lyl(document["id"])
+
+        removed = await service.delete_document_lyl(document)
+        return job, kept, removed, await document_service.count_chunks_lyl(document["id"])
+
+    job, kept, removed, chunk_count = knowledge_base_lyl.run_lyl(body_lyl)
+    assert job["status"] == ingestion_module.JOB_COMPLETED_LYL
+    assert kept is not None and kept["chunk_count"] == job["chunk_count"] > 0
+    assert removed == job["chunk_count"]
+    assert chunk_count == 0
+    assert knowledge_base_lyl.store.get_document_count_lyl() == 0
+
+
+def test_ingest_rolls_back_when_document_deleted_lyl(knowledge_base_lyl, monkeypatch):
+    """文档在入库过程中被删除时，任务撤销已写入的分块与向量而不是完成_lyl"""
+    service = ingestion_module.IngestionService_lyl()
+
+    async def body_lyl():
+        paused, resume = pause_after_first_batch_lyl(monkeypatch)
+        job_id, task = await start_upload_lyl(service, "a.txt", "第一章 绪论\n\n第二章 方法")
+        await paused.wait()
+        job = await service.get_job_lyl(job_id)
+        document = await document_service.get_document_by_id_lyl(job["document_id"])
+        # 绕过文档锁，模拟删除抢在任务取得文档锁之前执行
+        await service._delete_document_lyl(document["id"], document["file_path"])
+        resume.set()
+        with pytest.raises(ValueError):
+            await task
+        orphans = await db_manager.fetch_all_lyl(
+            "SELECT id FROM chunks WHERE document_id = ?", (document["id"],)
+        )
+        return await service.get_job_lyl(job_id), orphans
+
+    job, orphans = knowledge_base_lyl.run_lyl(body_lyl)
+    assert job["document_id"] is None
+    assert job["outcome"] is None
+    assert orphans == []
+    assert knowledge_base_lyl.store.get_document_count_lyl() == 0
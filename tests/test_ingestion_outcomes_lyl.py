@@ -0,0 +1,113 @@
+"""
+入库任务结果测试_lyl
+
+内容相同的文件不重复入库（duplicate）；同名但未指定修订目标的文件作为新文档入库（created），
+不影响已有文档；指定 target_document_id 的文件作为修订版增量更新（updated）。
+"""
+import io
+from pathlib import Path
+
+import pytest
+
+from backend.app.services import ingestion_service as ingestion_module
+from backend.app.services.document_service import document_service
+
+
+def paragraphs_lyl(tag: str, count: int) -> str:
+    """生成互不相同的段落，每段约一个分块_lyl"""
+    return "\n\n".join(
+        " ".join(f"{tag}{i}w{j}" for j in range(70)) for i in range(count)
+    )
+
+
+def test_upload_outcomes_lyl(knowledge_base_lyl):
+    """新建、重复、同名新建与显式修订_lyl"""
+    service = ingestion_module.IngestionService_lyl()
+    original = paragraphs_lyl("a", 5)
+    revised = original.rsplit("\n\n", 1)[0] + "\n\n" + paragraphs_lyl("z", 1)
+
+    async def upload_lyl(name: str, text: str, target=None):
+        file_path, size, content_hash = document_service.store_stream_lyl(
+            name, io.BytesIO(text.encode("utf-8"))
+        )
+        job_id = await service.enqueue_lyl(
+            name, file_path, size, content_hash, target_document_id=target
+        )
+        await service._run_job_lyl(job_id)
+        return await service.get_job_lyl(job_id)
+
+    async def body_lyl():
+        results = {}
+        created = await upload_lyl("notes.txt", original)
+        doc_id = created["document_id"]
+        results["created"] = created
+        results["first_doc"] = dict(await document_service.get_document_by_id_lyl(doc_id))
+        results["duplicate"] = await upload_lyl("copy.txt", original)
+        results["same_name"] = await upload_lyl("notes.txt", paragraphs_lyl("b", 3))
+        results["first_after_same_name"] = await document_service.get_document_by_id_lyl(doc_id)
+        results["first_file_kept"] = Path(results["first_doc"]["file_path"]).exists()
+        results["updated"] = await upload_lyl("notes.txt", revised, target=doc_id)
+        results["revised_doc"] = await document_service.get_document_by_id_lyl(doc_id)
+        results["chunks"] = await document_service.count_chunks_lyl(doc_id)
+        results["vectors"] = knowledge_base_lyl.store.get_document_count_lyl()
+        with pytest.raises(ValueError):
+            await upload_lyl("other.txt", paragraphs_lyl("c", 1), target=9999)
+        return results
+
+    results = knowledge_base_lyl.run_lyl(body_lyl)
+    created, first_doc = results["created"], results["first_doc"]
+    doc_id = created["document_id"]
+
+    assert created["status"] == ingestion_module.JOB_COMPLETED_LYL
+    assert created["outcome"] == ingestion_module.OUTCOME_CREATED_LYL
+    assert created["chunk_count"] == 5
+
+    duplicate = results["duplicate"]
+    assert duplicate["outcome"] == ingestion_module.OUTCOME_DUPLICATE_LYL
+    assert duplicate["document_id"] == doc_id
+    assert not Path(duplicate["file_path"]).exists()
+
+    # 同名文件是另一个文档，原文档与其文件保持不变
+    same_name = results["same_name"]
+    assert same_name["outcome"] == ingestion_module.OUTCOME_CREATED_LYL
+    assert same_name["document_id"] != doc_id
+    assert results["first_after_same_name"] == first_doc
+    assert results["first_file_kept"]
+
+    # 显式修订只嵌入改动的分块，原文件被替换
+    updated, revised_doc = results["updated"], results["revised_doc"]
+    assert updated["outcome"] == ingestion_module.OUTCOME_UPDATED_LYL
+    assert updated["document_id"] == doc_id
+    assert updated["chunk_count"] == 5
+    assert updated["embedded_count"] == 1
+    assert revised_doc["file_path"] == updated["file_path"]
+    assert revised_doc["content_hash"] == updated["content_hash"]
+    assert not Path(first_doc["file_path"]).exists()
+    assert results["chunks"] == 5
+    # 两个文档的有效向量：修订后的5个与同名新文档的3个
+    assert results["vectors"] == 8
+
+
+def test_wait_job_returns_finished_job_lyl(knowledge_base_lyl):
+    """等待任务的调用方在工作协程处理完后拿到最终状态_lyl"""
+    service = ingestion_module.IngestionService_lyl()
+
+    async def body_lyl():
+        service.start_lyl()
+        try:
+            file_path, size, content_hash = document_service.store_stream_lyl(
+                "a.txt", io.BytesIO(paragraphs_lyl("a", 2).encode("utf-8"))
+            )
+            job_id = await service.enqueue_lyl("a.txt", file_path, size, content_hash)
+            job = await service.wait_job_lyl(job_id)
+            # 已结束的任务直接返回
+            again = await service.wait_job_lyl(job_id)
+            return job, again
+        finally:
+            await service.close_lyl()
+
+    job, again = knowledge_base_lyl.run_lyl(body_lyl)
+    assert job["status"] == ingestion_module.JOB_COMPLETED_LYL
+    assert job["outcome"] == ingestion_module.OUTCOME_CREATED_LYL
+    assert again == job
+    assert service._waiters == {}
@@ -0,0 +1,80 @@
+"""
+旧版 langchain FAISS 存储迁移测试_lyl
+
+用 FAISS.save_local 生成一个小的 index.faiss + index.pkl，启动向量存储后应迁移为分段存储：
+分块写入chunks表、向量ID与分块ID一致，已删除文档遗留的向量被丢弃，旧文件改名保留。
+"""
+import asyncio
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from backend.app.core.config import settings
+from backend.app.database.database import db_manager
+from backend.app.services import vector_store_service as vector_store_module
+from backend.app.services.document_service import document_service
+from backend.app.services.embedding_service import embedding_service
+
+DIM_LYL = 16
+
+
+def test_migrate_legacy_store_lyl(tmp_path, monkeypatch):
+    """旧版存储在启动时迁移为分段存储_lyl"""
+    store_path = tmp_path / "vector_store"
+    embeddings = DeterministicFakeEmbedding(size=DIM_LYL)
+    monkeypatch.setattr(db_manager, "db_path", tmp_path / "knowledge_qa.db")
+    monkeypatch.setattr(db_manager, "_connection", None)
+    monkeypatch.setattr(settings, "VECTOR_STORE_PATH", str(store_path))
+    monkeypatch.setattr(settings, "VECTOR_STORE_WARMUP", False)
+    monkeypatch.setattr(settings, "VECTOR_REDUCTION", "none")
+    monkeypatch.setattr(embedding_service, "_embeddings", embeddings)
+
+    # 两个仍存在的文档与一个已删除文档的分块
+    chunks = [
+        ("第一章 绪论", "20240101_000000_a.txt"),
+        ("第二章 方法", "20240101_000000_a.txt"),
+        ("实验报告", "20240101_000000_b.md"),
+        ("已删除文档的内容", "20240101_000000_gone.txt"),
+    ]
+    legacy = FAISS.from_texts(
+        [text for text, _ in chunks], embeddings,
+        metadatas=[{"source_file": source} for _, source in chunks],
+    )
+    legacy.save_local(str(store_path))
+
+    async def run_lyl():
+        await db_manager.init_tables_lyl()
+        doc_ids = {}
+        for name in ("20240101_000000_a.txt", "20240101_000000_b.md"):
+            doc_ids[name] = await document_service.add_document_record_lyl(
+                filename=name.split("_", 2)[2], file_type=name[name.rindex("."):],
+                file_path=f"data\\documents\\{name}", file_size=1, chunk_count=0,
+            )
+        store = vector_store_module.VectorStoreService_lyl()
+        try:
+            await store.initialize_lyl()
+            rows = await db_manager.fetch_all_lyl(
+                "SELECT id, document_id, content FROM chunks ORDER BY id"
+            )
+            return store, doc_ids, rows
+        finally:
+            await store.close_lyl()
+            await db_manager.disconnect_lyl()
+
+    store, doc_ids, rows = asyncio.run(run_lyl())
+
+    assert store.is_ready
+    assert store.get_document_count_lyl() == 3
+    assert sorted((row["content"], row["document_id"]) for row in rows) == sorted(
+        (text, doc_ids[source]) for text, source in chunks[:3]
+    )
+    # 每个分块的向量ID即其chunks表ID
+    index = store.segments[0].index
+    for row in rows:
+        query = np.asarray([embeddings.embed_query(row["content"])], dtype=np.float32)
+        _, labels = index.search(query, 1)
+        assert labels[0][0] == row["id"]
+    assert (store_path / "index.faiss.legacy").exists()
+    assert (store_path / "index.pkl.legacy").exists()
+    assert store.segment_store.exists_lyl()
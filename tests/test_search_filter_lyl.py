@@ -0,0 +1,59 @@
+"""
+检索过滤的上传时间条件测试_lyl
+
+documents.created_at 是UTC时间；不带时区的过滤时间按本机时区解释，
+RAG工具只给出日期的 created_before 包含当天。
+"""
+import sqlite3
+import time
+
+import pytest
+
+from backend.app.services.rag_tool import build_search_filter_lyl
+from backend.app.services.search_filter import filter_conditions_lyl
+
+# 按UTC写入的上传时间，本机时区为UTC+8
+UPLOADS_LYL = {
+    "前一天23点": "2026-10-16 15:00:00",
+    "当天1点": "2026-10-16 17:00:00",
+    "当天18点": "2026-10-17 10:00:00",
+    "当天23点59分": "2026-10-17 15:59:59",
+    "次日0点": "2026-10-17 16:00:00",
+}
+
+
+@pytest.fixture
+def utc8_lyl(monkeypatch):
+    """把本机时区设为UTC+8_lyl"""
+    monkeypatch.setenv("TZ", "CST-8")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def matching_uploads_lyl(search_filter) -> set:
+    """在只含上传时间的 documents 表上执行过滤条件，返回命中的文档_lyl"""
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE documents (id INTEGER PRIMARY KEY, name TEXT, created_at TIMESTAMP)")
+    conn.executemany("INSERT INTO documents (name, created_at) VALUES (?, ?)", UPLOADS_LYL.items())
+    where, params = filter_conditions_lyl(search_filter)
+    rows = conn.execute(f"SELECT d.name FROM documents d WHERE {where}", params).fetchall()
+    conn.close()
+    return {name for name, in rows}
+
+
+def test_date_only_bounds_cover_whole_local_day_lyl(utc8_lyl):
+    """只给日期时上下限都包含当天（本地时间）_lyl"""
+    search_filter = build_search_filter_lyl(created_after="2026-10-17", created_before="2026-10-17")
+    assert search_filter.created_before is None
+    assert matching_uploads_lyl(search_filter) == {"当天1点", "当天18点", "当天23点59分"}
+
+
+def test_datetime_bounds_are_local_and_inclusive_lyl(utc8_lyl):
+    """给出时间时按本地时间解释且包含该时刻；带时区的时间按其时区_lyl"""
+    search_filter = build_search_filter_lyl(created_before="2026-10-17T18:00:00")
+    assert matching_uploads_lyl(search_filter) == {"前一天23点", "当天1点", "当天18点"}
+
+    search_filter = build_search_filter_lyl(created_after="2026-10-17T10:00:00+00:00")
+    assert matching_uploads_lyl(search_filter) == {"当天18点", "当天23点59分", "次日0点"}
@@ -0,0 +1,104 @@
+"""
+句子感知分割器与 RecursiveCharacterTextSplitter 的对应关系测试_lyl
+
+由空行分隔、每段都短于 chunk_size 的文本，两者的分块完全相同；
+中文只在句末标点（。！？）后或块长达到预算处断开；分块长度与相邻分块的重叠不超过预算。
+"""
+import random
+
+import pytest
+
+from backend.app.services.document_parser import (
+    SPLITTER_RECURSIVE_LYL,
+    SPLITTER_SENTENCE_LYL,
+    create_text_splitter_lyl,
+)
+from backend.app.services.text_splitter import UNIT_CHARS_LYL, UNIT_TOKENS_LYL, estimate_tokens_lyl
+from backend.benchmarks.text_splitter_benchmark_lyl import (
+    CJK_CHARS_LYL,
+    LATIN_WORDS_LYL,
+    check_invariants_lyl,
+    synthetic_corpora_lyl,
+)
+
+LENGTHS_LYL = {UNIT_CHARS_LYL: len, UNIT_TOKENS_LYL: estimate_tokens_lyl}
+
+
+def splitter_lyl(kind: str, unit: str, chunk_size: int, chunk_overlap: int):
+    """按参数创建分割器_lyl"""
+    return create_text_splitter_lyl({
+        "kind": kind, "unit": unit, "chunk_size": chunk_size, "chunk_overlap": chunk_overlap,
+    })
+
+
+def cjk_sentence_lyl(rng: random.Random, endings: str = "。！？") -> str:
+    """生成一句带逗号的中文_lyl"""
+    clauses = [
+        "".join(rng.choice(CJK_CHARS_LYL) for _ in range(rng.randint(3, 15)))
+        for _ in range(rng.randint(1, 3))
+    ]
+    return "，".join(clauses) + rng.choice(endings)
+
+
+def latin_sentence_lyl(rng: random.Random) -> str:
+    """生成一句英文_lyl"""
+    words = " ".join(rng.choice(LATIN_WORDS_LYL) for _ in range(rng.randint(2, 12)))
+    return words.capitalize() + rng.choice(".!?")
+
+
+def paragraphs_lyl(rng: random.Random, unit: str, chunk_size: int) -> str:
+    """生成由空行分隔、每段（连同分隔符）都短于chunk_size的文本_lyl"""
+    length = LENGTHS_LYL[unit]
+    cjk = rng.random() < 0.3
+    paragraphs = []
+    for _ in range(rng.randint(1, 25)):
+        if cjk:
+            paragraph = "".join(cjk_sentence_lyl(rng) for _ in range(rng.randint(1, 4)))
+        else:
+            paragraph = " ".join(latin_sentence_lyl(rng) for _ in range(rng.randint(1, 4)))
+        if length("\n\n" + paragraph) < chunk_size:
+            paragraphs.append(paragraph)
+    return "\n\n".join(paragraphs) or "Empty."
+
+
+@pytest.mark.parametrize("unit", [UNIT_CHARS_LYL, UNIT_TOKENS_LYL])
+@pytest.mark.parametrize("chunk_size, chunk_overlap", [(60, 0), (100, 10), (200, 50), (500, 100), (500, 250)])
+def test_paragraph_text_matches_recursive_lyl(unit, chunk_size, chunk_overlap):
+    """段落都放得进一块时，分块与 RecursiveCharacterTextSplitter 完全相同_lyl"""
+    rng = random.Random(f"{unit}-{chunk_size}-{chunk_overlap}")
+    recursive = splitter_lyl(SPLITTER_RECURSIVE_LYL, unit, chunk_size, chunk_overlap)
+    sentence = splitter_lyl(SPLITTER_SENTENCE_LYL, unit, chunk_size, chunk_overlap)
+    for _ in range(100):
+        text = paragraphs_lyl(rng, unit, chunk_size)
+        assert sentence.split_text(text) == recursive.split_text(text)
+
+
+@pytest.mark.parametrize("chunk_overlap", [0, 30])
+def test_cjk_splits_at_sentence_end_or_size_limit_lyl(chunk_overlap):
+    """中文只在句末标点后或块长达到预算处断开，不在逗号处断开_lyl"""
+    rng = random.Random(chunk_overlap)
+    chunk_size = 120
+    text = "".join(cjk_sentence_lyl(rng) for _ in range(400))
+    # 一段超过预算、只有逗号没有句末标点的长句
+    text += "，".join("".join(rng.choice(CJK_CHARS_LYL) for _ in range(20)) for _ in range(20)) + "。"
+    chunks = splitter_lyl(SPLITTER_SENTENCE_LYL, UNIT_CHARS_LYL, chunk_size, chunk_overlap).split_text(text)
+
+    for chunk in chunks[:-1]:
+        assert chunk[-1] in "。！？" or len(chunk) == chunk_size
+    assert any(len(chunk) == chunk_size and chunk[-1] not in "。！？" for chunk in chunks)
+    assert chunks[-1].endswith("。")
+
+
+@pytest.mark.parametrize("unit, chunk_size, chunk_overlap", [
+    (UNIT_CHARS_LYL, 500, 50),
+    (UNIT_CHARS_LYL, 200, 100),
+    (UNIT_TOKENS_LYL, 300, 30),
+    (UNIT_TOKENS_LYL, 100, 40),
+])
+def test_budgets_and_overlap_respected_lyl(unit, chunk_size, chunk_overlap):
+    """分块不超过chunk_size、相邻重叠不超过chunk_overlap，且覆盖原文全部非空白字符_lyl"""
+    splitter = splitter_lyl(SPLITTER_SENTENCE_LYL, unit, chunk_size, chunk_overlap)
+    for name, text in synthetic_corpora_lyl(60000, seed=1).items():
+        chunks = splitter.split_text(text)
+        problems = check_invariants_lyl(text, chunks, LENGTHS_LYL[unit], chunk_size, chunk_overlap)
+        assert problems == [], name